@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+# Measure the encoded size and the encode/decode time per message of each codec, with and without compression.
+#
+#   $ python -m benchmarks.codec --messages 10000 --fields 50
+#
+import argparse
+import timeit
+
+from soocii_pubsub_lib import codec
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--fields', type=int, default=50, help='number of fields in the payload')
+    parser.add_argument('--compress-threshold', type=int, default=1024)
+    args = parser.parse_args()
+
+    payload = {'field{}'.format(i): 'value of field {}'.format(i) for i in range(args.fields)}
+
+    print('{:<10} {:<10} {:>10} {:>14} {:>14}'.format('codec', 'compress', 'bytes', 'encode us', 'decode us'))
+    for name in ('json', 'msgpack'):
+        for compress_threshold in (None, args.compress_threshold):
+            try:
+                encoder = codec.PayloadEncoder(name, compress_threshold=compress_threshold)
+            except ImportError as e:
+                print('{:<10} skipped: {}'.format(name, e))
+                break
+            data, attributes = encoder.encode(payload, {})
+            encode = timeit.timeit(lambda: encoder.encode(payload, {}), number=args.messages)
+            decode = timeit.timeit(lambda: codec.decode(data, attributes), number=args.messages)
+            print('{:<10} {:<10} {:>10} {:>14.2f} {:>14.2f}'.format(
+                name, str(compress_threshold), len(data), encode / args.messages * 1e6, decode / args.messages * 1e6))
+
+
+if __name__ == '__main__':
+    main()
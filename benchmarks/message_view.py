@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+# Measure the allocation and the time per message of handing a received message over to the callback,
+# i.e. the copied dictionary of to_dict() against the Message view, for a callback which only reads the payload
+# and one which also reads an attribute. The allocation is the bytes and blocks still allocated per message
+# after the conversion, by the difference of two tracemalloc snapshots with the converted messages retained.
+#
+#   $ python -m benchmarks.message_view --messages 100000 --attributes 5
+#
+import argparse
+import timeit
+import tracemalloc
+
+from google.cloud import pubsub_v1
+from soocii_pubsub_lib.message import Message, to_dict
+
+
+def read_data(message):
+    # a callback which only reads the payload
+    return message['data']
+
+
+def read_attribute(message):
+    # a typical callback, which reads the payload and an attribute
+    return message['data'] and message['attributes'].get('event')
+
+
+def elapsed(convert, callback, messages):
+    # timed without tracemalloc, which slows down every allocation
+    start = timeit.default_timer()
+    for message in messages:
+        callback(convert(message))
+    return timeit.default_timer() - start
+
+
+def allocated(convert, callback, messages):
+    # the converted messages are retained, so that their allocation is still traced at the second snapshot
+    retained = [None] * len(messages)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for i, message in enumerate(messages):
+        item = convert(message)
+        callback(item)
+        retained[i] = item
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    return sum(stat.size_diff for stat in stats), sum(stat.count_diff for stat in stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--attributes', type=int, default=5)
+    parser.add_argument('--size', type=int, default=1024, help='payload size in bytes')
+    args = parser.parse_args()
+
+    attributes = {'attr{}'.format(i): 'value{}'.format(i) for i in range(args.attributes)}
+    attributes['event'] = 'created'
+    messages = [pubsub_v1.types.PubsubMessage(data=b'x' * args.size, message_id=str(i), attributes=attributes)
+                for i in range(args.messages)]
+
+    print('{:<10} {:<16} {:>12} {:>16} {:>16}'.format('mode', 'callback', 'us/message', 'bytes/message', 'blocks/message'))
+    for callback in (read_data, read_attribute):
+        for name, convert in (('to_dict', to_dict), ('Message', Message)):
+            seconds = elapsed(convert, callback, messages)
+            size, blocks = allocated(convert, callback, messages)
+            print('{:<10} {:<16} {:>12.2f} {:>16.1f} {:>16.2f}'.format(
+                name, callback.__name__, seconds / args.messages * 1e6, float(size) / args.messages, float(blocks) / args.messages))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+# Micro-benchmark of the per-call cost of PublisherClient.publish() against TopicPublisher.publish().
+#
+# The messages are published asynchronously, so the measured time is spent in the wrapper and in handing
+# the message over to the batching client, not in the round trip to the broker.
+#
+#   $ export PUBSUB_EMULATOR_HOST=127.0.0.1:8538
+#   $ python -m benchmarks.publish_overhead --messages 100000
+#
+import os
+import logging
+import argparse
+import timeit
+
+from soocii_pubsub_lib import pubsub_client
+
+logger = logging.getLogger(__name__)
+
+
+def noop(message_id):
+    pass
+
+
+def bench_publish(publisher, topic, payload, messages):
+    start = timeit.default_timer()
+    for _ in range(messages):
+        publisher.publish(topic, payload, callback=noop, event='bench')
+    elapsed = timeit.default_timer() - start
+    publisher.flush()
+    return elapsed
+
+
+def bench_topic_publish(publisher, topic, payload, messages):
+    handle = publisher.topic(topic)
+    start = timeit.default_timer()
+    for _ in range(messages):
+        handle.publish(payload, event='bench')
+    elapsed = timeit.default_timer() - start
+    publisher.flush()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--project', default=os.getenv('PUBSUB_PROJECT_ID', 'fake-project'))
+    parser.add_argument('--topic', default='bench-topic')
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--size', type=int, default=64, help='payload size in bytes')
+    args = parser.parse_args()
+
+    os.environ.setdefault('PUBSUB_EMULATOR_HOST', '127.0.0.1:8538')
+    publisher = pubsub_client.PublisherClient(args.project, None, max_messages=1000)
+    publisher.create_topic(args.topic)
+    payload = b'x' * args.size
+
+    for name, bench in (('PublisherClient.publish', bench_publish), ('TopicPublisher.publish', bench_topic_publish)):
+        elapsed = bench(publisher, args.topic, payload, args.messages)
+        print('{:<24} {:>10.2f} us/call {:>12.0f} calls/s'.format(name, elapsed / args.messages * 1e6, args.messages / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+# Startup time benchmark of short-lived processes, e.g. CLI tools and autoscaled workers.
+#
+# Each run is a fresh interpreter, which reports the time to import soocii_pubsub_lib.pubsub_client,
+# to construct a PublisherClient, and from construction to the first published message,
+# which includes parsing the credential file and creating the gRPC channel.
+# second_publish_ms is the same for a second PublisherClient in the same process, whose credentials are cached.
+# The median and the worst of the runs are reported as JSON.
+#
+# It runs against the emulator by default, since the in-memory broker creates no channel,
+# so --transport memory only measures the import and the credential parsing.
+#
+#   $ PUBSUB_EMULATOR_HOST=127.0.0.1:8538 python -m benchmarks.startup --cred-json service-account.json --runs 20
+#   $ python -m benchmarks.startup --transport memory --cred-json service-account.json
+#
+import os
+import sys
+import json
+import logging
+import argparse
+import platform
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+# run in a fresh interpreter, and print the timings in milliseconds as JSON
+PROBE = '''
+import json, sys, timeit
+start = timeit.default_timer()
+from soocii_pubsub_lib import pubsub_client
+imported = timeit.default_timer()
+transport = None
+cred_json = sys.argv[4] or None
+if sys.argv[1] == 'memory':
+    from soocii_pubsub_lib import memory
+    transport = memory.Broker()
+    pubsub_client.PublisherClient(sys.argv[2], None, transport=transport).create_topic(sys.argv[3])
+constructing = timeit.default_timer()
+publisher = pubsub_client.PublisherClient(sys.argv[2], cred_json, transport=transport)
+constructed = timeit.default_timer()
+publisher.publish(sys.argv[3], b'startup')
+published = timeit.default_timer()
+pubsub_client.PublisherClient(sys.argv[2], cred_json, transport=transport).publish(sys.argv[3], b'startup')
+republished = timeit.default_timer()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'construct_ms': (constructed - constructing) * 1000,
+    'first_publish_ms': (published - constructing) * 1000,
+    'second_publish_ms': (republished - published) * 1000,
+}))
+'''
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--transport', choices=('memory', 'emulator'), default='emulator')
+    parser.add_argument('--cred-json', default=os.getenv('GOOGLE_APPLICATION_CREDENTIALS'),
+                        help='the service account file to parse, GOOGLE_APPLICATION_CREDENTIALS by default')
+    parser.add_argument('--project', default=os.getenv('PUBSUB_PROJECT_ID', 'fake-project'))
+    parser.add_argument('--topic', default='bench-startup')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    if not args.cred_json:
+        logger.warning('no credential file is given, credential parsing is not measured.')
+    if args.transport == 'emulator':
+        os.environ.setdefault('PUBSUB_EMULATOR_HOST', '127.0.0.1:8538')
+        from soocii_pubsub_lib import pubsub_client
+        pubsub_client.PublisherClient(args.project, None).create_topic(args.topic)
+
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.check_output([sys.executable, '-c', PROBE, args.transport, args.project, args.topic, args.cred_json or ''])
+        runs.append(json.loads(output.decode('utf-8').strip().splitlines()[-1]))
+        logger.info(runs[-1])
+
+    report = {
+        'transport': args.transport,
+        'cred_json': bool(args.cred_json),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'runs': args.runs,
+        'results': {name: {'median': median([run[name] for run in runs]), 'max': max(run[name] for run in runs)}
+                    for name in ('import_ms', 'construct_ms', 'first_publish_ms', 'second_publish_ms')},
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
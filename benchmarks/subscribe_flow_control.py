@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+# Measure subscriber throughput at different flow control and executor settings.
+#
+# A backlog of messages is published first, then it is drained once per setting with a callback which
+# simulates the given amount of work, and the throughput in messages per second is reported.
+#
+#   $ export PUBSUB_EMULATOR_HOST=127.0.0.1:8538
+#   $ python -m benchmarks.subscribe_flow_control --messages 10000 --work 0.005
+#
+import os
+import time
+import logging
+import argparse
+import threading
+import timeit
+import concurrent.futures
+
+from soocii_pubsub_lib import pubsub_client
+
+logger = logging.getLogger(__name__)
+
+
+def drain(subscriber, messages, work, max_messages, max_workers):
+    received = [0]
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def callback(message):
+        if work > 0:
+            time.sleep(work)
+        with lock:
+            received[0] += 1
+            if received[0] >= messages:
+                done.set()
+        return True
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    start = timeit.default_timer()
+    subscriber.open(callback, max_messages=max_messages, executor=executor)
+    done.wait()
+    elapsed = timeit.default_timer() - start
+    subscriber.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--project', default=os.getenv('PUBSUB_PROJECT_ID', 'fake-project'))
+    parser.add_argument('--topic', default='bench-topic')
+    parser.add_argument('--subscription', default='bench-subscription')
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--work', type=float, default=0.005, help='seconds of simulated I/O per message')
+    parser.add_argument('--max-messages', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--max-workers', type=int, nargs='+', default=[10, 50, 200])
+    args = parser.parse_args()
+
+    os.environ.setdefault('PUBSUB_EMULATOR_HOST', '127.0.0.1:8538')
+    publisher = pubsub_client.PublisherClient(args.project, None, max_messages=1000)
+    publisher.create_topic(args.topic)
+    subscriber = pubsub_client.SubscribeClient(args.project, None)
+    subscriber.create_subscription(args.topic, args.subscription)
+
+    print('{:>12} {:>12} {:>12}'.format('max_messages', 'max_workers', 'msgs/s'))
+    for max_messages in args.max_messages:
+        for max_workers in args.max_workers:
+            publisher.publish_many(args.topic, [b'x' * 64] * args.messages)
+            publisher.flush()
+            elapsed = drain(subscriber, args.messages, args.work, max_messages, max_workers)
+            print('{:>12} {:>12} {:>12.0f}'.format(max_messages, max_workers, args.messages / elapsed))
+
+
+if __name__ == '__main__':
+    main()
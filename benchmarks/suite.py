@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+# Throughput and latency benchmark suite of the publish and subscribe paths.
+#
+# Each scenario is run for every combination of message size, concurrency and attribute count,
+# and reports msgs/s, p50/p99 latency, CPU utilization and peak RSS as JSON.
+# The results can be compared against a saved baseline to catch regressions, in which case the exit code is 1.
+#
+#   $ python -m benchmarks.suite --output baseline.json
+#   $ python -m benchmarks.suite --baseline baseline.json --threshold 0.2
+#
+# It runs against the in-memory broker by default, use --transport emulator with PUBSUB_EMULATOR_HOST set for the emulator.
+#
+import os
+import sys
+import json
+import time
+import timeit
+import logging
+import argparse
+import resource
+import platform
+import threading
+import itertools
+import concurrent.futures
+
+from soocii_pubsub_lib import memory, pubsub_client, sub_service
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+class Environment():
+    def __init__(self, transport, project):
+        self.transport = memory.Broker() if transport == 'memory' else None
+        self.project = project
+        self.names = itertools.count(1)
+
+    def publisher(self, **kwargs):
+        return pubsub_client.PublisherClient(self.project, None, transport=self.transport, **kwargs)
+
+    def topic(self, publisher):
+        topic = 'bench-topic-{}-{}'.format(os.getpid(), next(self.names))
+        publisher.create_topic(topic)
+        return topic
+
+    def subscriber(self, topic):
+        subscriber = pubsub_client.SubscribeClient(self.project, None, transport=self.transport)
+        subscriber.create_subscription(topic, '{}-sub'.format(topic))
+        return subscriber
+
+
+def run_threads(concurrency, messages, work):
+    # split the messages among the threads, and collect their latencies
+    per_thread = messages // concurrency
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(work, per_thread) for _ in range(concurrency)]
+        return [latency for future in futures for latency in future.result()], per_thread * concurrency
+
+
+def publish_sync(env, messages, payload, attributes, concurrency):
+    publisher = env.publisher()
+    topic = env.topic(publisher)
+
+    def work(count):
+        latencies = []
+        for _ in range(count):
+            start = timeit.default_timer()
+            publisher.publish(topic, payload, **attributes)
+            latencies.append(timeit.default_timer() - start)
+        return latencies
+    return run_threads(concurrency, messages, work)
+
+
+def publish_callback(env, messages, payload, attributes, concurrency):
+    publisher = env.publisher()
+    topic = env.topic(publisher)
+    latencies = []
+    lock = threading.Lock()
+
+    def on_published(start, message_id):
+        with lock:
+            latencies.append(timeit.default_timer() - start)
+
+    def work(count):
+        for _ in range(count):
+            start = timeit.default_timer()
+            publisher.publish(topic, payload, callback=lambda message_id, start=start: on_published(start, message_id), **attributes)
+        return []
+    _, published = run_threads(concurrency, messages, work)
+    publisher.flush()
+    return latencies, published
+
+
+def publish_batched(env, messages, payload, attributes, concurrency):
+    publisher = env.publisher(max_messages=1000)
+    topic = env.topic(publisher)
+
+    def work(count):
+        latencies = []
+        for offset in range(0, count, 1000):
+            start = timeit.default_timer()
+            publisher.publish_many(topic, [payload] * min(1000, count - offset), attributes=attributes)
+            latencies.append(timeit.default_timer() - start)
+        return latencies
+    latencies, published = run_threads(concurrency, messages, work)
+    publisher.flush()
+    return latencies, published
+
+
+def subscribe(env, messages, payload, attributes, concurrency, service=False):
+    publisher = env.publisher(max_messages=1000)
+    topic = env.topic(publisher)
+    subscriber = env.subscriber(topic)
+    latencies = []
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def callback(message):
+        latency = time.time() - float(message['attributes']['bench_ts'])
+        with lock:
+            latencies.append(latency)
+            if len(latencies) >= messages:
+                done.set()
+        return True
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+    if service:
+        runner = sub_service.SubscriptionService(subscriber)
+        thread = threading.Thread(target=lambda: runner.run(callback, executor=executor, max_messages=1000))
+        thread.start()
+    else:
+        subscriber.open(callback, executor=executor, max_messages=1000)
+    for _ in range(messages):
+        publisher.topic(topic).publish(payload, bench_ts=repr(time.time()), **attributes)
+    publisher.flush()
+    done.wait(60)
+    if service:
+        runner.shutdown()
+        thread.join()
+    else:
+        subscriber.close()
+    return latencies, len(latencies)
+
+
+SCENARIOS = {
+    'publish_sync': publish_sync,
+    'publish_callback': publish_callback,
+    'publish_batched': publish_batched,
+    'subscribe': subscribe,
+    'subscription_service': lambda *args: subscribe(*args, service=True),
+}
+
+
+def measure(scenario, env, messages, size, concurrency, attribute_count):
+    payload = b'x' * size
+    attributes = {'attr{}'.format(i): 'value{}'.format(i) for i in range(attribute_count)}
+    wall = timeit.default_timer()
+    cpu = time.process_time()
+    latencies, count = SCENARIOS[scenario](env, messages, payload, attributes, concurrency)
+    wall = timeit.default_timer() - wall
+    cpu = time.process_time() - cpu
+    return {
+        'scenario': scenario,
+        'size': size,
+        'concurrency': concurrency,
+        'attributes': attribute_count,
+        'messages': count,
+        'msgs_per_sec': count / wall,
+        'p50_ms': None if not latencies else percentile(latencies, 0.5) * 1e3,
+        'p99_ms': None if not latencies else percentile(latencies, 0.99) * 1e3,
+        'cpu_percent': cpu / wall * 100,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def key_of(result):
+    return (result['scenario'], result['size'], result['concurrency'], result['attributes'])
+
+
+def compare(results, baseline, threshold):
+    """Compare the results against the baseline.
+
+    Returns:
+        list -- The regressions, where throughput drops or p99 latency grows by more than threshold.
+    """
+    previous = {key_of(result): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        base = previous.get(key_of(result))
+        if base is None:
+            continue
+        if result['msgs_per_sec'] < base['msgs_per_sec'] * (1 - threshold):
+            regressions.append({'key': key_of(result), 'metric': 'msgs_per_sec', 'baseline': base['msgs_per_sec'], 'current': result['msgs_per_sec']})
+        if base['p99_ms'] and result['p99_ms'] and result['p99_ms'] > base['p99_ms'] * (1 + threshold):
+            regressions.append({'key': key_of(result), 'metric': 'p99_ms', 'baseline': base['p99_ms'], 'current': result['p99_ms']})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--transport', choices=('memory', 'emulator'), default='memory')
+    parser.add_argument('--project', default=os.getenv('PUBSUB_PROJECT_ID', 'fake-project'))
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=sorted(SCENARIOS))
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[64, 4096])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--attributes', type=int, nargs='+', default=[0, 8])
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare the results against this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative change regarded as regression')
+    args = parser.parse_args()
+
+    env = Environment(args.transport, args.project)
+    results = []
+    for scenario in args.scenarios:
+        for size, concurrency, attribute_count in itertools.product(args.sizes, args.concurrency, args.attributes):
+            result = measure(scenario, env, args.messages, size, concurrency, attribute_count)
+            logger.info(result)
+            results.append(result)
+
+    report = {
+        'transport': args.transport,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['regressions'] = compare(results, json.load(f), args.threshold)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    print(text)
+    return 1 if report.get('regressions') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
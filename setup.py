@@ -10,7 +10,7 @@ setup(
     author='Soocii',
     author_email='service@soocii.me',
     description='Library for Soocii back-end services to integrate with Google Cloud Pub/Sub service.',
-    packages=find_packages(exclude=['tests', 'samples']),
+    packages=find_packages(exclude=['tests', 'samples', 'benchmarks', 'benchmarks.*']),
     long_description=open('README.md').read(),
     zip_safe=False,
 
@@ -47,5 +47,6 @@ setup(
     # projects.
     extras_require={  # Optional
         'dev': ['docker', 'pytest', 'pycodestyle', 'pytest-cov', 'coveralls'],
+        'msgpack': ['msgpack'],
     },
 )
@@ -0,0 +1,222 @@
+# coding=utf-8
+#
+import logging
+import asyncio
+import threading
+import collections
+import concurrent.futures
+
+from soocii_pubsub_lib import flow, pubsub_client
+
+logger = logging.getLogger(__name__)
+
+
+class FutureBridge():
+    def __init__(self, loop):
+        """Resolve asyncio futures on the given event loop from futures completed in other threads.
+
+        Completed futures are queued and settled in a single loop callback, so that a burst of completions
+        wakes up the event loop once instead of once per message.
+
+        Arguments:
+            loop {asyncio.AbstractEventLoop} -- The event loop which owns the asyncio futures.
+        """
+        self.loop = loop
+        self.__settled = collections.deque()
+        self.__lock = threading.Lock()
+        self.__scheduled = False
+
+    def wrap(self, source):
+        """Wrap a concurrent future into an asyncio future.
+
+        Arguments:
+            source {concurrent.futures.Future} -- A future completed in another thread.
+
+        Returns:
+            asyncio.Future -- A future which is resolved with the result of the source future.
+        """
+        target = self.loop.create_future()
+        source.add_done_callback(lambda source: self.__on_done(source, target))
+        return target
+
+    def __on_done(self, source, target):
+        with self.__lock:
+            self.__settled.append((source, target))
+            if self.__scheduled:
+                return
+            self.__scheduled = True
+        try:
+            self.loop.call_soon_threadsafe(self.__settle)
+        except RuntimeError as e:
+            logger.warning('event loop is closed, drop publish result: {}'.format(e))
+
+    def __settle(self):
+        with self.__lock:
+            settled, self.__settled = self.__settled, collections.deque()
+            self.__scheduled = False
+        for source, target in settled:
+            if target.done():
+                continue
+            if source.cancelled():
+                target.cancel()
+                continue
+            error = source.exception()
+            if error is not None:
+                target.set_exception(error)
+            else:
+                target.set_result(source.result())
+
+
+class EventLoopThread():
+    def __init__(self, name='pubsub-event-loop'):
+        """A dedicated event loop running forever in a daemon thread, which runs coroutines submitted from other threads.
+
+        Keyword Arguments:
+            name {str} -- The name of the thread (default: {'pubsub-event-loop'})
+        """
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.__run, name=name)
+        self.thread.daemon = True
+
+    def __run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def submit(self, coro):
+        """Schedule the coroutine on the event loop.
+
+        Arguments:
+            coro {coroutine} -- The coroutine to run.
+
+        Returns:
+            concurrent.futures.Future -- A future which is resolved with the result of the coroutine.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self, timeout=None):
+        """Stop the event loop, the pending coroutines are abandoned.
+
+        Keyword Arguments:
+            timeout {float} -- The maximum number of seconds to wait for the thread (default: {None})
+        """
+        if self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+        if not self.thread.is_alive():
+            self.loop.close()
+
+
+class AsyncPublisherClient(pubsub_client.PublisherClient):
+    def __init__(self, project, cred_json, loop=None, **kwargs):
+        """A publisher client for asyncio applications.
+
+        publish() returns an awaitable which is resolved on the event loop once the message is published,
+        the event loop is never blocked on the publish result.
+        The client may be constructed before the event loop, e.g. at module level, and be used on more than one event loop.
+        In block overflow policy, the messages beyond the outstanding limits wait for room in a helper thread, in order,
+        instead of blocking the event loop.
+
+        Arguments:
+            project {str} -- Project id
+            cred_json {str} -- Full path to credential file in json format
+
+        Keyword Arguments:
+            loop {asyncio.AbstractEventLoop} -- The event loop to resolve the awaitables on (default: {None} for the running event loop of each publish)
+            kwargs -- Batch and codec settings, see PublisherClient
+        """
+        super(AsyncPublisherClient, self).__init__(project, cred_json, **kwargs)
+        self.loop = loop
+        # a bridge per event loop, dropped as its event loop is closed
+        self.__bridges = {}
+        self.__lock = threading.Lock()
+        # the messages waiting for room in block policy, and the thread to wait in
+        self.__waiting = 0
+        self.__admitter = None
+
+    def bridge(self):
+        """Get the bridge of the event loop to resolve the awaitables on.
+
+        Raises:
+            RuntimeError -- If the client has no loop and there is no running event loop.
+
+        Returns:
+            FutureBridge -- The bridge of the given loop, or the running event loop.
+        """
+        loop = self.loop
+        if loop is None:
+            # get_event_loop() returns the running event loop in a coroutine before python 3.7
+            loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)()
+        with self.__lock:
+            bridge = self.__bridges.get(loop)
+            if bridge is None:
+                for closed in [closed for closed in self.__bridges if closed.is_closed()]:
+                    del self.__bridges[closed]
+                bridge = self.__bridges[loop] = FutureBridge(loop)
+            return bridge
+
+    def publish(self, topic, payload, **kwargs):
+        """Publish a message to the topic, and return an awaitable of its message id.
+        It has to be called in a coroutine unless the client is given a loop, in which case it may be called from any thread.
+
+        Arguments:
+            topic {str} -- The topic name to publish messages to.
+            payload -- A bytestring representing the message body, or any object supported by the codec.
+
+        Keyword Arguments:
+            kwargs -- If you want to include attributes, simply add keyword arguments
+
+        Raises:
+            ValueError -- If payload is not a bytestring without codec.
+            RuntimeError -- If the client has no loop and there is no running event loop.
+
+        Returns:
+            asyncio.Future -- A future which is resolved with the message id.
+        """
+        bridge = self.bridge()
+        payload, kwargs = self._encode(payload, kwargs)
+        topic = self.topic_path(topic)
+        if self.flow_control is None or self.flow_control.policy != flow.BLOCK:
+            return bridge.wrap(self._send(topic, payload, kwargs))
+        with self.__lock:
+            if self.__waiting == 0:
+                try:
+                    return bridge.wrap(self._send(topic, payload, kwargs, block=False))
+                except flow.FlowControlLimitError:
+                    pass
+            # queue behind the waiting messages to keep the publish order
+            self.__waiting += 1
+            if self.__admitter is None:
+                self.__admitter = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            admitter = self.__admitter
+        coro = self.__send_later(bridge, admitter, topic, payload, kwargs)
+        # get_running_loop() raises without a running event loop, _get_running_loop() returns None
+        if getattr(asyncio, '_get_running_loop', lambda: None)() is bridge.loop:
+            return bridge.loop.create_task(coro)
+        # create_task() is not thread-safe, e.g. publish() from another thread on a client given a loop
+        return bridge.wrap(asyncio.run_coroutine_threadsafe(coro, bridge.loop))
+
+    async def __send_later(self, bridge, admitter, topic, payload, kwargs):
+        # wait for room in the admitter thread, the event loop keeps running meanwhile
+        try:
+            future = await bridge.loop.run_in_executor(admitter, self._send, topic, payload, kwargs)
+        finally:
+            with self.__lock:
+                self.__waiting -= 1
+        return await bridge.wrap(future)
+
+    def close(self, timeout=None):
+        """Stop the helper thread of block policy, and the spool replayer if any, see PublisherClient.close().
+
+        Keyword Arguments:
+            timeout {float} -- The maximum number of seconds to wait for the replayer to stop (default: {None} for forever)
+        """
+        with self.__lock:
+            admitter, self.__admitter = self.__admitter, None
+        if admitter is not None:
+            admitter.shutdown(wait=False)
+        super(AsyncPublisherClient, self).close(timeout)
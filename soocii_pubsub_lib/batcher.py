@@ -0,0 +1,96 @@
+# coding=utf-8
+#
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class MessageBatcher():
+    def __init__(self, handler, max_messages=100, max_bytes=None, max_latency=1.0):
+        """Buffer received messages, and hand them over to the handler in batches.
+
+        A batch is flushed as soon as it reaches max_messages or max_bytes, or its first message has waited for max_latency seconds.
+        The full batches are handled in the thread which adds the last message, the expired batches in a timer thread.
+
+        Arguments:
+            handler {function} -- The function to handle a batch, which receives the list of buffered items as its only argument.
+
+        Keyword Arguments:
+            max_messages {int} -- The maximum number of messages in a batch (default: {100})
+            max_bytes {int} -- The maximum total size of a batch, in bytes, no limit if None (default: {None})
+            max_latency {float} -- The maximum number of seconds to wait for more messages (default: {1.0})
+        """
+        self.handler = handler
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency
+        self.__items = []
+        self.__bytes = 0
+        self.__deadline = None
+        self.__cond = threading.Condition()
+        self.__stopped = False
+        self.__timer = threading.Thread(target=self.__run, name='pubsub-batcher')
+        self.__timer.daemon = True
+        self.__timer.start()
+
+    def add(self, item, size=0):
+        """Add an item to the current batch.
+
+        Arguments:
+            item -- The item to buffer.
+
+        Keyword Arguments:
+            size {int} -- The size of the item in bytes (default: {0})
+        """
+        with self.__cond:
+            if not self.__items:
+                self.__deadline = time.time() + self.max_latency
+                self.__cond.notify()
+            self.__items.append(item)
+            self.__bytes += size
+            full = len(self.__items) >= self.max_messages or (self.max_bytes is not None and self.__bytes >= self.max_bytes)
+            batch = self.__take() if full else None
+        if batch:
+            self.__handle(batch)
+
+    def __take(self):
+        batch, self.__items, self.__bytes, self.__deadline = self.__items, [], 0, None
+        return batch
+
+    def __handle(self, batch):
+        try:
+            self.handler(batch)
+        except Exception as e:
+            logger.error('unexpected exception was caughted {}.'.format(e))
+
+    def __run(self):
+        while True:
+            with self.__cond:
+                while not self.__stopped and (self.__deadline is None or self.__deadline > time.time()):
+                    self.__cond.wait(None if self.__deadline is None else self.__deadline - time.time())
+                if self.__stopped:
+                    return
+                batch = self.__take()
+            if batch:
+                self.__handle(batch)
+
+    def flush(self):
+        """Hand the current batch over to the handler immediately.
+        """
+        with self.__cond:
+            batch = self.__take()
+        if batch:
+            self.__handle(batch)
+
+    def stop(self):
+        """Stop the timer thread, and return the items which have not been handled.
+
+        Returns:
+            list -- The buffered items.
+        """
+        with self.__cond:
+            self.__stopped = True
+            self.__cond.notify()
+            return self.__take()
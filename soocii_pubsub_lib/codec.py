@@ -0,0 +1,151 @@
+# coding=utf-8
+#
+import json
+import zlib
+import logging
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# message attributes which mark how the payload is encoded
+CODEC_ATTRIBUTE = '_codec'
+COMPRESSION_ATTRIBUTE = '_compression'
+
+
+class RawCodec():
+    name = 'raw'
+
+    def encode(self, payload):
+        if type(payload) is not bytes:
+            raise ValueError('unexpected data type which is {}, please input bytestring instead.'.format(type(payload)))
+        return payload
+
+    def decode(self, data):
+        return data
+
+
+class JsonCodec():
+    name = 'json'
+
+    def encode(self, payload):
+        return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+    def decode(self, data):
+        return json.loads(data.decode('utf-8'))
+
+
+class MsgpackCodec():
+    name = 'msgpack'
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError('msgpack is not installed, please install soocii-pubsub-lib[msgpack] instead.')
+
+    def encode(self, payload):
+        return msgpack.packb(payload, use_bin_type=True)
+
+    def decode(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+
+CODECS = {
+    RawCodec.name: RawCodec,
+    JsonCodec.name: JsonCodec,
+    MsgpackCodec.name: MsgpackCodec,
+}
+
+# codec instances, created on first use
+_codecs = {}
+
+
+def register_codec(codec):
+    """Register a custom codec, which has a unique name, and encode/decode methods.
+
+    Arguments:
+        codec {class} -- The codec class.
+    """
+    CODECS[codec.name] = codec
+    _codecs.pop(codec.name, None)
+
+
+def get_codec(name):
+    """Get the codec instance of the given name.
+
+    Arguments:
+        name {str} -- The codec name.
+
+    Raises:
+        ValueError -- If the codec is unknown.
+
+    Returns:
+        object -- The codec instance.
+    """
+    codec = _codecs.get(name)
+    if codec is None:
+        if name not in CODECS:
+            raise ValueError('unknown codec {}.'.format(name))
+        codec = _codecs[name] = CODECS[name]()
+    return codec
+
+
+class PayloadEncoder():
+    def __init__(self, codec='raw', compress_threshold=None, compress_level=6):
+        """Encode payloads with the given codec, and compress the encoded payloads above the size threshold.
+        The codec and the compression are marked in the message attributes, so that decode() can reverse them.
+
+        Keyword Arguments:
+            codec {str} -- The codec name, one of raw, json, msgpack or a registered codec (default: {'raw'})
+            compress_threshold {int} -- Compress the payloads larger than this number of bytes, never compress if None (default: {None})
+            compress_level {int} -- The zlib compression level (default: {6})
+        """
+        self.codec = get_codec(codec)
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+
+    def encode(self, payload, attributes):
+        """Encode the payload.
+
+        Arguments:
+            payload -- The payload to encode.
+            attributes {dict} -- The message attributes.
+
+        Returns:
+            (bytes, dict) -- A tuple of the message data and the message attributes.
+        """
+        data = self.codec.encode(payload)
+        markers = {}
+        if self.codec.name != RawCodec.name:
+            markers[CODEC_ATTRIBUTE] = self.codec.name
+        if self.compress_threshold is not None and len(data) > self.compress_threshold:
+            data = zlib.compress(data, self.compress_level)
+            markers[COMPRESSION_ATTRIBUTE] = 'zlib'
+        if markers:
+            attributes = dict(attributes, **markers)
+        return data, attributes
+
+
+def decode(data, attributes):
+    """Decode the message data according to the markers in its attributes, the data is returned as is without markers.
+
+    Arguments:
+        data {bytes} -- The message data.
+        attributes {dict} -- The message attributes.
+
+    Raises:
+        ValueError -- If the codec or the compression is unknown.
+
+    Returns:
+        object -- The decoded payload.
+    """
+    if COMPRESSION_ATTRIBUTE in attributes:
+        compression = attributes[COMPRESSION_ATTRIBUTE]
+        if compression != 'zlib':
+            raise ValueError('unknown compression {}.'.format(compression))
+        data = zlib.decompress(data)
+    if CODEC_ATTRIBUTE in attributes:
+        data = get_codec(attributes[CODEC_ATTRIBUTE]).decode(data)
+    return data
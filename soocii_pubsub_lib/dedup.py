@@ -0,0 +1,96 @@
+# coding=utf-8
+#
+import time
+import logging
+import threading
+import collections
+
+logger = logging.getLogger(__name__)
+
+
+class DedupCache():
+    def __init__(self, max_size=100000, ttl=600, key=None):
+        """A bounded cache of the messages which have been ack, to skip redelivered messages.
+
+        The keys are evicted in insertion order, once they are older than ttl or the cache is full,
+        so the memory is bounded by max_size no matter how many messages are received.
+        NOTED: a redelivered message is only skipped if the first delivery has been ack,
+        the redelivery of a message which is still being handled is handled again.
+
+        Keyword Arguments:
+            max_size {int} -- The maximum number of keys to remember (default: {100000})
+            ttl {float} -- The number of seconds to remember a key (default: {600})
+            key {str} -- The attribute to identify a message, message_id if None (default: {None})
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.key = key
+        self.hits = 0
+        self.misses = 0
+        self.__expiry = collections.OrderedDict()
+        self.__lock = threading.Lock()
+
+    def key_of(self, message):
+        """Get the key of a received message.
+
+        Arguments:
+            message {google.cloud.pubsub_v1.subscriber.message.Message} -- The received message.
+
+        Returns:
+            str -- The key, or None if the message does not have the key attribute.
+        """
+        if self.key is None:
+            return message.message_id
+        return message.attributes.get(self.key)
+
+    def __evict(self, now):
+        while self.__expiry:
+            key, expiry = next(iter(self.__expiry.items()))
+            if expiry > now and len(self.__expiry) <= self.max_size:
+                break
+            self.__expiry.popitem(last=False)
+
+    def seen(self, key):
+        """Check if a message of the key has been ack, and count the hit or miss.
+
+        Arguments:
+            key {str} -- The message key.
+
+        Returns:
+            bool -- True if it is a duplicate.
+        """
+        if key is None:
+            return False
+        now = time.time()
+        with self.__lock:
+            expiry = self.__expiry.get(key)
+            if expiry is not None and expiry > now:
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def add(self, key):
+        """Remember that a message of the key has been ack.
+
+        Arguments:
+            key {str} -- The message key.
+        """
+        if key is None:
+            return
+        now = time.time()
+        with self.__lock:
+            self.__expiry.pop(key, None)
+            self.__expiry[key] = now + self.ttl
+            self.__evict(now)
+
+    def __len__(self):
+        return len(self.__expiry)
+
+    def stats(self):
+        """Get the counters of the cache.
+
+        Returns:
+            dict -- The number of hits, misses and cached keys.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.__expiry)}
@@ -0,0 +1,155 @@
+# coding=utf-8
+#
+import time
+import logging
+import threading
+import collections
+import concurrent.futures
+
+logger = logging.getLogger(__name__)
+
+BLOCK = 'block'
+ERROR = 'error'
+DROP_OLDEST = 'drop_oldest'
+
+
+class FlowControlLimitError(Exception):
+    """Raised as the outstanding messages of a publisher reach the limits.
+    """
+
+
+class PublishFlowController():
+    def __init__(self, max_messages=None, max_bytes=None, policy=BLOCK, timeout=None):
+        """Bound the messages handed over to the publisher client and not yet published.
+
+        As the limits are reached, a new message is handled by the policy:
+            block -- wait until there is room, raise FlowControlLimitError after timeout.
+            error -- raise FlowControlLimitError immediately.
+            drop_oldest -- queue the message in a backlog of the same limits, which drops its oldest message as it overflows.
+                           The future of a dropped message is cancelled.
+
+        Keyword Arguments:
+            max_messages {int} -- The maximum number of outstanding messages, no limit if None (default: {None})
+            max_bytes {int} -- The maximum total size of outstanding messages, no limit if None (default: {None})
+            policy {str} -- One of block, error and drop_oldest (default: {'block'})
+            timeout {float} -- The maximum number of seconds to block, forever if None (default: {None})
+        """
+        if policy not in (BLOCK, ERROR, DROP_OLDEST):
+            raise ValueError('unknown overflow policy {}.'.format(policy))
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.timeout = timeout
+        self.messages = 0
+        self.bytes = 0
+        self.dropped = 0
+        # (size, publish, future) waiting for room, in drop_oldest policy
+        self.__backlog = collections.deque()
+        self.__backlog_bytes = 0
+        self.__cond = threading.Condition()
+
+    def __fits(self, messages, total, size):
+        # a message is always admitted if nothing is outstanding
+        if messages == 0:
+            return True
+        if self.max_messages is not None and messages + 1 > self.max_messages:
+            return False
+        if self.max_bytes is not None and total + size > self.max_bytes:
+            return False
+        return True
+
+    def admit(self, size, publish, block=True):
+        """Publish a message if there is room, otherwise handle it by the policy.
+
+        Arguments:
+            size {int} -- The size of the message in bytes.
+            publish {function} -- The function to hand over the message to the client, which returns its future.
+
+        Keyword Arguments:
+            block {bool} -- Wait for room in block policy, otherwise raise FlowControlLimitError at once as error policy (default: {True})
+
+        Raises:
+            FlowControlLimitError -- If the limits are reached in error policy or without block, or timeout in block policy.
+
+        Returns:
+            concurrent.futures.Future -- The future of the message.
+        """
+        with self.__cond:
+            if self.policy == DROP_OLDEST:
+                if self.__backlog or not self.__fits(self.messages, self.bytes, size):
+                    return self.__enqueue(size, publish)
+            elif self.policy == ERROR or not block:
+                if not self.__fits(self.messages, self.bytes, size):
+                    raise FlowControlLimitError('{} outstanding messages of {} bytes.'.format(self.messages, self.bytes))
+            else:
+                deadline = None if self.timeout is None else time.time() + self.timeout
+                while not self.__fits(self.messages, self.bytes, size):
+                    remaining = None if deadline is None else deadline - time.time()
+                    if remaining is not None and remaining <= 0:
+                        raise FlowControlLimitError('timeout with {} outstanding messages of {} bytes.'.format(self.messages, self.bytes))
+                    self.__cond.wait(remaining)
+            self.messages += 1
+            self.bytes += size
+        return self.__publish(size, publish)
+
+    def __publish(self, size, publish):
+        try:
+            future = publish()
+        except Exception:
+            self.__release(size)
+            raise
+        future.add_done_callback(lambda future: self.__release(size))
+        return future
+
+    def __enqueue(self, size, publish):
+        # caller holds the lock
+        future = concurrent.futures.Future()
+        self.__backlog.append((size, publish, future))
+        self.__backlog_bytes += size
+        while len(self.__backlog) > 1 and not self.__fits(len(self.__backlog) - 1, self.__backlog_bytes - size, size):
+            dropped_size, _, dropped = self.__backlog.popleft()
+            self.__backlog_bytes -= dropped_size
+            self.dropped += 1
+            dropped.cancel()
+        return future
+
+    def __release(self, size):
+        with self.__cond:
+            self.messages -= 1
+            self.bytes -= size
+            ready = []
+            while self.__backlog and self.__fits(self.messages, self.bytes, self.__backlog[0][0]):
+                entry = self.__backlog.popleft()
+                self.__backlog_bytes -= entry[0]
+                self.messages += 1
+                self.bytes += entry[0]
+                ready.append(entry)
+            self.__cond.notify_all()
+        for size, publish, future in ready:
+            self.__chain(size, publish, future)
+
+    def __chain(self, size, publish, future):
+        # publish a message of the backlog, and resolve its future with the result
+        try:
+            source = self.__publish(size, publish)
+        except Exception as e:
+            future.set_exception(e)
+            return
+
+        def copy(source):
+            if source.cancelled():
+                future.cancel()
+            elif source.exception() is not None:
+                future.set_exception(source.exception())
+            else:
+                future.set_result(source.result())
+        source.add_done_callback(copy)
+
+    def depth(self):
+        """Get the current queue depth.
+
+        Returns:
+            dict -- The number and bytes of outstanding messages, the number of messages in backlog, and the number of dropped messages.
+        """
+        with self.__cond:
+            return {'messages': self.messages, 'bytes': self.bytes, 'backlog': len(self.__backlog), 'dropped': self.dropped}
@@ -0,0 +1,89 @@
+# coding=utf-8
+#
+import logging
+import threading
+
+from six.moves import queue
+
+logger = logging.getLogger(__name__)
+
+# put into a lane to stop its thread
+_STOP = object()
+
+
+class OrderedDispatcher():
+    def __init__(self, key, lanes=8, max_depth=1000):
+        """Dispatch messages into serial lanes by the hash of an attribute.
+        The messages of the same key are handled one by one in the received order, while different keys are handled in parallel.
+
+        Each lane is a thread with a bounded queue; once a lane is full, submit() blocks the pulling thread,
+        which in turn pauses the pull by flow control.
+
+        Arguments:
+            key {str} -- The attribute to partition messages by, e.g. user_id.
+
+        Keyword Arguments:
+            lanes {int} -- The number of lanes (default: {8})
+            max_depth {int} -- The maximum number of queued messages per lane (default: {1000})
+        """
+        self.key = key
+        self.max_depth = max_depth
+        self.__queues = [queue.Queue(maxsize=max_depth) for _ in range(lanes)]
+        self.__threads = []
+        for i, q in enumerate(self.__queues):
+            thread = threading.Thread(target=self.__run, args=(q,), name='pubsub-lane-{}'.format(i))
+            thread.daemon = True
+            thread.start()
+            self.__threads.append(thread)
+
+    def __run(self, q):
+        while True:
+            task = q.get()
+            if task is _STOP:
+                return
+            try:
+                task()
+            except Exception as e:
+                logger.error('unexpected exception was caughted {}.'.format(e))
+
+    def lane_of(self, message):
+        """Get the lane index of a message.
+
+        Arguments:
+            message {dict} -- The message, a dictionary of message_id, data and attributes.
+
+        Returns:
+            int -- The lane index, messages without the key attribute are spread by message_id.
+        """
+        key = message['attributes'].get(self.key)
+        if key is None:
+            key = message['message_id']
+        return hash(key) % len(self.__queues)
+
+    def submit(self, message, task):
+        """Queue the task of a message into its lane, block if the lane is full.
+
+        Arguments:
+            message {dict} -- The message to partition by.
+            task {function} -- The function to run in the lane.
+        """
+        self.__queues[self.lane_of(message)].put(task)
+
+    def depths(self):
+        """Get the number of queued messages of each lane.
+
+        Returns:
+            list -- The queue depth of each lane.
+        """
+        return [q.qsize() for q in self.__queues]
+
+    def stop(self, timeout=None):
+        """Stop the lanes after the queued tasks are done.
+
+        Keyword Arguments:
+            timeout {float} -- The maximum number of seconds to wait for each lane (default: {None})
+        """
+        for q in self.__queues:
+            q.put(_STOP)
+        for thread in self.__threads:
+            thread.join(timeout)
@@ -0,0 +1,184 @@
+# coding=utf-8
+#
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket():
+    def __init__(self, rate, burst=None):
+        """A token bucket, which is refilled at rate tokens per second up to burst tokens.
+
+        Arguments:
+            rate {float} -- The number of tokens per second.
+
+        Keyword Arguments:
+            burst {float} -- The capacity of the bucket (default: {None} for one second of tokens)
+        """
+        self.rate = float(rate)
+        self.burst = float(rate if burst is None else burst)
+        self.tokens = self.burst
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """Take the tokens in advance, which may make the bucket negative.
+        A request larger than burst is served after the debt is paid off at rate, so it never exceeds the rate.
+
+        Arguments:
+            tokens {float} -- The number of tokens.
+
+        Returns:
+            float -- The number of seconds to wait before the tokens are available.
+        """
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self, tokens=1):
+        """Block until the tokens are available.
+
+        Keyword Arguments:
+            tokens {float} -- The number of tokens (default: {1})
+
+        Returns:
+            float -- The number of seconds waited.
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class RateLimiter():
+    def __init__(self, messages_per_second=None, bytes_per_second=None, burst_messages=None, burst_bytes=None):
+        """Limit the rate of messages handed over to the callback, in messages and/or bytes of data per second.
+        The callback threads wait for their turn, so the pull is paused once the flow control limits are reached.
+
+        Keyword Arguments:
+            messages_per_second {float} -- The maximum number of messages per second (default: {None} for no limit)
+            bytes_per_second {float} -- The maximum number of bytes per second (default: {None} for no limit)
+            burst_messages {float} -- The number of messages allowed at once (default: {None} for one second of messages)
+            burst_bytes {float} -- The number of bytes allowed at once (default: {None} for one second of bytes)
+
+        Raises:
+            ValueError -- If neither rate is given.
+        """
+        if messages_per_second is None and bytes_per_second is None:
+            raise ValueError('messages_per_second or bytes_per_second is required.')
+        self.messages = None if messages_per_second is None else TokenBucket(messages_per_second, burst_messages)
+        self.bytes = None if bytes_per_second is None else TokenBucket(bytes_per_second, burst_bytes)
+
+    def acquire(self, count=1, size=0):
+        """Block until the messages are allowed.
+
+        Keyword Arguments:
+            count {int} -- The number of messages (default: {1})
+            size {int} -- The total size of their data in bytes (default: {0})
+
+        Returns:
+            float -- The number of seconds waited.
+        """
+        wait = 0.0
+        if self.messages is not None:
+            wait = self.messages.reserve(count)
+        if self.bytes is not None and size > 0:
+            wait = max(wait, self.bytes.reserve(size))
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class AdaptiveConcurrency():
+    def __init__(self, initial_limit=10, min_limit=1, max_limit=100, target_latency=1.0, max_error_rate=0.1,
+                 window=20, increase=1, decrease=0.7):
+        """Limit the number of callbacks running at once, and adapt the limit by additive increase and multiplicative decrease.
+
+        Every window of completed callbacks, the limit grows by increase if their average latency is within target_latency
+        and their error rate, i.e. the ratio of messages not ack, is within max_error_rate, otherwise it shrinks by the factor decrease.
+        NOTED: the callback executor needs at least max_limit threads for the limit to grow that far.
+
+        Keyword Arguments:
+            initial_limit {int} -- The initial limit (default: {10})
+            min_limit {int} -- The minimum limit (default: {1})
+            max_limit {int} -- The maximum limit (default: {100})
+            target_latency {float} -- The maximum average number of seconds of a callback before shrinking the limit (default: {1.0})
+            max_error_rate {float} -- The maximum ratio of messages not ack before shrinking the limit (default: {0.1})
+            window {int} -- The number of callbacks between adjustments (default: {20})
+            increase {float} -- The additive increase of the limit (default: {1})
+            decrease {float} -- The multiplicative decrease of the limit (default: {0.7})
+        """
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.max_error_rate = max_error_rate
+        self.window = window
+        self.increase = increase
+        self.decrease = decrease
+        self.inflight = 0
+        self.cond = threading.Condition()
+        # samples of the current window
+        self.__count = 0
+        self.__latency = 0.0
+        self.__errors = 0
+
+    def acquire(self):
+        """Block until a callback is allowed to run.
+        """
+        with self.cond:
+            while self.inflight >= int(self.limit):
+                self.cond.wait()
+            self.inflight += 1
+
+    def release(self, latency, failed=False):
+        """Record a completed callback, and adjust the limit at the end of a window.
+
+        Arguments:
+            latency {float} -- The number of seconds of the callback.
+
+        Keyword Arguments:
+            failed {bool} -- True if the message was not ack (default: {False})
+        """
+        with self.cond:
+            self.inflight -= 1
+            self.__count += 1
+            self.__latency += latency
+            self.__errors += 1 if failed else 0
+            if self.__count >= self.window:
+                latency = self.__latency / self.__count
+                error_rate = float(self.__errors) / self.__count
+                if latency > self.target_latency or error_rate > self.max_error_rate:
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                else:
+                    self.limit = min(self.max_limit, self.limit + self.increase)
+                logger.debug('concurrency limit {:.1f}, latency {:.3f}s, error rate {:.2f}.'.format(self.limit, latency, error_rate))
+                self.__count = 0
+                self.__latency = 0.0
+                self.__errors = 0
+            self.cond.notify_all()
+
+    def track(self, settle):
+        """Wait for a slot, and wrap the settle function of the messages to release it.
+
+        Arguments:
+            settle {function} -- The function to settle the messages by the return value of the callback.
+
+        Returns:
+            function -- The wrapped settle function.
+        """
+        self.acquire()
+        start = time.time()
+
+        def settled(ack):
+            try:
+                settle(ack)
+            finally:
+                ok = ack is True or (isinstance(ack, (list, tuple)) and all(value is True for value in ack))
+                self.release(time.time() - start, not ok)
+        return settled
@@ -0,0 +1,310 @@
+# coding=utf-8
+#
+import time
+import logging
+import datetime
+import itertools
+import threading
+import collections
+import concurrent.futures
+
+from google.api_core.exceptions import AlreadyExists, NotFound
+
+logger = logging.getLogger(__name__)
+
+
+class Resource(object):
+    def __init__(self, name, **kwargs):
+        self.name = name
+        self.__dict__.update(kwargs)
+
+
+class ReceivedMessage(object):
+    def __init__(self, subscription, ack_id, message_id, data, attributes, publish_time, delivery_attempt):
+        """A message delivered by the in-memory broker, which behaves as google.cloud.pubsub_v1.subscriber.message.Message.
+        """
+        self._subscription = subscription
+        self.ack_id = ack_id
+        self.message_id = message_id
+        self.data = data
+        self.attributes = attributes
+        self.publish_time = publish_time
+        self.delivery_attempt = delivery_attempt
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    def ack(self):
+        self._subscription.acknowledge([self.ack_id])
+
+    def nack(self):
+        self._subscription.modify_ack_deadline([self.ack_id], 0)
+
+    def modify_ack_deadline(self, seconds):
+        self._subscription.modify_ack_deadline([self.ack_id], seconds)
+
+    def drop(self):
+        self._subscription.release(self.ack_id)
+
+    def __repr__(self):
+        return 'Message(message_id={}, data={!r}, attributes={})'.format(self.message_id, self.data, self.attributes)
+
+
+class Subscription(object):
+    def __init__(self, broker, name, topic, ack_deadline_seconds):
+        self.broker = broker
+        self.name = name
+        self.topic = topic
+        self.ack_deadline_seconds = ack_deadline_seconds
+        self.cond = threading.Condition()
+        # (message_id, data, attributes, publish_time, delivery_attempt) waiting for delivery
+        self.pending = collections.deque()
+        # ack_id: [entry, deadline, stream]
+        self.outstanding = {}
+        self.__ack_ids = itertools.count(1)
+
+    def put(self, entry):
+        with self.cond:
+            self.pending.append(entry)
+            self.cond.notify_all()
+
+    def expire(self, now):
+        # redeliver the outstanding messages whose ack deadline has expired, caller holds the lock
+        expired = [ack_id for ack_id, (_, deadline, _) in self.outstanding.items() if deadline <= now]
+        for ack_id in expired:
+            entry = self.outstanding.pop(ack_id)[0]
+            self.pending.append(entry)
+        if expired:
+            self.cond.notify_all()
+
+    def take(self, deadline, stream=None):
+        # lease the next pending message, caller holds the lock
+        message_id, data, attributes, publish_time, attempt = self.pending.popleft()
+        attempt += 1
+        ack_id = '{}-{}'.format(message_id, next(self.__ack_ids))
+        self.outstanding[ack_id] = [(message_id, data, attributes, publish_time, attempt), deadline, stream]
+        return ReceivedMessage(self, ack_id, message_id, data, dict(attributes), publish_time, attempt)
+
+    def acknowledge(self, ack_ids):
+        with self.cond:
+            for ack_id in ack_ids:
+                self.outstanding.pop(ack_id, None)
+            self.cond.notify_all()
+
+    def modify_ack_deadline(self, ack_ids, seconds):
+        now = time.time()
+        with self.cond:
+            for ack_id in ack_ids:
+                lease = self.outstanding.get(ack_id)
+                if lease is None:
+                    continue
+                if seconds == 0:
+                    # nack, redeliver immediately
+                    del self.outstanding[ack_id]
+                    self.pending.appendleft(lease[0])
+                else:
+                    lease[1] = now + seconds
+            self.cond.notify_all()
+
+    def release(self, ack_id):
+        # stop leasing the message in the stream, it is redelivered after its ack deadline
+        with self.cond:
+            lease = self.outstanding.get(ack_id)
+            if lease is not None and lease[2] is not None:
+                lease[1] = min(lease[1], time.time() + self.ack_deadline_seconds)
+                lease[2] = None
+            self.cond.notify_all()
+
+    def leased_by(self, stream):
+        # caller holds the lock
+        return [lease for lease in self.outstanding.values() if lease[2] is stream]
+
+
+class StreamingPullFuture(concurrent.futures.Future):
+    def __init__(self, subscription, callback, flow_control, scheduler):
+        """A streaming pull from the in-memory broker, which delivers messages to the callback in a background thread.
+        """
+        super(StreamingPullFuture, self).__init__()
+        self.subscription = subscription
+        self.callback = callback
+        self.max_messages = getattr(flow_control, 'max_messages', 1000)
+        self.max_bytes = getattr(flow_control, 'max_bytes', 100 * 1024 * 1024)
+        self.max_lease_duration = getattr(flow_control, 'max_lease_duration', 3600)
+        if scheduler is None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=10)
+            self.schedule = self.executor.submit
+        else:
+            self.executor = None
+            self.schedule = scheduler.schedule
+        self.__stopped = False
+        self.__thread = threading.Thread(target=self.__run, name='memory-streaming-pull')
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def __full(self):
+        leases = self.subscription.leased_by(self)
+        return len(leases) >= self.max_messages or sum(len(lease[0][1]) for lease in leases) >= self.max_bytes
+
+    def __run(self):
+        subscription = self.subscription
+        while True:
+            with subscription.cond:
+                while True:
+                    if self.__stopped:
+                        return
+                    subscription.expire(time.time())
+                    if subscription.pending and not self.__full():
+                        break
+                    subscription.cond.wait(0.05)
+                # leases are extended by the stream until max_lease_duration
+                message = subscription.take(time.time() + self.max_lease_duration, self)
+            try:
+                self.schedule(self.callback, message)
+            except RuntimeError as e:
+                logger.warning('stop streaming pull: {}'.format(e))
+                return
+
+    def cancel(self):
+        """Stop the streaming pull, the messages which are not ack are redelivered after their ack deadline.
+        """
+        subscription = self.subscription
+        with subscription.cond:
+            if self.__stopped:
+                return True
+            self.__stopped = True
+            now = time.time()
+            for lease in subscription.leased_by(self):
+                lease[1] = min(lease[1], now + subscription.ack_deadline_seconds)
+                lease[2] = None
+            subscription.cond.notify_all()
+        if self.__thread is not threading.current_thread():
+            self.__thread.join()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        if not self.done():
+            self.set_result(None)
+        return True
+
+
+class Broker():
+    def __init__(self):
+        """An in-process Pub/Sub broker with topics, subscriptions, fan-out, ack deadlines and redelivery.
+
+        It is a transport of PublisherClient and SubscribeClient, which makes them run without network,
+        e.g. in tests and benchmarks. Messages are never persisted.
+
+            broker = memory.Broker()
+            publisher = pubsub_client.PublisherClient('project', None, transport=broker)
+            subscriber = pubsub_client.SubscribeClient('project', None, transport=broker)
+        """
+        self.topics = {}
+        self.subscriptions = {}
+        self.lock = threading.Lock()
+        self.__message_ids = itertools.count(1)
+
+    def publisher(self, batch_settings=None, credentials=None):
+        return MemoryPublisherClient(self)
+
+    def subscriber(self, credentials=None):
+        return MemorySubscriberClient(self)
+
+    def get_topic(self, topic):
+        with self.lock:
+            if topic not in self.topics:
+                raise NotFound('Resource not found (resource={}).'.format(topic))
+            return self.topics[topic]
+
+    def get_subscription(self, subscription):
+        with self.lock:
+            if subscription not in self.subscriptions:
+                raise NotFound('Resource not found (resource={}).'.format(subscription))
+            return self.subscriptions[subscription]
+
+    def publish(self, topic, data, attributes):
+        subscriptions = self.get_topic(topic)
+        entry = (str(next(self.__message_ids)), data, attributes, datetime.datetime.utcnow(), 0)
+        for subscription in list(subscriptions):
+            subscription.put(entry)
+        return entry[0]
+
+
+class MemoryPublisherClient(object):
+    def __init__(self, broker):
+        self.broker = broker
+
+    @staticmethod
+    def topic_path(project, topic):
+        return 'projects/{}/topics/{}'.format(project, topic)
+
+    def create_topic(self, name, **kwargs):
+        with self.broker.lock:
+            if name in self.broker.topics:
+                raise AlreadyExists('Topic already exists: {}'.format(name))
+            self.broker.topics[name] = []
+        return Resource(name)
+
+    def get_topic(self, topic, **kwargs):
+        self.broker.get_topic(topic)
+        return Resource(topic)
+
+    def publish(self, topic, data, **attrs):
+        if not isinstance(data, bytes):
+            raise TypeError('Data being published to Pub/Sub must be sent as a bytestring.')
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(self.broker.publish(topic, data, attrs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class MemorySubscriberClient(object):
+    def __init__(self, broker):
+        self.broker = broker
+
+    @staticmethod
+    def topic_path(project, topic):
+        return 'projects/{}/topics/{}'.format(project, topic)
+
+    @staticmethod
+    def subscription_path(project, subscription):
+        return 'projects/{}/subscriptions/{}'.format(project, subscription)
+
+    def create_subscription(self, name, topic, ack_deadline_seconds=10, **kwargs):
+        subscriptions = self.broker.get_topic(topic)
+        with self.broker.lock:
+            if name in self.broker.subscriptions:
+                raise AlreadyExists('Subscription already exists: {}'.format(name))
+            subscription = self.broker.subscriptions[name] = Subscription(self.broker, name, topic, ack_deadline_seconds)
+            subscriptions.append(subscription)
+        return Resource(name, topic=topic, ack_deadline_seconds=ack_deadline_seconds)
+
+    def get_subscription(self, subscription, **kwargs):
+        subscription = self.broker.get_subscription(subscription)
+        return Resource(subscription.name, topic=subscription.topic, ack_deadline_seconds=subscription.ack_deadline_seconds)
+
+    def subscribe(self, subscription, callback, flow_control=(), scheduler=None):
+        return StreamingPullFuture(self.broker.get_subscription(subscription), callback, flow_control, scheduler)
+
+    def pull(self, subscription, max_messages, return_immediately=False, timeout=None, **kwargs):
+        # wait for the first message until timeout, then take the pending ones at most max_messages
+        subscription = self.broker.get_subscription(subscription)
+        deadline = time.time() + (10 if timeout is None else timeout)
+        with subscription.cond:
+            while True:
+                subscription.expire(time.time())
+                remaining = deadline - time.time()
+                if subscription.pending or return_immediately or remaining <= 0:
+                    break
+                subscription.cond.wait(min(remaining, 0.05))
+            ack_deadline = time.time() + subscription.ack_deadline_seconds
+            messages = [subscription.take(ack_deadline) for _ in range(min(max_messages, len(subscription.pending)))]
+        received = [Resource(message.ack_id, ack_id=message.ack_id, message=message, delivery_attempt=message.delivery_attempt) for message in messages]
+        return Resource(subscription.name, received_messages=received)
+
+    def acknowledge(self, subscription, ack_ids, **kwargs):
+        self.broker.get_subscription(subscription).acknowledge(ack_ids)
+
+    def modify_ack_deadline(self, subscription, ack_ids, ack_deadline_seconds, **kwargs):
+        self.broker.get_subscription(subscription).modify_ack_deadline(ack_ids, ack_deadline_seconds)
@@ -0,0 +1,98 @@
+# coding=utf-8
+#
+import logging
+
+from soocii_pubsub_lib import codec
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+logger = logging.getLogger(__name__)
+
+
+def to_dict(message):
+    """Copy a received message into a dictionary of message_id, data and attributes.
+    The data is decoded if the message was published with a codec.
+
+    Arguments:
+        message {google.cloud.pubsub_v1.subscriber.message.Message} -- The received message.
+
+    Returns:
+        dict -- The copied message.
+    """
+    # convert attributes into dict type
+    attributes = {attr: message.attributes[attr] for attr in message.attributes}
+    return {
+        'message_id': message.message_id,
+        'data': codec.decode(message.data, attributes),
+        'attributes': attributes
+    }
+
+
+class Message(Mapping):
+    """A read-only view of a received message, which copies nothing until it is accessed.
+
+    It is compatible with the dictionary built by to_dict(), i.e. message['data'] is the decoded data and message['attributes'] is a dict,
+    while message.data is a memoryview of the raw data for zero-copy slicing, and message.publish_time is available in addition.
+    The view is pickled as a plain dictionary.
+    """
+    __slots__ = ('_message', '_attributes', '_payload')
+
+    _keys = ('message_id', 'data', 'attributes')
+
+    def __init__(self, message):
+        self._message = message
+        self._attributes = None
+        self._payload = None
+
+    @property
+    def message_id(self):
+        return self._message.message_id
+
+    @property
+    def data(self):
+        return memoryview(self._message.data)
+
+    @property
+    def attributes(self):
+        # convert attributes into dict type on first access
+        if self._attributes is None:
+            attributes = self._message.attributes
+            self._attributes = {attr: attributes[attr] for attr in attributes}
+        return self._attributes
+
+    @property
+    def publish_time(self):
+        return self._message.publish_time
+
+    @property
+    def payload(self):
+        # decode the data on first access
+        if self._payload is None:
+            attributes = self._message.attributes
+            if codec.CODEC_ATTRIBUTE in attributes or codec.COMPRESSION_ATTRIBUTE in attributes:
+                self._payload = codec.decode(self._message.data, attributes)
+            else:
+                self._payload = self._message.data
+        return self._payload
+
+    def __getitem__(self, key):
+        if key == 'data':
+            return self.payload
+        if key in self._keys:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+    def __repr__(self):
+        return 'Message(message_id={})'.format(self.message_id)
@@ -0,0 +1,234 @@
+# coding=utf-8
+#
+import time
+import bisect
+import logging
+import calendar
+import threading
+
+logger = logging.getLogger(__name__)
+
+# latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Metric(object):
+    kind = None
+
+    def __init__(self, registry, name, help, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _forward(self, labels, value):
+        if self.registry.sink is not None:
+            self.registry.sink.observe(self.name, dict(zip(self.labelnames, labels)), value)
+
+    def _format_labels(self, labels, extra=()):
+        pairs = list(zip(self.labelnames, labels)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs) + '}'
+
+    def get(self, labels=()):
+        return self._values.get(tuple(labels), 0)
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} {}'.format(self.name, self.kind)]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append('{}{} {}'.format(self.name, self._format_labels(labels), value))
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, value=1, labels=()):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+        self._forward(labels, value)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, value=1, labels=()):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+        self._forward(labels, self._values[labels])
+
+    def dec(self, value=1, labels=()):
+        self.inc(-value, labels)
+
+    def set(self, value, labels=()):
+        with self._lock:
+            self._values[labels] = value
+        self._forward(labels, value)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(registry, name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, labels=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # counts of each bucket and +Inf, sum
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+        self._forward(labels, value)
+
+    def get(self, labels=()):
+        state = self._values.get(tuple(labels))
+        return 0 if state is None else sum(state[0])
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} {}'.format(self.name, self.kind)]
+        with self._lock:
+            items = sorted((labels, (list(state[0]), state[1])) for labels, state in self._values.items())
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(self.name, self._format_labels(labels, [('le', bound)]), cumulative))
+            lines.append('{}_sum{} {}'.format(self.name, self._format_labels(labels), total))
+            lines.append('{}_count{} {}'.format(self.name, self._format_labels(labels), cumulative))
+        return lines
+
+
+class Registry():
+    def __init__(self, sink=None):
+        """A registry of metrics, which renders them in Prometheus text format.
+
+        Keyword Arguments:
+            sink {object} -- An optional sink, whose observe(name, labels, value) is called on every update,
+                             e.g. to forward the metrics to statsd. (default: {None})
+        """
+        self.sink = sink
+        self.__metrics = {}
+        self.__lock = threading.Lock()
+
+    def __register(self, cls, name, *args, **kwargs):
+        with self.__lock:
+            metric = self.__metrics.get(name)
+            if metric is None:
+                metric = self.__metrics[name] = cls(self, name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError('metric {} is already registered as {}.'.format(name, metric.kind))
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.__register(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self.__register(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.__register(Histogram, name, help, labelnames, buckets=buckets)
+
+    def get(self, name):
+        return self.__metrics.get(name)
+
+    def render(self):
+        """Render all metrics in Prometheus text format.
+
+        Returns:
+            str -- The metrics.
+        """
+        lines = []
+        for name in sorted(self.__metrics):
+            lines.extend(self.__metrics[name].render())
+        return '\n'.join(lines) + '\n'
+
+
+def to_timestamp(dt):
+    # publish_time is a datetime in UTC
+    if dt.tzinfo is not None:
+        return calendar.timegm(dt.utctimetuple()) + dt.microsecond / 1e6
+    return calendar.timegm(dt.timetuple()) + dt.microsecond / 1e6
+
+
+class PublisherMetrics():
+    def __init__(self, registry):
+        """The metrics of PublisherClient, labelled by topic.
+
+        Arguments:
+            registry {Registry} -- The registry to register the metrics.
+        """
+        self.latency = registry.histogram('pubsub_publish_latency_seconds', 'Seconds from publish to the message id is returned.', ('topic',))
+        self.messages = registry.counter('pubsub_published_messages_total', 'Messages published.', ('topic',))
+        self.bytes = registry.counter('pubsub_published_bytes_total', 'Bytes of message data published.', ('topic',))
+        self.errors = registry.counter('pubsub_publish_errors_total', 'Messages failed to publish.', ('topic',))
+        self.cancels = registry.counter('pubsub_publish_cancels_total', 'Messages whose publish was cancelled.', ('topic',))
+
+    def published(self, topic, size, start, future):
+        labels = (topic,)
+        if future.cancelled():
+            self.cancels.inc(labels=labels)
+        elif future.exception() is not None:
+            self.errors.inc(labels=labels)
+        else:
+            self.latency.observe(time.time() - start, labels)
+            self.messages.inc(labels=labels)
+            self.bytes.inc(size, labels)
+
+
+class SubscriberMetrics():
+    def __init__(self, registry, subscription):
+        """The metrics of SubscribeClient, labelled by subscription.
+
+        Arguments:
+            registry {Registry} -- The registry to register the metrics.
+            subscription {str} -- The subscription path.
+        """
+        self.labels = (subscription,)
+        self.messages = registry.counter('pubsub_received_messages_total', 'Messages received.', ('subscription',))
+        self.bytes = registry.counter('pubsub_received_bytes_total', 'Bytes of message data received.', ('subscription',))
+        self.acks = registry.counter('pubsub_acked_messages_total', 'Messages ack.', ('subscription',))
+        self.nacks = registry.counter('pubsub_nacked_messages_total', 'Messages nack.', ('subscription',))
+        self.lag = registry.histogram('pubsub_end_to_end_lag_seconds', 'Seconds from publish to receipt.', ('subscription',))
+        self.callback = registry.histogram('pubsub_callback_duration_seconds', 'Seconds spent in the callback.', ('subscription',))
+        self.ack_latency = registry.histogram('pubsub_ack_latency_seconds', 'Seconds from receipt to ack.', ('subscription',))
+        self.inflight = registry.gauge('pubsub_inflight_messages', 'Messages received and not yet handled.', ('subscription',))
+
+    def received(self, message):
+        """Record a received message.
+
+        Returns:
+            float -- The receipt time.
+        """
+        now = time.time()
+        self.messages.inc(labels=self.labels)
+        self.bytes.inc(len(message.data), self.labels)
+        self.inflight.inc(labels=self.labels)
+        try:
+            self.lag.observe(now - to_timestamp(message.publish_time), self.labels)
+        except (AttributeError, TypeError, ValueError):
+            pass
+        return now
+
+    def called(self, started):
+        # the callback invoked at started has returned, excluding the time queued before it
+        self.callback.observe(time.time() - started, self.labels)
+
+    def handled(self, count=1):
+        # the messages are settled by the return value of the callback
+        self.inflight.dec(count, self.labels)
+
+    def nacked(self):
+        self.nacks.inc(labels=self.labels)
+
+    def acked(self, received):
+        self.acks.inc(labels=self.labels)
+        self.ack_latency.observe(time.time() - received, self.labels)
@@ -0,0 +1,169 @@
+# coding=utf-8
+#
+import os
+import six
+import json
+import time
+import logging
+import threading
+import concurrent.futures
+
+from soocii_pubsub_lib import pubsub_client
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceCache():
+    def __init__(self, path=None, ttl=3600):
+        """The resources confirmed to exist, which are skipped by ensure_resources() until ttl expires.
+
+        Keyword Arguments:
+            path {str} -- The JSON file to keep the cache across restarts, in memory only if None (default: {None})
+            ttl {float} -- The number of seconds a confirmed resource is trusted (default: {3600})
+        """
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.__confirmed = {}
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.__confirmed = json.load(f)
+            except (IOError, OSError, ValueError) as e:
+                logger.warning('ignore resource cache {}: {}'.format(path, e))
+
+    def fresh(self, key):
+        """Check if the resource is confirmed within ttl.
+
+        Arguments:
+            key {str} -- The resource path.
+
+        Returns:
+            bool -- True if the resource is confirmed within ttl.
+        """
+        with self.lock:
+            confirmed = self.__confirmed.get(key)
+            return confirmed is not None and time.time() - confirmed < self.ttl
+
+    def confirm(self, keys):
+        """Mark the resources as confirmed now, and save the cache file.
+
+        Arguments:
+            keys {iterable} -- The resource paths.
+        """
+        now = time.time()
+        with self.lock:
+            for key in keys:
+                self.__confirmed[key] = now
+            # drop the expired ones, and replace the cache file atomically
+            self.__confirmed = {key: confirmed for key, confirmed in self.__confirmed.items() if now - confirmed < self.ttl}
+            if self.path is None:
+                return
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(self.__confirmed, f)
+            getattr(os, 'replace', os.rename)(self.path + '.tmp', self.path)
+
+
+def load_manifest(manifest):
+    """Load the manifest of topics and subscriptions.
+
+        {
+            "topics": ["topic-a", {"name": "topic-b"}],
+            "subscriptions": [{"name": "sub-a", "topic": "topic-a", "ack_deadline_seconds": 30}]
+        }
+
+    The other keys of a topic or a subscription are passed to create_topic() or create_subscription() as settings.
+
+    Arguments:
+        manifest {dict|str} -- The manifest, or the path to its JSON file.
+
+    Raises:
+        ValueError -- If a subscription has no name or topic.
+
+    Returns:
+        (list, list) -- A tuple of the topic and subscription dictionaries.
+    """
+    if isinstance(manifest, six.string_types):
+        with open(manifest) as f:
+            manifest = json.load(f)
+    topics = [{'name': topic} if isinstance(topic, six.string_types) else dict(topic) for topic in manifest.get('topics', [])]
+    subscriptions = [dict(subscription) for subscription in manifest.get('subscriptions', [])]
+    for subscription in subscriptions:
+        if 'name' not in subscription or 'topic' not in subscription:
+            raise ValueError('subscription requires name and topic: {}.'.format(subscription))
+    return topics, subscriptions
+
+
+def ensure_resources(manifest, project, cred_json=None, transport=None, cache=None, max_workers=8):
+    """Create the topics and subscriptions of the manifest if they do not exist, see load_manifest().
+
+    The create requests are issued concurrently, topics before subscriptions, and an existing resource costs a single request.
+    The resources confirmed by the cache within its ttl are skipped, so that a warm restart does not call the admin API at all.
+
+    Arguments:
+        manifest {dict|str} -- The manifest, or the path to its JSON file.
+        project {str} -- Project id
+
+    Keyword Arguments:
+        cred_json {str} -- Full path to credential file in json format (default: {None})
+        transport {object} -- The transport to create the underlying clients, see PublisherClient (default: {None})
+        cache {ResourceCache} -- The cache of confirmed resources (default: {None} for no cache)
+        max_workers {int} -- The maximum number of requests in flight at once (default: {8})
+
+    Raises:
+        ValueError -- If the manifest is invalid.
+        google.api_core.exceptions.GoogleAPICallError -- If any request failed, raised after the others have completed.
+
+    Returns:
+        dict -- The resource paths which are created, already existing, and skipped by the cache.
+    """
+    topics, subscriptions = load_manifest(manifest)
+    publisher = pubsub_client.PublisherClient(project, cred_json, transport=transport)
+    subscriber = pubsub_client.SubscribeClient(project, cred_json, transport=transport)
+    result = {'created': [], 'existing': [], 'cached': []}
+
+    def create_topic(settings):
+        settings = dict(settings)
+        return publisher.create_topic(settings.pop('name'), **settings)
+
+    def create_subscription(settings):
+        # call the client directly, SubscribeClient.create_subscription() keeps the name on the shared instance
+        from google.api_core.exceptions import AlreadyExists
+        settings = dict(settings)
+        path = subscriber.subscription_path(settings.pop('name'))
+        topic = subscriber.topic_path(settings.pop('topic'))
+        try:
+            return subscriber.client.create_subscription(path, topic, **settings).name
+        except AlreadyExists:
+            logger.debug('subscription {} already exists.'.format(path))
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        error = None
+        for resources, path_of, create in ((topics, publisher.topic_path, create_topic),
+                                           (subscriptions, subscriber.subscription_path, create_subscription)):
+            futures = {}
+            for settings in resources:
+                path = path_of(settings['name'])
+                if cache is not None and cache.fresh(path):
+                    result['cached'].append(path)
+                else:
+                    futures[executor.submit(create, settings)] = path
+            confirmed = []
+            for future in concurrent.futures.as_completed(futures):
+                path = futures[future]
+                if future.exception() is not None:
+                    logger.error('failed to ensure {}: {}'.format(path, future.exception()))
+                    error = error or future.exception()
+                    continue
+                result['created' if future.result() is not None else 'existing'].append(path)
+                confirmed.append(path)
+            if cache is not None and confirmed:
+                cache.confirm(confirmed)
+            if error is not None:
+                # subscriptions may depend on the failed topics
+                raise error
+    finally:
+        executor.shutdown(wait=False)
+    logger.info('ensured {} resources: {}'.format(len(topics) + len(subscriptions), {k: len(v) for k, v in result.items()}))
+    return result
@@ -1,46 +1,284 @@
 # coding=utf-8
 import os
 import abc
+import time
 import six
-import json
+import inspect
 import logging
-# Imports the Google Cloud client library
-from google.cloud import pubsub_v1
-from google.oauth2 import service_account as sa
-
-from google.api_core.exceptions import AlreadyExists
+import threading
+import collections
+import concurrent.futures
+# NOTED: the Google Cloud client library is imported on first use, since importing it takes hundreds of milliseconds
+
+from soocii_pubsub_lib.flow import PublishFlowController
+from soocii_pubsub_lib.spool import SpoolReplayer
+from soocii_pubsub_lib.codec import PayloadEncoder
+from soocii_pubsub_lib.transport import GoogleTransport
+from soocii_pubsub_lib.batcher import MessageBatcher
+from soocii_pubsub_lib.message import Message, to_dict
+from soocii_pubsub_lib.metrics import PublisherMetrics, SubscriberMetrics
 
 logger = logging.getLogger(__name__)
 
+# return it from a callback to nack the message, which is redelivered immediately
+NACK = 'nack'
+
+# the maximum number of ack ids in a single acknowledge request
+MAX_ACK_IDS = 2500
+
+
+class NackError(Exception):
+    """Raise it from a callback to nack the message, which is redelivered immediately.
+    """
+
+
+# publishers shared by the process, see shared_publisher()
+_shared_publishers = {}
+_shared_lock = threading.Lock()
+_shared_pid = os.getpid()
+
+
+def shared_publisher(project, cred_json=None, **kwargs):
+    """Get the publisher shared by the whole process for the project, credentials and settings, which is created on first use.
+    Every request handler reuses one warmed-up channel instead of constructing new clients,
+    and the channel is rebuilt in each worker of a pre-fork web server, e.g. gunicorn or uwsgi.
+
+    Arguments:
+        project {str} -- Project id
+
+    Keyword Arguments:
+        cred_json {str} -- Full path to credential file in json format (default: {None})
+        kwargs -- The settings of the publisher, see PublisherClient. They have to be hashable.
+
+    Returns:
+        PublisherClient -- The shared publisher.
+    """
+    global _shared_lock, _shared_pid
+    if _shared_pid != os.getpid():
+        # the lock may be held by a thread of the parent process at fork
+        _shared_lock = threading.Lock()
+        _shared_pid = os.getpid()
+    key = (project, cred_json, tuple(sorted(kwargs.items())))
+    with _shared_lock:
+        publisher = _shared_publishers.get(key)
+        if publisher is None:
+            publisher = _shared_publishers[key] = PublisherClient(project, cred_json, **kwargs)
+        return publisher
+
+
+# parsed service account credentials by file path, see load_credentials()
+_credentials = {}
+_credentials_lock = threading.Lock()
+
+
+def load_credentials(cred_json):
+    """Load the service account credentials from the file, which is parsed once per path in the process.
+
+    Arguments:
+        cred_json {str} -- Full path to credential file in json format
+
+    Returns:
+        google.oauth2.service_account.Credentials -- The credentials.
+    """
+    with _credentials_lock:
+        credentials = _credentials.get(cred_json)
+        if credentials is None:
+            from google.oauth2 import service_account
+            credentials = _credentials[cred_json] = service_account.Credentials.from_service_account_file(cred_json)
+        return credentials
+
+
+def iscoroutinefunction(func):
+    # coroutine functions are only available since python 3.5
+    return getattr(inspect, 'iscoroutinefunction', lambda func: False)(func)
+
 
 @six.add_metaclass(abc.ABCMeta)
 class PubSubBase():
-    def __init__(self, project, cred_json):
+    def __init__(self, project, cred_json, transport=None):
         self.project = project
-        self.cred = None if cred_json is None else sa.Credentials.from_service_account_file(cred_json)
+        self.cred_json = cred_json
+        self.transport = GoogleTransport() if transport is None else transport
+        # the underlying client is created on first use by the process which owns it, see client
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._pid = os.getpid()
+
+    @property
+    def cred(self):
+        return None if self.cred_json is None else load_credentials(self.cred_json)
+
+    @property
+    def client(self):
+        """The underlying client, which is created on the first RPC rather than on construction.
+        It is rebuilt in a forked process, e.g. a pre-fork web server worker,
+        since the channel inherited from the parent process hangs or is shared with the parent.
+        """
+        if self._pid != os.getpid():
+            self.__on_forked()
+        client = self._client
+        if client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._create_client()
+                client = self._client
+        return client
+
+    def __on_forked(self):
+        logger.info('rebuild {} in forked process {}.'.format(type(self).__name__, os.getpid()))
+        self._pid = os.getpid()
+        self._client = None
+        # the lock may be held by a thread of the parent process at fork
+        self._client_lock = threading.Lock()
+        self._after_fork()
+
+    @abc.abstractmethod
+    def _create_client(self):
+        pass
+
+    def _after_fork(self):
+        # reset the states inherited from the parent process, whose threads do not exist in this process
+        pass
+
+    def topic_path(self, *args):
+        """Get the resource path of a topic, which contains the project ID and the topic name.
+
+        Arguments:
+            topic {str} -- The topic name. The call form of the previous versions, i.e. topic_path(client, topic),
+                           is still accepted, and the client is ignored.
+
+        Returns:
+            str -- The topic path.
+        """
+        return 'projects/{}/topics/{}'.format(self.project, _last_argument('topic_path', args))
+
+    def subscription_path(self, *args):
+        """Get the resource path of a subscription, which contains the project ID and the subscription name.
+
+        Arguments:
+            subscription_name {str} -- The subscription name. The call form of the previous versions, i.e. subscription_path(client, name),
+                                       is still accepted, and the client is ignored.
+
+        Returns:
+            str -- The subscription path.
+        """
+        return 'projects/{}/subscriptions/{}'.format(self.project, _last_argument('subscription_path', args))
+
+
+def _last_argument(name, args):
+    # the name of topic_path(name) or topic_path(client, name)
+    if len(args) not in (1, 2):
+        raise TypeError('{}() takes 1 or 2 positional arguments but {} were given.'.format(name, len(args)))
+    return args[-1]
 
-    def topic_path(self, client, topic):
-        # The resource path for the new topic contains the project ID
-        # and the topic name.
-        return client.topic_path(self.project, topic)
 
-    def subscription_path(self, client, subscription_name):
-        return client.subscription_path(self.project, subscription_name)
+class TopicPublisher(object):
+    """A publisher bound to a single topic, see PublisherClient.topic().
+
+    The resolved topic path is cached and the publish path does nothing but hand the message over to the underlying client,
+    i.e. no payload type check, no per-message logging and no blocking unless the publisher has flow control.
+    The payload is encoded if the publisher has a codec.
+    """
+    __slots__ = ('name', 'path', '_send', '_encode')
+
+    def __init__(self, publisher, name):
+        self.name = name
+        self.path = publisher.topic_path(name)
+        self._send = publisher._send
+        self._encode = None if publisher.encoder is None else publisher.encoder.encode
+
+    def publish(self, payload, **kwargs):
+        """Publish a message to the bound topic asynchronously. Use PublisherClient.flush() to wait for it.
+
+        Arguments:
+            payload {bytes} -- A bytestring representing the message body.
+
+        Keyword Arguments:
+            kwargs -- If you want to include attributes, simply add keyword arguments
+
+        Raises:
+            TypeError -- If payload is not a bytestring, raised by the underlying client.
+            FlowControlLimitError -- If the outstanding messages reach the limits of the publisher.
+
+        Returns:
+            concurrent.futures.Future -- A future which resolves to the message id.
+        """
+        if self._encode is not None:
+            payload, kwargs = self._encode(payload, kwargs)
+        return self._send(self.path, payload, kwargs)
+
+    def __repr__(self):
+        return 'TopicPublisher({})'.format(self.path)
 
 
 class PublisherClient(PubSubBase):
-    def __init__(self, project, cred_json):
+    def __init__(self, project, cred_json, max_messages=None, max_bytes=None, max_latency=None, codec=None, compress_threshold=None, metrics=None,
+                 transport=None, max_outstanding_messages=None, max_outstanding_bytes=None, overflow='block', overflow_timeout=None,
+                 spool=None):
         """A wrapped publisher client for Google Cloud Pub/Sub.
 
         This creates an object that is capable of publishing messages. Generally, you can instantiate this client with no arguments, and you get sensible defaults.
+        Messages are grouped into batches before being sent; a batch is committed as soon as any of the batch settings is reached.
+        If codec or compress_threshold is provided, payloads are encoded by the codec and compressed above the threshold,
+        and SubscribeClient decodes them before the callback.
 
         Arguments:
             project {str} -- Project id
             cred_json {str} -- Full path to credential file in json format
+
+        Keyword Arguments:
+            max_messages {int} -- The maximum number of messages in a batch (default: {None} for library default)
+            max_bytes {int} -- The maximum total size of the messages in a batch, in bytes (default: {None} for library default)
+            max_latency {float} -- The maximum number of seconds to wait for more messages before committing a batch (default: {None} for library default)
+            codec {str} -- The payload codec, one of raw, json, msgpack or a registered codec (default: {None} for bytestring payloads)
+            compress_threshold {int} -- Compress the encoded payloads larger than this number of bytes with zlib (default: {None})
+            metrics {soocii_pubsub_lib.metrics.Registry} -- The registry to record publish metrics in (default: {None})
+            transport {object} -- The transport to create the underlying client, e.g. soocii_pubsub_lib.memory.Broker (default: {None} for Google Cloud Pub/Sub)
+            max_outstanding_messages {int} -- The maximum number of messages published and not yet returned (default: {None} for no limit)
+            max_outstanding_bytes {int} -- The maximum total size of messages published and not yet returned (default: {None} for no limit)
+            overflow {str} -- The policy as the outstanding limits are reached, one of block, error and drop_oldest,
+                              see soocii_pubsub_lib.flow.PublishFlowController (default: {'block'})
+            overflow_timeout {float} -- The maximum number of seconds to block in block policy (default: {None} for forever)
+            spool {soocii_pubsub_lib.spool.Spool} -- The spool to keep the messages which fail to publish, they are replayed
+                                                     in background once the broker is healthy again (default: {None})
         """
-        super(PublisherClient, self).__init__(project, cred_json)
-        # Instantiates a client
-        self.client = pubsub_v1.PublisherClient(credentials=self.cred)
+        super(PublisherClient, self).__init__(project, cred_json, transport)
+        # only override the batch settings which are given explicitly
+        settings = {'max_messages': max_messages, 'max_bytes': max_bytes, 'max_latency': max_latency}
+        self.batch_settings = {k: v for k, v in settings.items() if v is not None}
+        if codec is None and compress_threshold is None:
+            self.encoder = None
+        else:
+            self.encoder = PayloadEncoder(codec or 'raw', compress_threshold=compress_threshold)
+        self.metrics = None if metrics is None else PublisherMetrics(metrics)
+        if max_outstanding_messages is None and max_outstanding_bytes is None:
+            self.flow_control = None
+        else:
+            self.flow_control = PublishFlowController(max_outstanding_messages, max_outstanding_bytes, overflow, overflow_timeout)
+        # outstanding publish futures, used by flush()
+        self.__pending = 0
+        self.__pending_cond = threading.Condition()
+        self.spool = spool
+        self.replayer = None
+        if spool is not None:
+            self.replayer = SpoolReplayer(spool, self._deliver)
+            self.replayer.start()
+
+    def _create_client(self):
+        return self.transport.publisher(self.batch_settings, self.cred)
+
+    def _after_fork(self):
+        # futures of the parent process never resolve in this process
+        self.__pending = 0
+        self.__pending_cond = threading.Condition()
+        if self.flow_control is not None:
+            flow_control = self.flow_control
+            self.flow_control = PublishFlowController(flow_control.max_messages, flow_control.max_bytes, flow_control.policy, flow_control.timeout)
+        if self.spool is not None:
+            # a spool directory is owned by a single process
+            logger.warning('spool {} is not used in forked process {}.'.format(self.spool.directory, os.getpid()))
+            self.spool = None
+            self.replayer = None
 
     def create_topic(self, topic, **kwargs):
         """Creates the given topic with the given name.
@@ -54,7 +292,8 @@ class PublisherClient(PubSubBase):
         Returns:
             str -- A topic name
         """
-        topic = self.topic_path(self.client, topic)
+        from google.api_core.exceptions import AlreadyExists
+        topic = self.topic_path(topic)
         try:
             return self.client.create_topic(topic, **kwargs).name
         except AlreadyExists:
@@ -77,18 +316,30 @@ class PublisherClient(PubSubBase):
         Returns:
             str -- A topic name
         """
-        topic = self.topic_path(self.client, topic)
+        topic = self.topic_path(topic)
         return self.client.get_topic(topic, **kwargs).name
 
+    def topic(self, topic):
+        """Get a publisher bound to the given topic.
+        The topic path is resolved once, which makes it suitable for publishing messages in a hot loop.
+
+        Arguments:
+            topic {str} -- The topic name to publish messages to.
+
+        Returns:
+            TopicPublisher -- A publisher bound to the topic.
+        """
+        return TopicPublisher(self, topic)
+
     def __on_published(self, future, callback):
         logger.debug('callback for publish message')
         message_id = None
         if future.cancelled():
-            logger.warn('{}: canceled'.format(future.arg))
+            logger.warn('publish canceled')
         elif future.done():
             error = future.exception()
             if error:
-                logger.error('{}: error returned: {}'.format(future.arg, error))
+                logger.error('error returned: {}'.format(error))
             else:
                 message_id = future.result()
                 logger.info('data has been publised with message id {}.'.format(message_id))
@@ -96,6 +347,53 @@ class PublisherClient(PubSubBase):
         if callback is not None:
             callback(message_id)
 
+    def __on_settled(self, future):
+        with self.__pending_cond:
+            self.__pending -= 1
+            if self.__pending == 0:
+                self.__pending_cond.notify_all()
+
+    def _encode(self, payload, attributes):
+        if self.encoder is not None:
+            return self.encoder.encode(payload, attributes)
+        dtype = type(payload)
+        if dtype is not bytes:
+            raise ValueError('unexpected data type which is {}, please input bytestring instead.'.format(dtype))
+        return payload, attributes
+
+    def __on_failed(self, future, topic, payload, attributes):
+        if future.cancelled() or future.exception() is None:
+            return
+        try:
+            self.spool.append(topic, payload, attributes)
+            logger.warning('spool message to {} which failed to publish: {}'.format(topic, future.exception()))
+        except Exception as e:
+            logger.error('failed to spool message to {}: {}'.format(topic, e))
+
+    def _send(self, topic, payload, attributes, block=True):
+        # publish the message, and keep it in the spool if it fails
+        future = self._deliver(topic, payload, attributes, block)
+        if self.spool is not None:
+            future.add_done_callback(lambda future: self.__on_failed(future, topic, payload, attributes))
+        return future
+
+    def _deliver(self, topic, payload, attributes, block=True):
+        # hand over the message to the underlying client under flow control, and track its future
+        if self.flow_control is None:
+            future = self.client.publish(topic, payload, **attributes)
+        else:
+            future = self.flow_control.admit(len(payload), lambda: self.client.publish(topic, payload, **attributes), block)
+        return self._track(future, topic, len(payload))
+
+    def _track(self, future, topic, size):
+        with self.__pending_cond:
+            self.__pending += 1
+        future.add_done_callback(self.__on_settled)
+        if self.metrics is not None:
+            start = time.time()
+            future.add_done_callback(lambda future: self.metrics.published(topic, size, start, future))
+        return future
+
     def publish(self, topic, payload, callback=None, **kwargs):
         """To publish a message, use the publish() method. This method accepts two positional arguments:
         the topic to publish to, and the payload of the message.
@@ -103,10 +401,11 @@ class PublisherClient(PubSubBase):
         If callback is provided, this method invoke in async way and return message_id through callback.
         If callback is NOT provided, this method invoke in sync way and return message_id.
         Either async or sync way invokation, this method return tuple (message_id, future)
+        If the publisher has a spool, a message which fails to publish is kept in the spool, and message_id is None.
 
         Arguments:
             topic {str} -- The topic name to publish messages to.
-            payload -- A bytestring representing the message body.
+            payload -- A bytestring representing the message body, or any object supported by the codec.
 
         Keyword Arguments:
             callback {function} -- An optional callback (default: {None})
@@ -121,12 +420,10 @@ class PublisherClient(PubSubBase):
         """
         try:
             logger.debug('publish message to %s, pid: %s', topic, os.getpid())
-            dtype = type(payload)
-            if dtype is not bytes:
-                raise ValueError('unexpected data type which is {}, please input bytestring instead.'.format(dtype))
-            topic = self.topic_path(self.client, topic)
+            payload, kwargs = self._encode(payload, kwargs)
+            topic = self.topic_path(topic)
             logger.debug('Execute client.publish. pid: %s.', os.getpid())
-            future = self.client.publish(topic, payload, **kwargs)
+            future = self._send(topic, payload, kwargs)
             logger.debug('Executed client.publish. pid: %s.', os.getpid())
 
             # async call
@@ -136,6 +433,9 @@ class PublisherClient(PubSubBase):
             # sync call
             else:
                 logger.debug('Execute future.result. pid: %s.', os.getpid())
+                if self.spool is not None and future.exception() is not None:
+                    # kept in the spool and published later
+                    return None, future
                 message_id = future.result()
                 logger.info('data has been publised with message id {}.'.format(message_id))
                 return message_id, future
@@ -143,9 +443,91 @@ class PublisherClient(PubSubBase):
             logger.exception('unexpected exception was caughted: {}'.format(e))
             raise e
 
+    def publish_many(self, topic, payloads, attributes=None, callback=None):
+        """Publish a sequence of messages to the given topic without waiting for any of them.
+        The messages are pipelined into batches according to the batch settings of this client,
+        use flush() to wait for all of them to be published.
+
+        Arguments:
+            topic {str} -- The topic name to publish messages to.
+            payloads {iterable} -- The bytestrings representing the message bodies, or any objects supported by the codec.
+
+        Keyword Arguments:
+            attributes {dict|list} -- Attributes of the messages. A dict is applied to every message,
+                                      a list provides the attributes of each message in order. (default: {None})
+            callback {function} -- An optional callback, which is invoked with message_id of each message (default: {None})
+
+        Raises:
+            ValueError -- If any payload is not a bytestring without codec, or attributes do not match payloads.
+
+        Returns:
+            list -- A list of futures, one for each message in order.
+        """
+        payloads = list(payloads)
+        if attributes is None or isinstance(attributes, dict):
+            attributes = [attributes or {}] * len(payloads)
+        else:
+            attributes = list(attributes)
+            if len(attributes) != len(payloads):
+                raise ValueError('got {} attributes for {} payloads.'.format(len(attributes), len(payloads)))
+        messages = [self._encode(payload, attrs) for payload, attrs in zip(payloads, attributes)]
+
+        topic = self.topic_path(topic)
+        logger.debug('publish {} messages to {}'.format(len(payloads), topic))
+        futures = []
+        for payload, attrs in messages:
+            future = self._send(topic, payload, attrs)
+            if callback is not None:
+                future.add_done_callback(lambda future: self.__on_published(future, callback))
+            futures.append(future)
+        return futures
+
+    def outstanding(self):
+        """Get the current queue depth of the publisher, e.g. for autoscaling decisions.
+
+        Returns:
+            dict -- The number of messages not yet returned, and the flow control depth if the limits are set,
+                    see soocii_pubsub_lib.flow.PublishFlowController.depth().
+        """
+        depth = {} if self.flow_control is None else self.flow_control.depth()
+        depth['pending'] = self.__pending
+        return depth
+
+    def flush(self, timeout=None):
+        """Block until all messages published asynchronously by this client are either published or failed.
+
+        Keyword Arguments:
+            timeout {float} -- The maximum number of seconds to wait, wait forever if None (default: {None})
+
+        Returns:
+            bool -- True if there is no outstanding message, False if timeout was reached.
+        """
+        with self.__pending_cond:
+            if timeout is None:
+                while self.__pending > 0:
+                    self.__pending_cond.wait()
+            else:
+                deadline = time.time() + timeout
+                while self.__pending > 0:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self.__pending_cond.wait(remaining)
+            return self.__pending == 0
+
+    def close(self, timeout=None):
+        """Stop replaying the spool, the spooled messages are replayed by the next publisher with the same spool directory.
+
+        Keyword Arguments:
+            timeout {float} -- The maximum number of seconds to wait for the replayer to stop (default: {None} for forever)
+        """
+        if self.replayer is not None:
+            self.replayer.stop(timeout)
+            self.spool.close()
+
 
 class SubscribeClient(PubSubBase):
-    def __init__(self, project, cred_json):
+    def __init__(self, project, cred_json, transport=None):
         """A wrapped subscriber client for Google Cloud Pub/Sub.
 
         This creates an object that is capable of subscribing to messages. Generally, you can instantiate this client with no arguments, and you get sensible defaults.
@@ -153,35 +535,213 @@ class SubscribeClient(PubSubBase):
         Arguments:
             project {str} -- Project id
             cred_json {str} -- Full path to credential file in json format
+
+        Keyword Arguments:
+            transport {object} -- The transport to create the underlying client, e.g. soocii_pubsub_lib.memory.Broker (default: {None} for Google Cloud Pub/Sub)
         """
-        super(SubscribeClient, self).__init__(project, cred_json)
-        # Instantiates a client
-        self.client = pubsub_v1.SubscriberClient(credentials=self.cred)
+        super(SubscribeClient, self).__init__(project, cred_json, transport)
+        # streaming pull future, created by open()
+        self.future = None
+        # event loop for coroutine callbacks, created on demand
+        self.event_loop = None
+        # buffer of messages in batch mode
+        self.batcher = None
+        # worker processes to run callbacks on
+        self.process_pool = None
+        # how a received message is handed over to the callback
+        self.__to_message = to_dict
+        # cache of ack messages to skip redelivered ones
+        self.dedup = None
+        # serial lanes to handle messages in order by key
+        self.lanes = None
+        # metrics of received messages
+        self.metrics = None
+        # nack the message if the callback raises an exception
+        self.nack_on_error = False
+        # retry the messages whose callback raises with backoff
+        self.retry = None
+        # limit the rate and the concurrency of callbacks
+        self.rate_limit = None
+        self.concurrency = None
+        # messages handed over to the callback and not yet settled, by id
+        self.__inflight = {}
+        self.__inflight_cond = threading.Condition()
+        self.__draining = False
+        self.__rejected = 0
+        # messages received while draining, held until close()
+        self.__held = []
+
+    def _create_client(self):
+        return self.transport.subscriber(self.cred)
+
+    def _after_fork(self):
+        # the streaming pull and its threads belong to the parent process
+        self.future = None
+        self.event_loop = None
+        self.batcher = None
+        self.__inflight = {}
+        self.__inflight_cond = threading.Condition()
+        self.__held = []
+
+    def __acquire(self, message):
+        # track the message in flight, or hold it while draining
+        with self.__inflight_cond:
+            if not self.__draining:
+                self.__inflight[id(message)] = message
+                return True
+            # neither handed over nor nack, so its lease keeps the flow control full, which pauses the pull,
+            # instead of a nack which is redelivered to this stream at once
+            self.__held.append(message)
+            self.__rejected += 1
+        return False
+
+    def __release(self, message):
+        # stop tracking the message, False if it has been nack by drain()
+        with self.__inflight_cond:
+            if self.__inflight.pop(id(message), None) is None:
+                return False
+            if not self.__inflight:
+                self.__inflight_cond.notify_all()
+        return True
+
+    def __on_error(self, error):
+        if isinstance(error, NackError):
+            return NACK
+        logger.error('unexpected exception was caughted {}.'.format(error))
+        if self.retry is not None:
+            # settled by the retry policy
+            return error
+        return NACK if self.nack_on_error else None
+
+    def __on_handled(self, future, settle, started):
+        # a coroutine callback or a callback in a worker process has returned
+        if self.metrics is not None:
+            self.metrics.called(started)
+        if future.cancelled():
+            settle(None)
+            return
+        error = future.exception()
+        settle(future.result() if error is None else self.__on_error(error))
+
+    def __invoke(self, callback, item, settle):
+        started = time.time()
+        try:
+            ack = callback(item)
+        except Exception as e:
+            ack = self.__on_error(e)
+        if self.metrics is not None:
+            self.metrics.called(started)
+        settle(ack)
+
+    def __settle(self, message, ack, received=None):
+        if not self.__release(message):
+            # nack by drain() already
+            return
+        if ack is True:
+            # only ack message on callback return True
+            message.ack()
+            if self.dedup is not None:
+                self.dedup.add(self.dedup.key_of(message))
+            if received is not None:
+                self.metrics.acked(received)
+            if self.retry is not None:
+                self.retry.succeeded(message)
+        elif isinstance(ack, six.string_types) and ack == NACK:
+            # redeliver immediately instead of waiting for the ack deadline
+            message.nack()
+            if received is not None:
+                self.metrics.nacked()
+        elif isinstance(ack, Exception):
+            self.retry.failed(message, ack)
+
+    def __on_settle(self, message, ack, received):
+        if received is not None:
+            self.metrics.handled()
+        self.__settle(message, ack, received)
+
+    def __on_settle_batch(self, entries, acks):
+        if self.metrics is not None:
+            self.metrics.handled(len(entries))
+        if not isinstance(acks, (list, tuple)):
+            acks = [acks] * len(entries)
+        elif len(acks) != len(entries):
+            # settle every message of the batch, otherwise the rest stay in flight until drain()
+            logger.error('callback returned {} acks for a batch of {} messages, nack the rest.'.format(len(acks), len(entries)))
+            acks = list(acks[:len(entries)]) + [NACK] * (len(entries) - len(acks))
+        # ack the messages one by one, in the same order of the batch
+        for (message, received), ack in zip(entries, acks):
+            self.__settle(message, ack, received)
+
+    def __dispatch(self, callback, item, settle, count, size):
+        if self.rate_limit is not None:
+            self.rate_limit.acquire(count, size)
+        if self.concurrency is not None:
+            settle = self.concurrency.track(settle)
+        if self.event_loop is None and self.process_pool is None and self.lanes is None:
+            self.__invoke(callback, item, settle)
+            return
+        started = time.time()
+        try:
+            if self.event_loop is not None:
+                # run the coroutine on the event loop without holding this thread
+                future = self.event_loop.submit(callback(item))
+            elif self.process_pool is not None:
+                # run the callback in a worker process, and settle the message in this process
+                future = self.process_pool.submit(callback, item)
+            else:
+                # run the callback in the lane of its key, after the previous messages of the same key
+                self.lanes.submit(item, lambda: self.__invoke(callback, item, settle))
+                return
+        except Exception as e:
+            # e.g. a closed event loop or a broken process pool, nack the messages and release their concurrency slot
+            logger.error('failed to hand over messages to the callback: {}'.format(e))
+            settle(NACK)
+            return
+        future.add_done_callback(lambda future: self.__on_handled(future, settle, started))
+
+    def __on_batch(self, entries, callback):
+        logger.debug('handle a batch of {} messages.'.format(len(entries)))
+        items = [self.__to_message(message) for message, _ in entries]
+        size = sum(len(message.data) for message, _ in entries)
+        self.__dispatch(callback, items, lambda acks: self.__on_settle_batch(entries, acks), len(entries), size)
+
+    def __is_duplicate(self, message):
+        if self.dedup is not None and self.dedup.seen(self.dedup.key_of(message)):
+            # the message has been handled, ack the redelivery without invoking the callback
+            logger.debug('skip duplicated message {}.'.format(message.message_id))
+            message.ack()
+            return True
+        return False
+
+    def __on_batched(self, message):
+        batcher = self.batcher
+        if batcher is not None and not self.__is_duplicate(message) and self.__acquire(message):
+            received = None if self.metrics is None else self.metrics.received(message)
+            batcher.add((message, received), len(message.data))
 
     def __on_received(self, message, callback):
         # A message data and its attributes.
         # The message payload must not be empty; it must contain either a non-empty data field, or at least one attribute.
         # https://googlecloudplatform.github.io/google-cloud-python/latest/pubsub/types.html#google.cloud.pubsub_v1.types.PubsubMessage
-        logger.info('message has been received, which is published at {}.'.format(message.publish_time))
-        logger.debug('message content is {}.'.format(message))
+        if logger.isEnabledFor(logging.INFO):
+            logger.info('message has been received, which is published at {}.'.format(message.publish_time))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('message content is {}.'.format(message))
         # callback custom
         try:
+            if self.__is_duplicate(message):
+                return
             if callback is not None:
-                # convert attributes into dict type
-                attributes = {attr: message.attributes[attr] for attr in message.attributes}
-                dup_msg = {
-                    'message_id': message.message_id,
-                    'data': message.data,
-                    'attributes': attributes
-                }
-                ack = callback(dup_msg)
-                if ack is True:
-                    # only ack message on callback return True
-                    message.ack()
+                if not self.__acquire(message):
+                    return
+                dup_msg = self.__to_message(message)
+                received = None if self.metrics is None else self.metrics.received(message)
+                self.__dispatch(callback, dup_msg, lambda ack: self.__on_settle(message, ack, received), 1, len(message.data))
             else:
                 # alway ack message on received
                 message.ack()
         except Exception as e:
+            self.__release(message)
             logger.error('unexpected exception was caughted {}.'.format(e))
 
     def create_subscription(self, topic, subscription_name, **kwargs):
@@ -195,31 +755,268 @@ class SubscribeClient(PubSubBase):
             retry {google.api_core.retry.Retry]} -- An optional retry object used to retry requests. If None is specified, requests will not be retried.
 
         Returns:
-            Subscription -- A Subscription instance.
+            str -- A subscription name, None if the subscription already exists.
         """
-        topic = self.topic_path(self.client, topic)
-        self.subscription_name = self.subscription_path(self.client, subscription_name)
+        from google.api_core.exceptions import AlreadyExists
+        topic = self.topic_path(topic)
+        self.subscription_name = self.subscription_path(subscription_name)
         try:
-            self.client.create_subscription(self.subscription_name, topic, **kwargs)
+            return self.client.create_subscription(self.subscription_name, topic, **kwargs).name
         except AlreadyExists:
             logger.debug('subscription {} already exists.'.format(self.subscription_name))
 
-    def open(self, callback=None):
+    def open(self, callback=None, max_messages=None, max_bytes=None, max_lease_duration=None, executor=None, scheduler=None,
+             batch_size=None, batch_bytes=None, batch_latency=1.0, process_pool=None, message_view=False, dedup=None, lanes=None,
+             metrics=None, nack_on_error=False, ack_batch_size=None, ack_batch_latency=None, retry=None, rate_limit=None, concurrency=None):
         """Open a streaming pull connection and begin receiving messages.
         If callback is provided, the message is ack as the callback function return True.
+        If the callback returns NACK or raises NackError, the message is nack and redelivered immediately, instead of after its ack deadline.
         If callback is NOT provided, the message is always ack by default.
+        If callback is a coroutine function (async def), it runs on a dedicated event loop instead of the pulling threads,
+        so the number of messages handled at once is not bound to the number of threads.
+
+        The flow control settings bound the messages which are received but not yet ack, the pull is paused once any of them is reached.
+        The leases of these messages are extended automatically until they are ack or nack, or max_lease_duration is reached,
+        so a callback running longer than the ack deadline is not redelivered meanwhile.
+        The ack and nack requests are coalesced by the underlying client, which sends them at most ack_batch_size at once every ack_batch_latency seconds.
+
+        If batch_size is provided, the callback receives a list of dictionaries instead, once per batch.
+        The messages of a batch are all ack as the callback returns True, all nack as it returns NACK,
+        or one by one as the callback returns a list of True or NACK in the same order, the messages beyond a shorter list are nack.
+        NOTED: max_messages has to be larger than batch_size, otherwise the batch is only flushed by batch_latency.
+
+        If process_pool is provided, the callback runs in the worker processes, and the message is ack in this process as the callback returns True.
+        The callback has to be picklable, i.e. a module level function.
+
+        If message_view is True, the callback receives a read-only Message view instead of a copied dictionary, see soocii_pubsub_lib.message.Message.
+        The data of messages published with a codec is decoded before the callback.
+
+        If dedup is provided, the redelivery of a message which has been ack is ack again without invoking the callback.
+
+        If lanes is provided, the messages of the same key are handled one by one in the received order, while different keys are handled in parallel.
+        The messages are handed over to the lanes by a single thread in the received order, so executor and scheduler can not be given with lanes.
+
+        If rate_limit or concurrency is provided, the callback waits for its turn, which protects the downstream of the callback,
+        e.g. during a replay or a backlog drain. The pull is paused meanwhile as the flow control limits are reached.
 
         Keyword Arguments:
             callback {function} -- The callback function. This function receives the dictionary as its only argument.
                                     The message is ack as the callback function return True. (default: {None})
+            max_messages {int} -- The maximum number of outstanding messages (default: {None} for library default)
+            max_bytes {int} -- The maximum total size of outstanding messages, in bytes (default: {None} for library default)
+            max_lease_duration {int} -- The maximum number of seconds to hold the lease of a message (default: {None} for library default)
+            executor {concurrent.futures.ThreadPoolExecutor} -- The executor to run callbacks on (default: {None} for library default)
+            scheduler {google.cloud.pubsub_v1.subscriber.scheduler.Scheduler} -- The scheduler to run callbacks on, overrides executor (default: {None})
+            batch_size {int} -- The maximum number of messages in a batch, enables batch mode (default: {None})
+            batch_bytes {int} -- The maximum total size of the message data in a batch, in bytes (default: {None})
+            batch_latency {float} -- The maximum number of seconds to wait for more messages before handling a batch (default: {1.0})
+            process_pool {concurrent.futures.ProcessPoolExecutor} -- The worker processes to run callbacks on (default: {None})
+            message_view {bool} -- Hand over the messages as Message views without copying (default: {False})
+            dedup {soocii_pubsub_lib.dedup.DedupCache} -- The cache of ack messages (default: {None})
+            lanes {soocii_pubsub_lib.lanes.OrderedDispatcher} -- The serial lanes to handle messages by key (default: {None})
+            metrics {soocii_pubsub_lib.metrics.Registry} -- The registry to record subscribe metrics in (default: {None})
+            nack_on_error {bool} -- Nack the message if the callback raises an exception (default: {False})
+            ack_batch_size {int} -- The maximum number of ack ids in an ack or modack request (default: {None} for library default)
+            ack_batch_latency {float} -- The maximum number of seconds to coalesce ack requests (default: {None} for library default)
+            retry {soocii_pubsub_lib.retry.RetryPolicy} -- Retry the message with backoff if the callback raises an exception,
+                                                          and dead-letter it after the maximum attempts, overrides nack_on_error (default: {None})
+            rate_limit {soocii_pubsub_lib.limiter.RateLimiter} -- The limit of messages and bytes per second handed over to the callback (default: {None})
+            concurrency {soocii_pubsub_lib.limiter.AdaptiveConcurrency} -- The adaptive limit of callbacks running at once (default: {None})
+
+        Raises:
+            ValueError -- If the callback is missing in batch mode, or a coroutine callback is given with a process pool,
+                          or lanes are given with a coroutine callback, a process pool, an executor, a scheduler or in batch mode.
 
         Returns:
             concurrent.futures.Future -- A future that provides an interface to block on the subscription if desired, and handle errors.
         """
-        self.future = self.client.subscribe(self.subscription_name, lambda message: self.__on_received(message, callback))
+        if process_pool is not None and iscoroutinefunction(callback):
+            raise ValueError('coroutine callback can not run in a process pool.')
+        if lanes is not None and (iscoroutinefunction(callback) or process_pool is not None or batch_size is not None):
+            raise ValueError('lanes only support synchronous callback of single message.')
+        if lanes is not None and (executor is not None or scheduler is not None):
+            raise ValueError('lanes run on a single-threaded scheduler, executor and scheduler are not supported.')
+        self.process_pool = process_pool
+        self.lanes = lanes
+        self.__to_message = Message if message_view else to_dict
+        self.dedup = dedup
+        self.metrics = None if metrics is None else SubscriberMetrics(metrics, self.subscription_name)
+        if iscoroutinefunction(callback) and self.event_loop is None:
+            from soocii_pubsub_lib import aio
+            self.event_loop = aio.EventLoopThread().start()
+        self.nack_on_error = nack_on_error
+        self.retry = retry
+        self.rate_limit = rate_limit
+        self.concurrency = concurrency
+        with self.__inflight_cond:
+            self.__draining = False
+            self.__rejected = 0
+            self.__held = []
+        from google.cloud import pubsub_v1
+        from google.cloud.pubsub_v1.subscriber.scheduler import ThreadScheduler
+        # only override the flow control settings which are given explicitly
+        settings = {'max_messages': max_messages, 'max_bytes': max_bytes, 'max_lease_duration': max_lease_duration,
+                    'max_request_batch_size': ack_batch_size, 'max_request_batch_latency': ack_batch_latency}
+        for name in ('max_request_batch_size', 'max_request_batch_latency'):
+            if settings[name] is not None and name not in pubsub_v1.types.FlowControl._fields:
+                logger.warning('{} is not supported by this version of google-cloud-pubsub, ignored.'.format(name))
+                settings[name] = None
+        flow_control = pubsub_v1.types.FlowControl(**{k: v for k, v in settings.items() if v is not None})
+        if scheduler is None and executor is not None:
+            scheduler = ThreadScheduler(executor=executor)
+        if lanes is not None:
+            # hand over the messages to the lanes in the received order, a pool of callback threads may reorder them
+            scheduler = ThreadScheduler(executor=concurrent.futures.ThreadPoolExecutor(max_workers=1))
+        if batch_size is not None:
+            if callback is None:
+                raise ValueError('callback is required in batch mode.')
+            self.batcher = MessageBatcher(lambda messages: self.__on_batch(messages, callback),
+                                          max_messages=batch_size, max_bytes=batch_bytes, max_latency=batch_latency)
+            on_received = self.__on_batched
+        else:
+            on_received = (lambda message: self.__on_received(message, callback))
+        self.future = self.client.subscribe(self.subscription_name, on_received, flow_control=flow_control, scheduler=scheduler)
         return self.future
 
+    def pull(self, max_messages=100, timeout=10.0):
+        """Pull a batch of messages synchronously, without a streaming pull connection, e.g. for batch jobs.
+        The messages are leased until their ack deadline, and are NOT ack automatically, see acknowledge().
+
+        Keyword Arguments:
+            max_messages {int} -- The maximum number of messages to pull (default: {100})
+            timeout {float} -- The maximum number of seconds to wait for messages (default: {10.0})
+
+        Returns:
+            list -- A list of dictionaries as the callback of open() receives, with ack_id of each message in addition.
+                    An empty list if there is no message before timeout.
+        """
+        from google.api_core.exceptions import DeadlineExceeded
+        try:
+            response = self.client.pull(subscription=self.subscription_name, max_messages=max_messages, timeout=timeout)
+        except DeadlineExceeded:
+            return []
+        messages = []
+        for received in response.received_messages:
+            message = to_dict(received.message)
+            message['ack_id'] = received.ack_id
+            messages.append(message)
+        logger.debug('pulled {} messages from {}'.format(len(messages), self.subscription_name))
+        return messages
+
+    def acknowledge(self, ack_ids):
+        """Acknowledge the pulled messages in bulk, at most MAX_ACK_IDS ack ids per request.
+
+        Arguments:
+            ack_ids {iterable} -- The ack ids of the messages, see pull().
+        """
+        ack_ids = list(ack_ids)
+        for start in range(0, len(ack_ids), MAX_ACK_IDS):
+            self.client.acknowledge(subscription=self.subscription_name, ack_ids=ack_ids[start:start + MAX_ACK_IDS])
+
+    def drain_backlog(self, max_messages=1000, concurrency=4, timeout=10.0):
+        """Pull the backlog of the subscription as fast as possible, and stop once it is empty.
+        It keeps concurrency pull requests in flight at once, and yields the batches as they return.
+        The messages are NOT ack automatically, acknowledge each batch before its ack deadline expires.
+
+            for batch in subscriber.drain_backlog():
+                handle(batch)
+                subscriber.acknowledge(message['ack_id'] for message in batch)
+
+        Keyword Arguments:
+            max_messages {int} -- The maximum number of messages per pull request (default: {1000})
+            concurrency {int} -- The number of pull requests in flight at once (default: {4})
+            timeout {float} -- The maximum number of seconds to wait for messages per pull request (default: {10.0})
+
+        Returns:
+            generator -- The batches of messages, see pull().
+        """
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+        try:
+            pulls = collections.deque(executor.submit(self.pull, max_messages, timeout) for _ in range(concurrency))
+            exhausted = False
+            while pulls:
+                messages = pulls.popleft().result()
+                if not messages:
+                    # no more backlog, let the pulls in flight return
+                    exhausted = True
+                elif not exhausted:
+                    pulls.append(executor.submit(self.pull, max_messages, timeout))
+                if messages:
+                    yield messages
+        finally:
+            executor.shutdown(wait=False)
+
+    def inflight(self):
+        """Get the number of messages which are handed over to the callback and not yet settled.
+
+        Returns:
+            int -- The number of messages in flight.
+        """
+        return len(self.__inflight)
+
+    def drain(self, timeout=None):
+        """Stop handing over new messages to the callback, and wait for the messages in flight to be settled.
+        The ones still in flight after timeout are nack, so that they are redelivered immediately.
+        The messages received meanwhile are held without being handed over, which pauses the pull once the flow control limits are reached,
+        and they are nack by close(). So they are delayed until close() at most, rather than nack and redelivered to this stream in a loop.
+        The connection is kept open to send the ack requests, call close() afterwards.
+
+        Keyword Arguments:
+            timeout {float} -- The maximum number of seconds to wait, wait forever if None (default: {None})
+
+        Returns:
+            dict -- The drain statistics: the number of messages in flight at start, settled in time, nack on timeout,
+                    held as received during drain, and the elapsed seconds.
+        """
+        start = time.time()
+        with self.__inflight_cond:
+            self.__draining = True
+            inflight = len(self.__inflight)
+        # hand over the buffered messages instead of waiting for the batch to be full
+        if self.batcher is not None:
+            self.batcher.flush()
+        with self.__inflight_cond:
+            while self.__inflight:
+                remaining = None if timeout is None else start + timeout - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.__inflight_cond.wait(remaining)
+            unfinished = list(self.__inflight.values())
+            self.__inflight.clear()
+            rejected = self.__rejected
+        for message in unfinished:
+            message.nack()
+        stats = {
+            'inflight': inflight,
+            'settled': inflight - len(unfinished),
+            'nacked': len(unfinished),
+            'rejected': rejected,
+            'elapsed': time.time() - start,
+        }
+        logger.info('drained subscription: {}'.format(stats))
+        return stats
+
     def close(self):
         """Close the existing connection.
+        The messages buffered in batch mode and the ones held by drain() are nack, so that they are redelivered immediately.
         """
-        self.future.cancel()
+        with self.__inflight_cond:
+            # hold the messages received from now on, they are redelivered after their ack deadline
+            self.__draining = True
+        if self.batcher is not None:
+            for message, received in self.batcher.stop():
+                if self.__release(message):
+                    message.nack()
+                    if received is not None:
+                        self.metrics.handled()
+                        self.metrics.nacked()
+            self.batcher = None
+        with self.__inflight_cond:
+            held, self.__held = self.__held, []
+        for message in held:
+            message.nack()
+        if self.future is not None:
+            self.future.cancel()
+        if self.event_loop is not None:
+            self.event_loop.stop()
+            self.event_loop = None
@@ -0,0 +1,120 @@
+# coding=utf-8
+#
+import math
+import logging
+import threading
+import collections
+
+from soocii_pubsub_lib.metrics import Registry
+
+logger = logging.getLogger(__name__)
+
+# the maximum ack deadline of Pub/Sub, which bounds the backoff
+MAX_ACK_DEADLINE = 600
+
+
+class RetryPolicy():
+    def __init__(self, max_attempts=5, backoff=1.0, max_backoff=60.0, dead_letter_topic=None, publisher=None,
+                 publish_timeout=30.0, max_tracked=100000, metrics=None):
+        """Retry the messages whose callback raises with exponential backoff, and dead-letter them after max_attempts.
+
+        A failed message is redelivered after backoff * 2 ** (attempt - 1) seconds, by setting its ack deadline and dropping its lease,
+        instead of being redelivered at once forever. After max_attempts, it is republished to dead_letter_topic with its original
+        attributes, plus dead_letter_reason, dead_letter_attempts and dead_letter_message_id, and then ack.
+        Without dead_letter_topic, it keeps being retried at max_backoff.
+
+        The attempts are counted by delivery_attempt of the message if the subscription has a dead letter policy,
+        and by a local tracker of message ids otherwise, which only knows the deliveries to this process.
+
+        Keyword Arguments:
+            max_attempts {int} -- The number of failures before dead-lettering the message (default: {5})
+            backoff {float} -- The number of seconds to delay the first retry (default: {1.0})
+            max_backoff {float} -- The maximum number of seconds to delay a retry, at most 600 (default: {60.0})
+            dead_letter_topic {str} -- The topic name to republish the failed messages to (default: {None})
+            publisher {PublisherClient} -- The publisher to republish the failed messages by, required with dead_letter_topic (default: {None})
+            publish_timeout {float} -- The maximum number of seconds to wait for a message to be dead-lettered (default: {30.0})
+            max_tracked {int} -- The maximum number of message ids in the local tracker (default: {100000})
+            metrics {soocii_pubsub_lib.metrics.Registry} -- The registry to record the failures in (default: {None} for a new one)
+
+        Raises:
+            ValueError -- If dead_letter_topic is given without publisher.
+        """
+        if dead_letter_topic is not None and publisher is None:
+            raise ValueError('publisher is required to republish to dead letter topic.')
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = min(max_backoff, MAX_ACK_DEADLINE)
+        self.dead_letter_topic = dead_letter_topic
+        self.publisher = publisher
+        self.publish_timeout = publish_timeout
+        self.max_tracked = max_tracked
+        self.lock = threading.Lock()
+        # message id -> failures, in least recently failed order
+        self.__attempts = collections.OrderedDict()
+        self.metrics = Registry() if metrics is None else metrics
+        self.__failures = self.metrics.counter('pubsub_callback_failures_total', 'Callback failures by reason.', ('reason',))
+        self.__retries = self.metrics.counter('pubsub_retried_messages_total', 'Messages redelivered with backoff.')
+        self.__dead_letters = self.metrics.counter('pubsub_dead_lettered_messages_total', 'Messages republished to the dead letter topic.', ('reason',))
+
+    def attempt(self, message):
+        """Count a failure of the message.
+
+        Arguments:
+            message {google.cloud.pubsub_v1.subscriber.message.Message} -- The received message.
+
+        Returns:
+            int -- The number of failures so far, including this one.
+        """
+        with self.lock:
+            attempts = self.__attempts.pop(message.message_id, 0) + 1
+            # delivery_attempt is None unless the subscription has a dead letter policy
+            attempts = max(attempts, getattr(message, 'delivery_attempt', None) or 0)
+            self.__attempts[message.message_id] = attempts
+            while len(self.__attempts) > self.max_tracked:
+                self.__attempts.popitem(last=False)
+            return attempts
+
+    def delay(self, attempts):
+        return min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+
+    def succeeded(self, message):
+        with self.lock:
+            self.__attempts.pop(message.message_id, None)
+
+    def failed(self, message, error):
+        """Redeliver the message with backoff, or dead-letter it after max_attempts.
+
+        Arguments:
+            message {google.cloud.pubsub_v1.subscriber.message.Message} -- The received message.
+            error {Exception} -- The exception raised by the callback.
+        """
+        reason = type(error).__name__
+        self.__failures.inc(labels=(reason,))
+        attempts = self.attempt(message)
+        if attempts >= self.max_attempts and self.dead_letter_topic is not None:
+            try:
+                self.__dead_letter(message, reason, attempts)
+                message.ack()
+                self.succeeded(message)
+                self.__dead_letters.inc(labels=(reason,))
+                return
+            except Exception as e:
+                logger.error('failed to republish message {} to {}: {}'.format(message.message_id, self.dead_letter_topic, e))
+        delay = self.delay(attempts)
+        logger.warning('retry message {} in {} seconds after {} failures: {}'.format(message.message_id, delay, attempts, error))
+        # stop extending the lease, and let the ack deadline expire after the delay
+        message.drop()
+        message.modify_ack_deadline(int(math.ceil(delay)))
+        self.__retries.inc()
+
+    def __dead_letter(self, message, reason, attempts):
+        # republish the raw data and attributes as received, without encoding them again
+        attributes = {attr: message.attributes[attr] for attr in message.attributes}
+        attributes.update({
+            'dead_letter_reason': reason,
+            'dead_letter_attempts': str(attempts),
+            'dead_letter_message_id': message.message_id,
+        })
+        topic = self.publisher.topic_path(self.dead_letter_topic)
+        self.publisher._send(topic, message.data, attributes).result(self.publish_timeout)
+        logger.info('republished message {} to {} after {} failures.'.format(message.message_id, topic, attempts))
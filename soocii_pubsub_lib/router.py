@@ -0,0 +1,156 @@
+# coding=utf-8
+#
+import time
+import logging
+
+from soocii_pubsub_lib.metrics import Registry
+from soocii_pubsub_lib.pubsub_client import iscoroutinefunction
+
+logger = logging.getLogger(__name__)
+
+
+class Route(object):
+    __slots__ = ('name', 'handler', 'predicate')
+
+    def __init__(self, name, handler, predicate):
+        self.name = name
+        self.handler = handler
+        self.predicate = predicate
+
+    def __repr__(self):
+        return 'Route({})'.format(self.name)
+
+
+class Router():
+    def __init__(self, ack_unmatched=True, metrics=None):
+        """Dispatch each message to the handler registered for its attribute values, in place of an if/elif chain in a callback.
+
+            router = Router()
+
+            @router.route(event='created')
+            def on_created(message):
+                return True
+
+            subscriber.open(callback=router)
+
+        The routes are compiled into a dict based index as they are registered, i.e. (attribute names) -> (attribute values) -> routes,
+        so a lookup costs a dict lookup per distinct set of attribute names, rather than per route.
+        The routes with more attributes are matched first, then in the registered order among the ones whose predicate passes.
+        The router is a synchronous callback of single message, which does not work in batch mode nor in a process pool.
+
+        Keyword Arguments:
+            ack_unmatched {bool} -- Ack the messages which match no route and there is no default handler (default: {True})
+            metrics {soocii_pubsub_lib.metrics.Registry} -- The registry to record the per-route metrics in (default: {None} for a new one)
+        """
+        self.ack_unmatched = ack_unmatched
+        # [(attribute names, {attribute values: [routes]})] with more attribute names first
+        self.__index = []
+        self.__default = None
+        self.metrics = Registry() if metrics is None else metrics
+        self.__messages = self.metrics.counter('pubsub_routed_messages_total', 'Messages dispatched by route.', ('route',))
+        self.__errors = self.metrics.counter('pubsub_route_errors_total', 'Exceptions raised by route handlers.', ('route',))
+        self.__duration = self.metrics.histogram('pubsub_route_duration_seconds', 'Seconds spent in route handlers.', ('route',))
+        self.__unmatched = self.metrics.counter('pubsub_unmatched_messages_total', 'Messages matching no route.')
+
+    def add_route(self, handler, attributes, predicate=None, name=None):
+        """Register a handler for the messages whose attributes have all the given values.
+
+        Arguments:
+            handler {function} -- The handler, which receives the message as the callback of SubscribeClient.open() does.
+            attributes {dict} -- The attribute values to match, e.g. {'event': 'created'}.
+
+        Keyword Arguments:
+            predicate {function} -- An optional function of the message, the route is skipped unless it returns True (default: {None})
+            name {str} -- The route name in metrics (default: {None} for the handler name)
+
+        Raises:
+            ValueError -- If the handler is a coroutine function, or no attribute is given.
+        """
+        if iscoroutinefunction(handler):
+            raise ValueError('router only supports synchronous handlers.')
+        if not attributes:
+            raise ValueError('route requires at least one attribute, use default() instead.')
+        names = tuple(sorted(attributes))
+        values = tuple(attributes[attr] for attr in names)
+        route = Route(name or getattr(handler, '__name__', repr(handler)), handler, predicate)
+        for index_names, routes in self.__index:
+            if index_names == names:
+                routes.setdefault(values, []).append(route)
+                break
+        else:
+            self.__index.append((names, {values: [route]}))
+            self.__index.sort(key=lambda entry: -len(entry[0]))
+        logger.debug('add route {} on {}'.format(route.name, attributes))
+
+    def route(self, predicate=None, name=None, **attributes):
+        """A decorator to register a handler, see add_route().
+
+            @router.route(event='created', source='web')
+            def on_created(message):
+                ...
+
+        Keyword Arguments:
+            predicate {function} -- An optional function of the message, the route is skipped unless it returns True (default: {None})
+            name {str} -- The route name in metrics (default: {None} for the handler name)
+            attributes -- The attribute values to match.
+
+        Returns:
+            function -- The decorator.
+        """
+        def decorator(handler):
+            self.add_route(handler, attributes, predicate=predicate, name=name)
+            return handler
+        return decorator
+
+    def default(self, handler):
+        """A decorator to register the handler of the messages which match no route.
+
+        Arguments:
+            handler {function} -- The handler.
+
+        Returns:
+            function -- The handler.
+        """
+        if iscoroutinefunction(handler):
+            raise ValueError('router only supports synchronous handlers.')
+        self.__default = Route(getattr(handler, '__name__', 'default'), handler, None)
+        return handler
+
+    def match(self, message):
+        """Find the route of the message.
+
+        Arguments:
+            message {dict} -- The message, either a dictionary or a Message view.
+
+        Returns:
+            Route -- The matched route, or the default one, None if there is neither.
+        """
+        attributes = message['attributes']
+        for names, routes in self.__index:
+            try:
+                candidates = routes.get(tuple(attributes[attr] for attr in names))
+            except KeyError:
+                continue
+            if candidates is None:
+                continue
+            for route in candidates:
+                if route.predicate is None or route.predicate(message):
+                    return route
+        return self.__default
+
+    def __call__(self, message):
+        route = self.match(message)
+        if route is None:
+            self.__unmatched.inc()
+            logger.debug('no route for message {}'.format(message['message_id']))
+            return self.ack_unmatched
+        labels = (route.name,)
+        self.__messages.inc(labels=labels)
+        start = time.time()
+        try:
+            return route.handler(message)
+        except Exception:
+            self.__errors.inc(labels=labels)
+            raise
+        finally:
+            self.__duration.observe(time.time() - start, labels)
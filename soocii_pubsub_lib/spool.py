@@ -0,0 +1,343 @@
+# coding=utf-8
+#
+import os
+import json
+import mmap
+import zlib
+import struct
+import logging
+import threading
+import concurrent.futures
+
+logger = logging.getLogger(__name__)
+
+# record header: crc32 of the body, length of the topic, length of the attributes, length of the data
+HEADER = struct.Struct('>IHII')
+SEGMENT_SUFFIX = '.seg'
+OFFSET_FILE = 'offset'
+# the errors which publishing the message again would not fix, e.g. a deleted topic or an oversized message
+PERMANENT_ERRORS = ('NotFound', 'InvalidArgument', 'PermissionDenied')
+
+
+class SpoolFullError(Exception):
+    """Raised as a message does not fit in the disk quota of the spool.
+    """
+
+
+def _replace(source, target):
+    # atomic rename on POSIX, python 2 has no os.replace
+    if hasattr(os, 'replace'):
+        os.replace(source, target)
+    else:
+        os.rename(source, target)
+
+
+def _permanent(error):
+    try:
+        from google.api_core import exceptions
+    except ImportError:
+        return False
+    return isinstance(error, tuple(getattr(exceptions, name) for name in PERMANENT_ERRORS))
+
+
+class Spool():
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, max_bytes=1024 * 1024 * 1024, fsync=False):
+        """A disk backed, append-only outbox of messages, split into segment files.
+
+        Each record is a fixed header followed by the topic, the attributes in JSON and the data,
+        segments are read back through mmap. The read offset is committed to a separate file by atomic rename,
+        and a torn record at the end of the last segment, e.g. after a crash, is truncated on open.
+        Messages are delivered at least once, i.e. a message may be replayed again if the process crashes before commit().
+        A directory must be used by a single process only.
+
+        Arguments:
+            directory {str} -- The directory of the segment files, created if it does not exist.
+
+        Keyword Arguments:
+            segment_bytes {int} -- Start a new segment file as the current one reaches this size (default: {64 MiB})
+            max_bytes {int} -- The maximum total size of the segment files (default: {1 GiB})
+            fsync {bool} -- Fsync the segment file after each append, otherwise it is left to the OS (default: {False})
+        """
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # segment numbers in order, the last one is being appended
+        self.__segments = sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+        self.__offset = self.__load_offset()
+        # remove the segments read through before the last commit
+        for segment in [segment for segment in self.__segments if segment < self.__offset[0]]:
+            os.remove(self.__path(segment))
+            self.__segments.remove(segment)
+        if not self.__segments:
+            self.__segments.append(self.__offset[0])
+        elif self.__segments[0] != self.__offset[0]:
+            self.__offset = (self.__segments[0], 0)
+        self.__recover(self.__segments[-1])
+        self.__writer = open(self.__path(self.__segments[-1]), 'ab')
+        self.size = sum(os.path.getsize(self.__path(segment)) for segment in self.__segments)
+
+    def __path(self, segment):
+        return os.path.join(self.directory, '{:020d}{}'.format(segment, SEGMENT_SUFFIX))
+
+    def __load_offset(self):
+        try:
+            with open(os.path.join(self.directory, OFFSET_FILE)) as f:
+                segment, position = f.read().split()
+                return int(segment), int(position)
+        except (IOError, OSError, ValueError):
+            return (self.__segments[0], 0) if self.__segments else (0, 0)
+
+    def __recover(self, segment):
+        # truncate a torn or corrupted record at the end of the last segment
+        path = self.__path(segment)
+        if not os.path.exists(path):
+            open(path, 'ab').close()
+            return
+        valid = 0
+        for _, end, _ in self.__scan(segment, 0):
+            valid = end
+        if valid < os.path.getsize(path):
+            logger.warning('truncate {} at {} of {} bytes.'.format(path, valid, os.path.getsize(path)))
+            with open(path, 'r+b') as f:
+                f.truncate(valid)
+
+    def __scan(self, segment, position, limit=None):
+        # yield (start, end, record) of the valid records from the position
+        path = self.__path(segment)
+        if os.path.getsize(path) <= position:
+            return
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                count = 0
+                while position + HEADER.size <= len(buffer) and (limit is None or count < limit):
+                    crc, topic_size, attrs_size, data_size = HEADER.unpack_from(buffer, position)
+                    start = position + HEADER.size
+                    end = start + topic_size + attrs_size + data_size
+                    if end > len(buffer):
+                        return
+                    body = buffer[start:end]
+                    if zlib.crc32(body) & 0xffffffff != crc:
+                        return
+                    topic = body[:topic_size].decode('utf-8')
+                    attributes = json.loads(body[topic_size:topic_size + attrs_size].decode('utf-8'))
+                    yield position, end, (topic, body[topic_size + attrs_size:], attributes)
+                    position = end
+                    count += 1
+            finally:
+                buffer.close()
+
+    def append(self, topic, data, attributes=None):
+        """Append a message to the spool.
+
+        Arguments:
+            topic {str} -- The topic path to publish the message to.
+            data {bytes} -- The message body.
+
+        Keyword Arguments:
+            attributes {dict} -- The attributes of the message (default: {None})
+
+        Raises:
+            SpoolFullError -- If the message does not fit in max_bytes.
+        """
+        topic = topic.encode('utf-8')
+        attrs = json.dumps(attributes or {}).encode('utf-8')
+        body = topic + attrs + data
+        record = HEADER.pack(zlib.crc32(body) & 0xffffffff, len(topic), len(attrs), len(data)) + body
+        with self.lock:
+            if self.size + len(record) > self.max_bytes:
+                raise SpoolFullError('spool {} is full with {} bytes.'.format(self.directory, self.size))
+            if self.__writer.tell() > 0 and self.__writer.tell() + len(record) > self.segment_bytes:
+                self.__writer.close()
+                self.__segments.append(self.__segments[-1] + 1)
+                self.__writer = open(self.__path(self.__segments[-1]), 'ab')
+            self.__writer.write(record)
+            self.__writer.flush()
+            if self.fsync:
+                os.fsync(self.__writer.fileno())
+            self.size += len(record)
+
+    def read(self, max_records=1000):
+        """Read the messages from the committed offset, without moving the offset.
+
+        Keyword Arguments:
+            max_records {int} -- The maximum number of messages to read (default: {1000})
+
+        Returns:
+            list -- A list of (offset, (topic, data, attributes)) in order, pass the offset of the last handled one to commit().
+        """
+        with self.lock:
+            records = []
+            segment, position = self.__offset
+            for index in range(self.__segments.index(segment), len(self.__segments)):
+                segment = self.__segments[index]
+                for _, end, record in self.__scan(segment, position, max_records - len(records)):
+                    records.append(((segment, end), record))
+                if len(records) >= max_records:
+                    break
+                position = 0
+            return records
+
+    def commit(self, offset):
+        """Move the read offset after the given record, and remove the segment files which have been read through.
+
+        Arguments:
+            offset {tuple} -- The offset returned by read().
+        """
+        with self.lock:
+            segment, _ = offset
+            path = os.path.join(self.directory, OFFSET_FILE)
+            with open(path + '.tmp', 'w') as f:
+                f.write('{} {}'.format(*offset))
+                f.flush()
+                os.fsync(f.fileno())
+            _replace(path + '.tmp', path)
+            self.__offset = tuple(offset)
+            while self.__segments[0] < segment:
+                removed = self.__segments.pop(0)
+                self.size -= os.path.getsize(self.__path(removed))
+                os.remove(self.__path(removed))
+
+    def pending(self):
+        """Check if there is any message after the committed offset.
+
+        Returns:
+            bool -- True if there is any message to read.
+        """
+        with self.lock:
+            segment, position = self.__offset
+            return segment != self.__segments[-1] or position < self.__writer.tell()
+
+    def close(self):
+        with self.lock:
+            self.__writer.close()
+
+
+class SpoolReplayer():
+    def __init__(self, spool, send, batch_size=1000, interval=1.0, max_interval=60.0, timeout=60.0, quarantine=None):
+        """Replay the spooled messages in batches in a background thread, and commit the offset after they are published.
+
+        The spool is polled every interval seconds, and the interval doubles up to max_interval while publishing fails,
+        i.e. while the broker is still unhealthy.
+        A message which fails with a permanent error, i.e. NotFound, InvalidArgument or PermissionDenied, is never replayed again,
+        it is moved to the quarantine spool if any and dropped otherwise, so that it does not block the messages after it.
+
+        Arguments:
+            spool {Spool} -- The spool to replay.
+            send {function} -- The function to publish a message by (topic, data, attributes), which returns its future.
+
+        Keyword Arguments:
+            batch_size {int} -- The maximum number of messages to publish at once (default: {1000})
+            interval {float} -- The number of seconds between polls of the spool (default: {1.0})
+            max_interval {float} -- The maximum number of seconds between polls of the spool after failures (default: {60.0})
+            timeout {float} -- The maximum number of seconds to wait for a batch to be published (default: {60.0})
+            quarantine {Spool} -- The spool to keep the messages which failed permanently (default: {None} to drop them)
+        """
+        self.spool = spool
+        self.send = send
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self.quarantine = quarantine
+        self.replayed = 0
+        self.rejected = 0
+        # offsets of the messages after the committed offset which are already published or rejected
+        self.__settled = set()
+        self.__stopped = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, name='spool-replayer')
+        self.__thread.daemon = True
+
+    def start(self):
+        self.__thread.start()
+
+    def stop(self, timeout=None):
+        self.__stopped.set()
+        self.__thread.join(timeout)
+
+    def __reject(self, topic, data, attributes, error):
+        logger.error('reject spooled message to {} which failed permanently: {}'.format(topic, error))
+        self.rejected += 1
+        if self.quarantine is None:
+            return
+        try:
+            self.quarantine.append(topic, data, attributes)
+        except Exception as e:
+            logger.error('failed to quarantine message to {}: {}'.format(topic, e))
+
+    def replay(self):
+        """Publish a batch of the spooled messages, and commit the offset through the published or rejected ones.
+
+        The messages after a transient failure which are published meanwhile are remembered, and not published again
+        as the batch is replayed.
+
+        Returns:
+            bool -- True if the whole batch has been published or rejected.
+        """
+        records = self.spool.read(self.batch_size)
+        if not records:
+            return True
+        futures = []
+        for offset, (topic, data, attributes) in records:
+            if offset in self.__settled:
+                futures.append(None)
+                continue
+            try:
+                futures.append(self.send(topic, data, attributes))
+            except Exception as e:
+                future = concurrent.futures.Future()
+                future.set_exception(e)
+                futures.append(future)
+                if not _permanent(e):
+                    logger.warning('failed to replay message to {}: {}'.format(topic, e))
+                    break
+        concurrent.futures.wait([future for future in futures if future is not None], timeout=self.timeout)
+        committed = None
+        published = 0
+        blocked = len(futures) < len(records)
+        for (offset, (topic, data, attributes)), future in zip(records, futures):
+            if future is None:
+                pass
+            elif not future.done() or future.cancelled():
+                blocked = True
+                continue
+            elif future.exception() is None:
+                published += 1
+            elif _permanent(future.exception()):
+                self.__reject(topic, data, attributes, future.exception())
+            else:
+                blocked = True
+                continue
+            if blocked:
+                # published or rejected after a transient failure, skip it as the batch is replayed
+                self.__settled.add(offset)
+            else:
+                committed = offset
+        self.replayed += published
+        if committed is not None:
+            self.spool.commit(committed)
+            self.__settled = set(offset for offset in self.__settled if offset > committed)
+        if published > 0:
+            logger.info('replayed {} spooled messages.'.format(published))
+        return not blocked
+
+    def __drain(self):
+        while self.spool.pending() and not self.__stopped.is_set():
+            if not self.replay():
+                return False
+        return True
+
+    def __run(self):
+        interval = self.interval
+        while not self.__stopped.wait(interval):
+            try:
+                healthy = self.__drain()
+            except Exception as e:
+                logger.error('unexpected exception was caughted {}.'.format(e))
+                healthy = False
+            # back off while the broker is unhealthy
+            interval = self.interval if healthy else min(interval * 2, self.max_interval)
@@ -4,14 +4,49 @@ import json
 import signal
 import logging
 import threading
+import concurrent.futures
 
 logger = logging.getLogger(__name__)
 
 
+def process_pool(processes):
+    """Create the pool of worker processes to run callbacks on.
+
+    The workers are spawned where supported, i.e. python 3.7+, since forking a process with the gRPC threads of a streaming pull
+    is known to hang the child. Otherwise, the workers are forked at once, before the streaming pull starts its threads.
+
+    Arguments:
+        processes {int} -- The number of worker processes.
+
+    Returns:
+        concurrent.futures.ProcessPoolExecutor -- The pool of worker processes.
+    """
+    import multiprocessing
+    try:
+        return concurrent.futures.ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+    except (AttributeError, TypeError):
+        # no start method context in python 2, nor mp_context in python 3.5 and 3.6
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=processes)
+        # all the workers are forked on the first submit before python 3.9
+        pool.submit(int).result()
+        return pool
+
+
 class SubscriptionService():
-    def __init__(self, subscription):
+    def __init__(self, subscription, drain_timeout=30):
+        """Run a subscription until it is interrupted by SIGINT or SIGTERM.
+
+        Arguments:
+            subscription {SubscribeClient} -- The subscription to run.
+
+        Keyword Arguments:
+            drain_timeout {float} -- The maximum number of seconds to wait for the messages in flight on shutdown (default: {30})
+        """
         logger.info('init instance of SubscriptionService')
         self.subscription = subscription
+        self.drain_timeout = drain_timeout
+        self.drain_stats = None
+        self.process_pool = None
         # create service stop event
         self.stop = threading.Event()
         self.stop.clear()    # default false
@@ -20,7 +55,17 @@ class SubscriptionService():
         logger.info('got signal {} {}: exit.'.format(signalnum, frame))
         self.shutdown()
 
-    def run(self, callback=None):
+    def run(self, callback=None, processes=None, **kwargs):
+        """Open the subscription, and block until the service is shut down.
+        If processes is provided, the messages are still pulled in this process, and the callback runs in a pool of worker processes,
+        which makes CPU bound callbacks scale beyond a single core. The callback has to be a module level function in this case,
+        and the workers are spawned where supported, see process_pool().
+
+        Keyword Arguments:
+            callback {function} -- The callback function, either a function or a coroutine function, see SubscribeClient.open(). (default: {None})
+            processes {int} -- The number of worker processes to run the callback on (default: {None})
+            kwargs -- Flow control and executor settings, which are passed to SubscribeClient.open()
+        """
         logger.info('start running SubscriptionService')
         try:
             # add signal handler to stop the service.
@@ -31,19 +76,39 @@ class SubscriptionService():
                     signal.signal(getattr(signal, signame), lambda signalnum, frame: self.__exit(signalnum, frame))
             else:
                 logger.warn('skip signal handler registration, due to this is not in main thread.')
+            if processes is not None:
+                logger.info('start {} worker processes.'.format(processes))
+                self.process_pool = process_pool(processes)
+                kwargs['process_pool'] = self.process_pool
             # open subscription channel
             logger.info('open subscription channel.')
-            self.subscription_future = self.subscription.open(callback)
+            self.subscription_future = self.subscription.open(callback, **kwargs)
             logger.info('subscription service is running forever, press CTRL+C to interrupt.')
             self.stop.wait()
         except Exception as e:
             logger.error('unexpected exception was caughted: {}.'.format(e))
 
-    def shutdown(self):
+    def shutdown(self, timeout=None):
+        """Drain the messages in flight, and close the subscription.
+        The messages received during drain, and the ones not settled in time are nack, so that they are redelivered immediately.
+
+        Keyword Arguments:
+            timeout {float} -- The maximum number of seconds to drain, drain_timeout if None (default: {None})
+
+        Returns:
+            dict -- The drain statistics, see SubscribeClient.drain().
+        """
         logger.info('stop running SubscriptionService')
         self.stop.set()
+        # wait for the callbacks in flight before closing the channel, which sends their ack requests
+        logger.info('drain subscription channel.')
+        self.drain_stats = self.subscription.drain(self.drain_timeout if timeout is None else timeout)
         # close subscription channel
         logger.info('close subscription channel.')
         self.subscription.close()
         # wait for pending tasks to clean up
         self.subscription_future.result()
+        if self.process_pool is not None:
+            self.process_pool.shutdown()
+            self.process_pool = None
+        return self.drain_stats
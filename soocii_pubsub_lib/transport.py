@@ -0,0 +1,23 @@
+# coding=utf-8
+#
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class GoogleTransport():
+    """The default transport, which connects to Google Cloud Pub/Sub, or the emulator if PUBSUB_EMULATOR_HOST is set.
+
+    A transport creates the underlying publisher and subscriber clients of PublisherClient and SubscribeClient,
+    see soocii_pubsub_lib.memory.Broker for an in-process one.
+    The client library is imported as the first client is created, rather than as this module is imported.
+    """
+
+    def publisher(self, batch_settings, credentials):
+        # batch_settings is a dictionary of the settings which are given explicitly
+        from google.cloud import pubsub_v1
+        return pubsub_v1.PublisherClient(pubsub_v1.types.BatchSettings(**batch_settings), credentials=credentials)
+
+    def subscriber(self, credentials):
+        from google.cloud import pubsub_v1
+        return pubsub_v1.SubscriberClient(credentials=credentials)
@@ -0,0 +1,179 @@
+# coding=utf-8
+#
+import time
+import pytest
+import asyncio
+import logging
+import unittest
+import concurrent.futures
+
+from soocii_pubsub_lib import aio, pubsub_client
+
+# ========== Initial Logger ==========
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='[%(asctime)-15s][%(levelname)-5s][%(filename)s][%(funcName)s#%(lineno)d] %(message)s')
+logger = logging.getLogger(__name__)
+# ====================================
+
+
+@pytest.mark.usefixtures("start_emulator")
+class AsyncPublishTests(unittest.TestCase):
+    def setUp(self):
+        self.project = 'fake-project'
+        self.cred = None
+        self.topic = 'fake-topic'
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_async_publish(self):
+        publisher = aio.AsyncPublisherClient(self.project, self.cred, loop=self.loop)
+        publisher.create_topic(self.topic)
+        message_id = self.loop.run_until_complete(publisher.publish(self.topic, b'bytes data', addition1='test1'))
+        assert message_id is not None
+
+    def test_async_publish_gather(self):
+        publisher = aio.AsyncPublisherClient(self.project, self.cred, loop=self.loop)
+        publisher.create_topic(self.topic)
+        awaitables = [publisher.publish(self.topic, b'bytes data') for _ in range(1000)]
+        message_ids = self.loop.run_until_complete(asyncio.gather(*awaitables))
+        assert len(set(message_ids)) == 1000
+
+    def test_async_publish_unsupported_data_type(self):
+        publisher = aio.AsyncPublisherClient(self.project, self.cred, loop=self.loop)
+        with self.assertRaises(ValueError):
+            publisher.publish(self.topic, 12345)
+
+
+@pytest.mark.usefixtures("memory_broker")
+class AsyncPublishLoopTests(unittest.TestCase):
+    def setUp(self):
+        self.project = 'fake-project'
+        self.cred = None
+        self.topic = 'fake-topic'
+        pubsub_client.PublisherClient(self.project, self.cred, transport=self.broker).create_topic(self.topic)
+
+    def test_publish_on_running_loop(self):
+        # constructed before any event loop, as at module level
+        publisher = aio.AsyncPublisherClient(self.project, self.cred, transport=self.broker)
+
+        async def main():
+            return await asyncio.gather(*[publisher.publish(self.topic, b'bytes data') for _ in range(10)])
+        for _ in range(2):
+            loop = asyncio.new_event_loop()
+            try:
+                message_ids = loop.run_until_complete(main())
+            finally:
+                loop.close()
+            assert len(set(message_ids)) == 10
+
+    def test_publish_without_running_loop(self):
+        publisher = aio.AsyncPublisherClient(self.project, self.cred, transport=self.broker)
+        if not hasattr(asyncio, 'get_running_loop'):
+            pytest.skip('get_event_loop() creates an event loop before python 3.7')
+        with self.assertRaises(RuntimeError):
+            publisher.publish(self.topic, b'bytes data')
+
+
+class PendingTransport(object):
+    # a transport whose publish futures are resolved by the test
+    def __init__(self):
+        self.published = []
+
+    def publisher(self, batch_settings=None, credentials=None):
+        return self
+
+    @staticmethod
+    def topic_path(project, topic):
+        return 'projects/{}/topics/{}'.format(project, topic)
+
+    def publish(self, topic, data, **attrs):
+        future = concurrent.futures.Future()
+        self.published.append((data, future))
+        return future
+
+
+class AsyncFlowControlTests(unittest.TestCase):
+    def setUp(self):
+        self.transport = PendingTransport()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_block_does_not_block_loop(self):
+        publisher = aio.AsyncPublisherClient('fake-project', None, transport=self.transport, max_outstanding_messages=1)
+
+        async def main():
+            awaitables = [publisher.publish('fake-topic', str(i).encode('utf-8')) for i in range(3)]
+            # the event loop keeps running while the messages wait for room
+            await asyncio.sleep(0.1)
+            assert [data for data, _ in self.transport.published] == [b'0']
+            for i in range(3):
+                while len(self.transport.published) <= i:
+                    await asyncio.sleep(0.01)
+                self.transport.published[i][1].set_result(str(i))
+            return await asyncio.gather(*awaitables)
+        assert self.loop.run_until_complete(main()) == ['0', '1', '2']
+        assert [data for data, _ in self.transport.published] == [b'0', b'1', b'2']
+        publisher.close()
+
+    def test_block_from_other_thread(self):
+        # the client is given the loop of another thread, publish() is called off the loop thread
+        thread = aio.EventLoopThread().start()
+        # debug mode raises on the non thread-safe calls from other threads
+        thread.loop.set_debug(True)
+        publisher = aio.AsyncPublisherClient('fake-project', None, loop=thread.loop, transport=self.transport, max_outstanding_messages=1)
+        awaitables = [publisher.publish('fake-topic', str(i).encode('utf-8')) for i in range(3)]
+        for i in range(3):
+            deadline = time.time() + 2
+            while len(self.transport.published) <= i and time.time() < deadline:
+                time.sleep(0.01)
+            self.transport.published[i][1].set_result(str(i))
+
+        async def gather():
+            return await asyncio.gather(*awaitables)
+        assert thread.submit(gather()).result(2) == ['0', '1', '2']
+        publisher.close()
+        thread.stop(1)
+
+
+@pytest.mark.usefixtures("start_emulator")
+class AsyncSubscribeTests(unittest.TestCase):
+    def setUp(self):
+        self.project = 'fake-project'
+        self.cred = None
+        self.topic = 'fake-topic'
+        self.subscription = None
+        self.received_messages = []
+
+    def tearDown(self):
+        # close subscription channel
+        if self.subscription is not None:
+            self.subscription.close()
+
+    async def __on_received(self, message):
+        # simulate an I/O bound handler
+        await asyncio.sleep(0.5)
+        self.received_messages.append(message)
+        return True
+
+    def test_subscribe_with_coroutine_callback(self):
+        # prepare publisher
+        publisher = pubsub_client.PublisherClient(self.project, self.cred)
+        publisher.create_topic(self.topic)
+        # prepare subscriber
+        self.subscription = pubsub_client.SubscribeClient(self.project, self.cred)
+        self.subscription.create_subscription(self.topic, 'fake-subscription')
+        publisher.publish_many(self.topic, [b'bytes data'] * 50)
+        publisher.flush()
+        # open subscription channel, the handlers wait concurrently on the event loop
+        self.subscription.open(callback=self.__on_received)
+        assert self.subscription.event_loop is not None
+        time.sleep(2)
+        # verify if messages have been received
+        assert len(self.received_messages) == 50
+        assert self.received_messages[0]['data'] == b'bytes data'
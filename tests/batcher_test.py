@@ -0,0 +1,56 @@
+# coding=utf-8
+#
+import time
+import logging
+import unittest
+
+from soocii_pubsub_lib.batcher import MessageBatcher
+
+# ========== Initial Logger ==========
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='[%(asctime)-15s][%(levelname)-5s][%(filename)s][%(funcName)s#%(lineno)d] %(message)s')
+logger = logging.getLogger(__name__)
+# ====================================
+
+
+class MessageBatcherTests(unittest.TestCase):
+    def setUp(self):
+        self.batches = []
+
+    def __on_batch(self, batch):
+        self.batches.append(batch)
+
+    def test_flush_by_size(self):
+        batcher = MessageBatcher(self.__on_batch, max_messages=3, max_latency=10)
+        for i in range(7):
+            batcher.add(i)
+        assert self.batches == [[0, 1, 2], [3, 4, 5]]
+        assert batcher.stop() == [6]
+
+    def test_flush_by_bytes(self):
+        batcher = MessageBatcher(self.__on_batch, max_messages=100, max_bytes=10, max_latency=10)
+        batcher.add('a', size=6)
+        batcher.add('b', size=6)
+        batcher.add('c', size=6)
+        assert self.batches == [['a', 'b']]
+        batcher.stop()
+
+    def test_flush_by_latency(self):
+        batcher = MessageBatcher(self.__on_batch, max_messages=100, max_latency=0.1)
+        batcher.add(1)
+        batcher.add(2)
+        time.sleep(0.5)
+        assert self.batches == [[1, 2]]
+        batcher.add(3)
+        time.sleep(0.5)
+        assert self.batches == [[1, 2], [3]]
+        batcher.stop()
+
+    def test_handler_exception(self):
+        def handler(batch):
+            raise RuntimeError('handler failed')
+        batcher = MessageBatcher(handler, max_messages=1)
+        batcher.add(1)
+        batcher.add(2)
+        assert batcher.stop() == []
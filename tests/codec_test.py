@@ -0,0 +1,73 @@
+# coding=utf-8
+#
+import logging
+import unittest
+
+from soocii_pubsub_lib import codec
+
+# ========== Initial Logger ==========
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='[%(asctime)-15s][%(levelname)-5s][%(filename)s][%(funcName)s#%(lineno)d] %(message)s')
+logger = logging.getLogger(__name__)
+# ====================================
+
+
+class PayloadEncoderTests(unittest.TestCase):
+    def setUp(self):
+        self.payload = {'event': 'created', 'values': list(range(100))}
+
+    def tearDown(self):
+        pass
+
+    def test_raw_without_markers(self):
+        encoder = codec.PayloadEncoder()
+        data, attributes = encoder.encode(b'bytes data', {'addition1': 'test1'})
+        assert data == b'bytes data'
+        assert attributes == {'addition1': 'test1'}
+        assert codec.decode(data, attributes) == b'bytes data'
+
+    def test_raw_unsupported_data_type(self):
+        encoder = codec.PayloadEncoder()
+        with self.assertRaises(ValueError):
+            encoder.encode(12345, {})
+
+    def test_json(self):
+        encoder = codec.PayloadEncoder('json')
+        data, attributes = encoder.encode(self.payload, {'addition1': 'test1'})
+        assert attributes == {'addition1': 'test1', codec.CODEC_ATTRIBUTE: 'json'}
+        assert codec.decode(data, attributes) == self.payload
+
+    def test_compress_above_threshold(self):
+        encoder = codec.PayloadEncoder('json', compress_threshold=100)
+        data, attributes = encoder.encode(self.payload, {})
+        assert attributes[codec.COMPRESSION_ATTRIBUTE] == 'zlib'
+        assert codec.decode(data, attributes) == self.payload
+        # small payloads are not compressed
+        data, attributes = encoder.encode({'event': 'created'}, {})
+        assert codec.COMPRESSION_ATTRIBUTE not in attributes
+
+    def test_markers_override_attributes(self):
+        encoder = codec.PayloadEncoder('json')
+        _, attributes = encoder.encode(self.payload, {codec.CODEC_ATTRIBUTE: 'raw'})
+        assert attributes[codec.CODEC_ATTRIBUTE] == 'json'
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            codec.PayloadEncoder('unknown')
+        with self.assertRaises(ValueError):
+            codec.decode(b'bytes data', {codec.CODEC_ATTRIBUTE: 'unknown'})
+
+    def test_register_codec(self):
+        class UpperCodec():
+            name = 'upper'
+
+            def encode(self, payload):
+                return payload.upper().encode('utf-8')
+
+            def decode(self, data):
+                return data.decode('utf-8').lower()
+        codec.register_codec(UpperCodec)
+        data, attributes = codec.PayloadEncoder('upper').encode('text', {})
+        assert data == b'TEXT'
+        assert codec.decode(data, attributes) == 'text'
@@ -1,11 +1,26 @@
 # coding=utf-8
 #
 import os
+import sys
+import time
 import docker
 import pytest
 
+from soocii_pubsub_lib import memory
+
 container = None
 
+# asyncio and the coroutine syntax are python 3.5+ only
+collect_ignore = ['aio_test.py'] if sys.version_info < (3, 5) else []
+
+
+def wait_for(condition, timeout=2):
+    # poll the condition until it holds or the timeout expires, and return its last value
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
 
 @pytest.fixture()
 def no_emulator(request):
@@ -32,3 +47,12 @@ def start_emulator(request):
 
     request.addfinalizer(stop_emulator)
     return container
+
+
+@pytest.fixture()
+def memory_broker(request):
+    # in-process broker, no emulator nor network is required
+    broker = memory.Broker()
+    if request.cls is not None:
+        request.cls.broker = broker
+    return broker
@@ -0,0 +1,56 @@
+# coding=utf-8
+#
+import time
+import logging
+import unittest
+
+from google.cloud import pubsub_v1
+from soocii_pubsub_lib.dedup import DedupCache
+
+# ========== Initial Logger ==========
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='[%(asctime)-15s][%(levelname)-5s][%(filename)s][%(funcName)s#%(lineno)d] %(message)s')
+logger = logging.getLogger(__name__)
+# ====================================
+
+
+class DedupCacheTests(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_seen(self):
+        cache = DedupCache()
+        assert cache.seen('1') is False
+        cache.add('1')
+        assert cache.seen('1') is True
+        assert cache.stats() == {'hits': 1, 'misses': 1, 'size': 1}
+
+    def test_bounded_size(self):
+        cache = DedupCache(max_size=100)
+        for i in range(1000):
+            cache.add(str(i))
+        assert len(cache) == 100
+        # the oldest keys are evicted first
+        assert cache.seen('0') is False
+        assert cache.seen('999') is True
+
+    def test_ttl(self):
+        cache = DedupCache(ttl=0.1)
+        cache.add('1')
+        time.sleep(0.2)
+        assert cache.seen('1') is False
+        cache.add('2')
+        assert len(cache) == 1
+
+    def test_key_attribute(self):
+        cache = DedupCache(key='event_id')
+        message = pubsub_v1.types.PubsubMessage(data=b'bytes data', message_id='1', attributes={'event_id': 'e1'})
+        assert cache.key_of(message) == 'e1'
+        # messages without the key are never duplicates
+        message = pubsub_v1.types.PubsubMessage(data=b'bytes data', message_id='2')
+        assert cache.key_of(message) is None
+        assert cache.seen(None) is False
@@ -0,0 +1,139 @@
+# coding=utf-8
+#
+import time
+import pytest
+import logging
+import unittest
+import threading
+import concurrent.futures
+
+from soocii_pubsub_lib import pubsub_client
+from soocii_pubsub_lib.flow import PublishFlowController, FlowControlLimitError, BLOCK, ERROR, DROP_OLDEST
+
+# ========== Initial Logger ==========
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='[%(asctime)-15s][%(levelname)-5s][%(filename)s][%(funcName)s#%(lineno)d] %(message)s')
+logger = logging.getLogger(__name__)
+# ====================================
+
+
+class PublishFlowControllerTests(unittest.TestCase):
+    def setUp(self):
+        # futures handed out by the fake client, resolved by the test
+        self.futures = []
+
+    def tearDown(self):
+        pass
+
+    def publish(self):
+        future = concurrent.futures.Future()
+        self.futures.append(future)
+        return future
+
+    def test_unknown_policy(self):
+        with pytest.raises(ValueError):
+            PublishFlowController(max_messages=1, policy='unknown')
+
+    def test_error(self):
+        controller = PublishFlowController(max_messages=2, policy=ERROR)
+        controller.admit(1, self.publish)
+        controller.admit(1, self.publish)
+        with pytest.raises(FlowControlLimitError):
+            controller.admit(1, self.publish)
+        assert controller.depth() == {'messages': 2, 'bytes': 2, 'backlog': 0, 'dropped': 0}
+
+        self.futures[0].set_result('1')
+        controller.admit(1, self.publish)
+        assert len(self.futures) == 3
+
+    def test_max_bytes(self):
+        controller = PublishFlowController(max_bytes=10, policy=ERROR)
+        controller.admit(6, self.publish)
+        with pytest.raises(FlowControlLimitError):
+            controller.admit(6, self.publish)
+        controller.admit(4, self.publish)
+
+    def test_oversized_message(self):
+        # a message larger than the limit is admitted if nothing is outstanding
+        controller = PublishFlowController(max_bytes=10, policy=ERROR)
+        controller.admit(20, self.publish)
+        assert controller.depth()['bytes'] == 20
+
+    def test_block(self):
+        controller = PublishFlowController(max_messages=1, policy=BLOCK)
+        controller.admit(1, self.publish)
+
+        timer = threading.Timer(0.2, lambda: self.futures[0].set_result('1'))
+        timer.start()
+        start = time.time()
+        controller.admit(1, self.publish)
+        assert time.time() - start >= 0.1
+        assert len(self.futures) == 2
+        timer.join()
+
+    def test_block_without_wait(self):
+        controller = PublishFlowController(max_messages=1, policy=BLOCK)
+        controller.admit(1, self.publish)
+        with pytest.raises(FlowControlLimitError):
+            controller.admit(1, self.publish, block=False)
+        assert len(self.futures) == 1
+
+    def test_block_timeout(self):
+        controller = PublishFlowController(max_messages=1, policy=BLOCK, timeout=0.1)
+        controller.admit(1, self.publish)
+        with pytest.raises(FlowControlLimitError):
+            controller.admit(1, self.publish)
+
+    def test_drop_oldest(self):
+        controller = PublishFlowController(max_messages=1, policy=DROP_OLDEST)
+        first = controller.admit(1, self.publish)
+        second = controller.admit(1, self.publish)
+        third = controller.admit(1, self.publish)
+        assert second.cancelled()
+        assert controller.depth() == {'messages': 1, 'bytes': 1, 'backlog': 1, 'dropped': 1}
+
+        # the backlog is published as the outstanding message returns
+        self.futures[0].set_result('1')
+        assert first.result() == '1'
+        assert len(self.futures) == 2
+        self.futures[1].set_result('3')
+        assert third.result(timeout=1) == '3'
+        assert controller.depth() == {'messages': 0, 'bytes': 0, 'backlog': 0, 'dropped': 1}
+
+    def test_release_on_failure(self):
+        controller = PublishFlowController(max_messages=1, policy=ERROR)
+        controller.admit(1, self.publish)
+        self.futures[0].set_exception(RuntimeError('publish failed'))
+        assert controller.depth()['messages'] == 0
+
+        def fail():
+            raise TypeError('not a bytestring')
+        with pytest.raises(TypeError):
+            controller.admit(1, fail)
+        assert controller.depth()['messages'] == 0
+
+
+@pytest.mark.usefixtures("memory_broker")
+class PublisherFlowControlTests(unittest.TestCase):
+    def setUp(self):
+        self.project = 'fake-project'
+        self.cred = None
+        self.topic = 'fake-topic'
+
+    def tearDown(self):
+        pass
+
+    def test_outstanding(self):
+        publisher = pubsub_client.PublisherClient(self.project, self.cred, transport=self.broker,
+                                                  max_outstanding_messages=10, overflow='error')
+        publisher.create_topic(self.topic)
+        futures = publisher.publish_many(self.topic, [b'1', b'2', b'3'])
+        concurrent.futures.wait(futures)
+        assert publisher.flush(timeout=1)
+        assert publisher.outstanding() == {'messages': 0, 'bytes': 0, 'backlog': 0, 'dropped': 0, 'pending': 0}
+
+    def test_outstanding_without_limits(self):
+        publisher = pubsub_client.PublisherClient(self.project, self.cred, transport=self.broker)
+        assert publisher.flow_control is None
+        assert publisher.outstanding() == {'pending': 0}
@@ -0,0 +1,117 @@
+# coding=utf-8
+#
+import time
+import pytest
+import random
+import logging
+import threading
+import unittest
+
+from soocii_pubsub_lib import pubsub_client
+from soocii_pubsub_lib.lanes import OrderedDispatcher
+from soocii_pubsub_lib.limiter import RateLimiter
+
+# ========== Initial Logger ==========
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='[%(asctime)-15s][%(levelname)-5s][%(filename)s][%(funcName)s#%(lineno)d] %(message)s')
+logger = logging.getLogger(__name__)
+# ====================================
+
+
+class OrderedDispatcherTests(unittest.TestCase):
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.handled = {}
+
+    def tearDown(self):
+        pass
+
+    def __message(self, user_id, seq):
+        return {'message_id': '{}-{}'.format(user_id, seq), 'data': b'bytes data', 'attributes': {'user_id': user_id, 'seq': seq}}
+
+    def __handle(self, message):
+        time.sleep(random.random() * 0.001)
+        with self.lock:
+            self.handled.setdefault(message['attributes']['user_id'], []).append(message['attributes']['seq'])
+
+    def test_ordered_per_key(self):
+        dispatcher = OrderedDispatcher('user_id', lanes=4)
+        for seq in range(50):
+            for user_id in ('u1', 'u2', 'u3', 'u4', 'u5'):
+                message = self.__message(user_id, seq)
+                dispatcher.submit(message, lambda message=message: self.__handle(message))
+        dispatcher.stop()
+        assert sorted(self.handled) == ['u1', 'u2', 'u3', 'u4', 'u5']
+        assert all(seqs == list(range(50)) for seqs in self.handled.values())
+
+    def test_same_key_same_lane(self):
+        dispatcher = OrderedDispatcher('user_id', lanes=4)
+        assert dispatcher.lane_of(self.__message('u1', 0)) == dispatcher.lane_of(self.__message('u1', 1))
+        dispatcher.stop()
+
+    def test_bounded_depth(self):
+        dispatcher = OrderedDispatcher('user_id', lanes=1, max_depth=2)
+        started = threading.Event()
+        release = threading.Event()
+
+        def block():
+            started.set()
+            release.wait()
+        dispatcher.submit(self.__message('u1', 0), block)
+        started.wait()
+        dispatcher.submit(self.__message('u1', 1), lambda: None)
+        dispatcher.submit(self.__message('u1', 2), lambda: None)
+        assert dispatcher.depths() == [2]
+        release.set()
+        dispatcher.stop()
+        assert dispatcher.depths() == [0]
+
+    def test_task_exception(self):
+        dispatcher = OrderedDispatcher('user_id', lanes=1)
+
+        def fail():
+            raise RuntimeError('handler failed')
+        dispatcher.submit(self.__message('u1', 0), fail)
+        message = self.__message('u1', 1)
+        dispatcher.submit(message, lambda: self.__handle(message))
+        dispatcher.stop()
+        assert self.handled == {'u1': [1]}
+
+
+@pytest.mark.usefixtures("memory_broker")
+class SubscribeLanesTests(unittest.TestCase):
+    def setUp(self):
+        self.project = 'fake-project'
+        self.cred = None
+        self.topic = 'fake-topic'
+        self.lock = threading.Lock()
+        self.handled = []
+        self.publisher = pubsub_client.PublisherClient(self.project, self.cred, transport=self.broker)
+        self.publisher.create_topic(self.topic)
+        self.subscription = pubsub_client.SubscribeClient(self.project, self.cred, transport=self.broker)
+        self.subscription.create_subscription(self.topic, 'fake-subscription')
+
+    def tearDown(self):
+        self.subscription.close()
+
+    def __on_received(self, message):
+        with self.lock:
+            self.handled.append(int(message['attributes']['seq']))
+        return True
+
+    def test_ordered_through_open(self):
+        for seq in range(3000):
+            self.publisher.publish(self.topic, b'bytes data', user_id='u1', seq=str(seq))
+        lanes = OrderedDispatcher('user_id', lanes=4)
+        # the rate limiter holds each message for a moment before its lane, which reorders them on a pool of callback threads
+        self.subscription.open(callback=self.__on_received, lanes=lanes, rate_limit=RateLimiter(messages_per_second=50000, burst_messages=1))
+        deadline = time.time() + 10
+        while len(self.handled) < 3000 and time.time() < deadline:
+            time.sleep(0.01)
+        lanes.stop()
+        assert self.handled == list(range(3000))
+
+    def test_executor_not_supported(self):
+        with self.assertRaises(ValueError):
+            self.subscription.open(callback=self.__on_received, lanes=OrderedDispatcher('user_id'), scheduler=object())
@@ -0,0 +1,167 @@
+# coding=utf-8
+#
+import time
+import pytest
+import logging
+import unittest
+import threading
+import concurrent.futures
+
+from soocii_pubsub_lib import metrics, pubsub_client
+from soocii_pubsub_lib.limiter import TokenBucket, RateLimiter, AdaptiveConcurrency
+
+# ========== Initial Logger ==========
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='[%(asctime)-15s][%(levelname)-5s][%(filename)s][%(funcName)s#%(lineno)d] %(message)s')
+logger = logging.getLogger(__name__)
+# ====================================
+
+
+def ack(message):
+    return True
+
+
+class TokenBucketTests(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_burst(self):
+        bucket = TokenBucket(10, burst=5)
+        assert [bucket.reserve() for _ in range(5)] == [0.0] * 5
+        assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+
+    def test_acquire(self):
+        bucket = TokenBucket(100, burst=1)
+        start = time.time()
+        for _ in range(11):
+            bucket.acquire()
+        assert time.time() - start >= 0.09
+
+    def test_large_request(self):
+        # a request larger than burst waits for the tokens beyond burst at rate
+        bucket = TokenBucket(10, burst=5)
+        assert bucket.reserve(100) == pytest.approx((100 - 5) / 10.0, abs=0.01)
+
+    def test_rate_limiter(self):
+        with pytest.raises(ValueError):
+            RateLimiter()
+        limiter = RateLimiter(messages_per_second=1000, bytes_per_second=100, burst_bytes=100)
+        assert limiter.acquire(1, 100) == 0.0
+        assert limiter.acquire(1, 10) == pytest.approx(0.1, abs=0.01)
+
+
+class AdaptiveConcurrencyTests(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_increase(self):
+        concurrency = AdaptiveConcurrency(initial_limit=2, window=2, target_latency=1)
+        for _ in range(4):
+            concurrency.acquire()
+            concurrency.release(0.01)
+        assert concurrency.limit == 4
+
+    def test_decrease(self):
+        concurrency = AdaptiveConcurrency(initial_limit=10, min_limit=4, window=2, target_latency=1, decrease=0.5)
+        for latency, failed in ((2, False), (2, False), (0.01, True), (0.01, False)):
+            concurrency.acquire()
+            concurrency.release(latency, failed)
+        assert concurrency.limit == 4
+
+    def test_block(self):
+        concurrency = AdaptiveConcurrency(initial_limit=1)
+        concurrency.acquire()
+        acquired = threading.Event()
+        thread = threading.Thread(target=lambda: concurrency.acquire() or acquired.set())
+        thread.start()
+        assert not acquired.wait(0.1)
+        concurrency.release(0.01)
+        assert acquired.wait(1)
+        thread.join()
+
+    def test_track(self):
+        concurrency = AdaptiveConcurrency(initial_limit=2, window=1, max_error_rate=0)
+        settled = []
+        concurrency.track(settled.append)([True, 'nack'])
+        assert settled == [[True, 'nack']]
+        assert concurrency.inflight == 0
+        assert concurrency.limit == pytest.approx(1.4)
+
+
+@pytest.mark.usefixtures("memory_broker")
+class LimitedSubscribeTests(unittest.TestCase):
+    def setUp(self):
+        self.project = 'fake-project'
+        self.cred = None
+        self.topic = 'fake-topic'
+        self.publisher = pubsub_client.PublisherClient(self.project, self.cred, transport=self.broker)
+        self.publisher.create_topic(self.topic)
+        self.subscription = pubsub_client.SubscribeClient(self.project, self.cred, transport=self.broker)
+        self.subscription.create_subscription(self.topic, 'fake-subscription')
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+        self.received = []
+
+    def tearDown(self):
+        self.subscription.close()
+
+    def __on_received(self, message):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(0.02)
+        with self.lock:
+            self.running -= 1
+            self.received.append(time.time())
+        return True
+
+    def __wait(self, count, timeout=5):
+        deadline = time.time() + timeout
+        while len(self.received) < count and time.time() < deadline:
+            time.sleep(0.01)
+        return len(self.received)
+
+    def test_rate_limit(self):
+        self.publisher.publish_many(self.topic, [b'bytes data'] * 10)
+        start = time.time()
+        self.subscription.open(callback=self.__on_received, rate_limit=RateLimiter(messages_per_second=50, burst_messages=1))
+        assert self.__wait(10) == 10
+        assert max(self.received) - start >= 0.15
+
+    def test_concurrency(self):
+        self.publisher.publish_many(self.topic, [b'bytes data'] * 20)
+        concurrency = AdaptiveConcurrency(initial_limit=2, max_limit=2)
+        self.subscription.open(callback=self.__on_received, concurrency=concurrency)
+        assert self.__wait(20) == 20
+        assert self.peak <= 2
+        deadline = time.time() + 1
+        while concurrency.inflight > 0 and time.time() < deadline:
+            time.sleep(0.01)
+        assert concurrency.inflight == 0
+
+    def test_release_on_failed_handoff(self):
+        self.publisher.publish_many(self.topic, [b'bytes data'] * 3)
+        # submit() of a closed pool raises, the slot is released and the message is nack
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=1)
+        pool.shutdown()
+        registry = metrics.Registry()
+        concurrency = AdaptiveConcurrency(initial_limit=1, max_limit=1)
+        self.subscription.open(callback=ack, process_pool=pool, concurrency=concurrency, metrics=registry)
+        nacks = registry.get('pubsub_nacked_messages_total')
+        deadline = time.time() + 2
+        while nacks.get((self.subscription.subscription_name,)) < 5 and time.time() < deadline:
+            time.sleep(0.01)
+        assert nacks.get((self.subscription.subscription_name,)) >= 5
+        self.subscription.close()
+        deadline = time.time() + 1
+        while concurrency.inflight > 0 and time.time() < deadline:
+            time.sleep(0.01)
+        assert concurrency.inflight == 0
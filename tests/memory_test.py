@@ -0,0 +1,107 @@
+# coding=utf-8
+#
+import time
+import pytest
+import logging
+import unittest
+import threading
+
+from google.api_core.exceptions import NotFound
+from soocii_pubsub_lib import pubsub_client, sub_service
+from tests.conftest import wait_for
+
+# ========== Initial Logger ==========
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='[%(asctime)-15s][%(levelname)-5s][%(filename)s][%(funcName)s#%(lineno)d] %(message)s')
+logger = logging.getLogger(__name__)
+# ====================================
+
+
+def ack_in_worker(message):
+    # runs in a worker process, so it has to be a module level function
+    return message['data'] == b'bytes data'
+
+
+@pytest.mark.usefixtures("memory_broker")
+class MemoryBrokerTests(unittest.TestCase):
+    def setUp(self):
+        self.project = 'fake-project'
+        self.cred = None
+        self.topic = 'fake-topic'
+        self.lock = threading.Lock()
+        self.received_messages = []
+        self.publisher = pubsub_client.PublisherClient(self.project, self.cred, transport=self.broker)
+        self.publisher.create_topic(self.topic)
+        self.subscription = pubsub_client.SubscribeClient(self.project, self.cred, transport=self.broker)
+        self.subscription.create_subscription(self.topic, 'fake-subscription', ack_deadline_seconds=1)
+
+    def tearDown(self):
+        self.subscription.close()
+
+    def __on_received(self, message, ack=True):
+        with self.lock:
+            self.received_messages.append(message)
+        return ack
+
+    def test_publish_and_subscribe(self):
+        message_id, _ = self.publisher.publish(self.topic, b'bytes data', addition1='test1')
+        self.subscription.open(callback=lambda message: self.__on_received(message))
+        assert wait_for(lambda: len(self.received_messages) == 1)
+        assert self.received_messages[0]['message_id'] == message_id
+        assert self.received_messages[0]['data'] == b'bytes data'
+        assert self.received_messages[0]['attributes'] == {'addition1': 'test1'}
+
+    def test_fan_out(self):
+        other = pubsub_client.SubscribeClient(self.project, self.cred, transport=self.broker)
+        other.create_subscription(self.topic, 'other-subscription')
+        other_messages = []
+        self.publisher.publish(self.topic, b'bytes data')
+        self.subscription.open(callback=lambda message: self.__on_received(message))
+        other.open(callback=lambda message: other_messages.append(message) or True)
+        assert wait_for(lambda: len(self.received_messages) == 1 and len(other_messages) == 1)
+        other.close()
+
+    def test_redelivery_after_ack_deadline(self):
+        self.publisher.publish(self.topic, b'bytes data')
+        # not ack in the first channel
+        self.subscription.open(callback=lambda message: self.__on_received(message, ack=False))
+        assert wait_for(lambda: len(self.received_messages) == 1)
+        self.subscription.close()
+        self.subscription.open(callback=lambda message: self.__on_received(message))
+        assert wait_for(lambda: len(self.received_messages) == 2, timeout=3)
+        assert self.received_messages[0]['message_id'] == self.received_messages[1]['message_id']
+
+    def test_flow_control(self):
+        self.publisher.publish_many(self.topic, [b'bytes data'] * 5)
+        # messages are never ack, so only max_messages are delivered
+        self.subscription.open(callback=lambda message: self.__on_received(message, ack=None), max_messages=2)
+        time.sleep(0.3)
+        assert len(self.received_messages) == 2
+
+    def test_publish_to_non_exist_topic(self):
+        with self.assertRaises(NotFound):
+            self.publisher.publish('non-exist-topic', b'bytes data')
+
+    def test_subscribe_non_exist_topic(self):
+        with self.assertRaises(NotFound):
+            self.subscription.create_subscription('non-exist-topic', 'fake-subscription')
+
+    def test_subscription_service(self):
+        self.publisher.publish_many(self.topic, [b'bytes data'] * 5)
+        service = sub_service.SubscriptionService(self.subscription)
+        thread = threading.Thread(target=lambda: service.run(callback=lambda message: self.__on_received(message)))
+        thread.start()
+        assert wait_for(lambda: len(self.received_messages) == 5)
+        service.shutdown()
+        thread.join()
+
+    def test_subscription_service_processes(self):
+        self.publisher.publish_many(self.topic, [b'bytes data'] * 5)
+        service = sub_service.SubscriptionService(self.subscription)
+        thread = threading.Thread(target=lambda: service.run(callback=ack_in_worker, processes=2))
+        thread.start()
+        subscription = self.broker.get_subscription(self.subscription.subscription_name)
+        assert wait_for(lambda: not subscription.pending and not subscription.outstanding, timeout=10)
+        service.shutdown()
+        thread.join()
@@ -0,0 +1,59 @@
+# coding=utf-8
+#
+import pickle
+import logging
+import unittest
+
+from google.cloud import pubsub_v1
+from soocii_pubsub_lib import codec
+from soocii_pubsub_lib.message import Message, to_dict
+
+# ========== Initial Logger ==========
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='[%(asctime)-15s][%(levelname)-5s][%(filename)s][%(funcName)s#%(lineno)d] %(message)s')
+logger = logging.getLogger(__name__)
+# ====================================
+
+
+class MessageViewTests(unittest.TestCase):
+    def setUp(self):
+        self.message = pubsub_v1.types.PubsubMessage(data=b'bytes data', message_id='1', attributes={'addition1': 'test1'})
+
+    def tearDown(self):
+        pass
+
+    def test_compatible_with_dict(self):
+        view = Message(self.message)
+        assert dict(view) == to_dict(self.message)
+        assert view['data'] == b'bytes data'
+        assert view['attributes'] == {'addition1': 'test1'}
+        assert view.get('unknown') is None
+        with self.assertRaises(KeyError):
+            view['unknown']
+
+    def test_zero_copy_data(self):
+        view = Message(self.message)
+        assert isinstance(view.data, memoryview)
+        assert view.data[:5] == b'bytes'
+
+    def test_lazy_attributes(self):
+        view = Message(self.message)
+        assert view._attributes is None
+        assert view.attributes is view.attributes
+
+    def test_no_instance_dict(self):
+        view = Message(self.message)
+        with self.assertRaises(AttributeError):
+            view.extra = 1
+
+    def test_pickled_as_dict(self):
+        copied = pickle.loads(pickle.dumps(Message(self.message)))
+        assert type(copied) is dict
+        assert copied == to_dict(self.message)
+
+    def test_decode_data(self):
+        data, attributes = codec.PayloadEncoder('json', compress_threshold=0).encode({'event': 'created'}, {})
+        message = pubsub_v1.types.PubsubMessage(data=data, message_id='2', attributes=attributes)
+        assert Message(message)['data'] == {'event': 'created'}
+        assert to_dict(message)['data'] == {'event': 'created'}
@@ -0,0 +1,115 @@
+# coding=utf-8
+#
+import time
+import pytest
+import logging
+import unittest
+import datetime
+import concurrent.futures
+
+from soocii_pubsub_lib import metrics, pubsub_client
+from soocii_pubsub_lib.limiter import RateLimiter
+
+# ========== Initial Logger ==========
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='[%(asctime)-15s][%(levelname)-5s][%(filename)s][%(funcName)s#%(lineno)d] %(message)s')
+logger = logging.getLogger(__name__)
+# ====================================
+
+
+class RecordingSink():
+    def __init__(self):
+        self.observed = []
+
+    def observe(self, name, labels, value):
+        self.observed.append((name, labels, value))
+
+
+class RegistryTests(unittest.TestCase):
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def tearDown(self):
+        pass
+
+    def test_counter(self):
+        counter = self.registry.counter('messages_total', 'Messages.', ('topic',))
+        counter.inc(labels=('t1',))
+        counter.inc(2, ('t1',))
+        assert counter.get(('t1',)) == 3
+        assert 'messages_total{topic="t1"} 3' in self.registry.render()
+
+    def test_gauge(self):
+        gauge = self.registry.gauge('inflight', 'In flight.')
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+        assert gauge.get() == 1
+
+    def test_histogram(self):
+        histogram = self.registry.histogram('latency_seconds', 'Latency.', buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value)
+        text = self.registry.render()
+        assert 'latency_seconds_bucket{le="0.1"} 1' in text
+        assert 'latency_seconds_bucket{le="1.0"} 2' in text
+        assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+        assert 'latency_seconds_count 3' in text
+        assert 'latency_seconds_sum 5.55' in text
+
+    def test_register_twice(self):
+        assert self.registry.counter('messages_total', 'Messages.') is self.registry.counter('messages_total', 'Messages.')
+        with self.assertRaises(ValueError):
+            self.registry.gauge('messages_total', 'Messages.')
+
+    def test_sink(self):
+        sink = RecordingSink()
+        registry = metrics.Registry(sink=sink)
+        registry.counter('messages_total', 'Messages.', ('topic',)).inc(labels=('t1',))
+        assert sink.observed == [('messages_total', {'topic': 't1'}, 1)]
+
+    def test_publisher_metrics(self):
+        publisher = metrics.PublisherMetrics(self.registry)
+        future = concurrent.futures.Future()
+        future.set_result('1')
+        publisher.published('t1', 10, 0, future)
+        future = concurrent.futures.Future()
+        future.set_exception(RuntimeError('publish failed'))
+        publisher.published('t1', 10, 0, future)
+        assert publisher.messages.get(('t1',)) == 1
+        assert publisher.bytes.get(('t1',)) == 10
+        assert publisher.errors.get(('t1',)) == 1
+
+    def test_to_timestamp(self):
+        dt = datetime.datetime(2018, 1, 1)
+        assert metrics.to_timestamp(dt) == 1514764800
+
+
+@pytest.mark.usefixtures("memory_broker")
+class SubscriberMetricsTests(unittest.TestCase):
+    def setUp(self):
+        self.project = 'fake-project'
+        self.cred = None
+        self.topic = 'fake-topic'
+        self.registry = metrics.Registry()
+        self.publisher = pubsub_client.PublisherClient(self.project, self.cred, transport=self.broker)
+        self.publisher.create_topic(self.topic)
+        self.subscription = pubsub_client.SubscribeClient(self.project, self.cred, transport=self.broker)
+        self.subscription.create_subscription(self.topic, 'fake-subscription')
+
+    def tearDown(self):
+        self.subscription.close()
+
+    def test_callback_duration_excludes_queueing(self):
+        self.publisher.publish_many(self.topic, [b'bytes data'] * 3)
+        # the messages wait for the rate limiter about 0.2 seconds before the callback
+        self.subscription.open(callback=lambda message: True, metrics=self.registry,
+                               rate_limit=RateLimiter(messages_per_second=10, burst_messages=1))
+        acks = self.registry.get('pubsub_acked_messages_total')
+        deadline = time.time() + 2
+        while acks.get((self.subscription.subscription_name,)) < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        assert acks.get((self.subscription.subscription_name,)) == 3
+        total = [line for line in self.registry.render().splitlines() if line.startswith('pubsub_callback_duration_seconds_sum')]
+        assert float(total[0].split()[-1]) < 0.1
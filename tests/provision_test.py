@@ -0,0 +1,106 @@
+# coding=utf-8
+#
+import os
+import sys
+import json
+import time
+import pytest
+import shutil
+import logging
+import tempfile
+import unittest
+
+from google.api_core.exceptions import NotFound
+from soocii_pubsub_lib.provision import ResourceCache, ensure_resources, load_manifest
+
+# ========== Initial Logger ==========
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='[%(asctime)-15s][%(levelname)-5s][%(filename)s][%(funcName)s#%(lineno)d] %(message)s')
+logger = logging.getLogger(__name__)
+# ====================================
+
+
+@pytest.mark.usefixtures("memory_broker")
+class EnsureResourcesTests(unittest.TestCase):
+    def setUp(self):
+        self.project = 'fake-project'
+        self.directory = tempfile.mkdtemp()
+        self.manifest = {
+            'topics': ['topic-a', {'name': 'topic-b'}],
+            'subscriptions': [
+                {'name': 'sub-a', 'topic': 'topic-a', 'ack_deadline_seconds': 30},
+                {'name': 'sub-b', 'topic': 'topic-b'},
+            ],
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_concurrent_subscriptions(self):
+        manifest = {
+            'topics': ['topic-{}'.format(i) for i in range(200)],
+            'subscriptions': [{'name': 'sub-{}'.format(i), 'topic': 'topic-{}'.format(i)} for i in range(200)],
+        }
+        # switch threads as often as possible to expose a shared state between the requests, python 3 only
+        interval = getattr(sys, 'getswitchinterval', lambda: None)()
+        if interval is not None:
+            sys.setswitchinterval(1e-6)
+        try:
+            result = ensure_resources(manifest, self.project, transport=self.broker, max_workers=8)
+        finally:
+            if interval is not None:
+                sys.setswitchinterval(interval)
+        assert len(result['created']) == 400
+        for i in range(200):
+            subscription = self.broker.get_subscription('projects/fake-project/subscriptions/sub-{}'.format(i))
+            assert subscription.topic == 'projects/fake-project/topics/topic-{}'.format(i)
+
+    def test_load_manifest(self):
+        path = os.path.join(self.directory, 'manifest.json')
+        with open(path, 'w') as f:
+            json.dump(self.manifest, f)
+        topics, subscriptions = load_manifest(path)
+        assert topics == [{'name': 'topic-a'}, {'name': 'topic-b'}]
+        assert subscriptions[0] == {'name': 'sub-a', 'topic': 'topic-a', 'ack_deadline_seconds': 30}
+
+        with pytest.raises(ValueError):
+            load_manifest({'subscriptions': [{'name': 'sub-a'}]})
+
+    def test_create_and_exist(self):
+        result = ensure_resources(self.manifest, self.project, transport=self.broker)
+        assert sorted(result['created']) == [
+            'projects/fake-project/subscriptions/sub-a',
+            'projects/fake-project/subscriptions/sub-b',
+            'projects/fake-project/topics/topic-a',
+            'projects/fake-project/topics/topic-b',
+        ]
+        assert self.broker.get_subscription('projects/fake-project/subscriptions/sub-a').ack_deadline_seconds == 30
+
+        result = ensure_resources(self.manifest, self.project, transport=self.broker)
+        assert result['created'] == []
+        assert len(result['existing']) == 4
+
+    def test_cache(self):
+        path = os.path.join(self.directory, 'resources.json')
+        ensure_resources(self.manifest, self.project, transport=self.broker, cache=ResourceCache(path))
+
+        # a warm restart skips the admin API
+        result = ensure_resources(self.manifest, self.project, transport=self.broker, cache=ResourceCache(path))
+        assert len(result['cached']) == 4
+        assert result['created'] == result['existing'] == []
+
+        # confirm again after ttl
+        cache = ResourceCache(path, ttl=0.1)
+        time.sleep(0.1)
+        result = ensure_resources(self.manifest, self.project, transport=self.broker, cache=cache)
+        assert len(result['existing']) == 4
+
+    def test_missing_topic(self):
+        cache = ResourceCache()
+        manifest = {'topics': ['topic-a'], 'subscriptions': [{'name': 'sub-c', 'topic': 'topic-c'}]}
+        with pytest.raises(NotFound):
+            ensure_resources(manifest, self.project, transport=self.broker, cache=cache)
+        # the confirmed topic is cached anyway
+        assert cache.fresh('projects/fake-project/topics/topic-a')
+        assert not cache.fresh('projects/fake-project/subscriptions/sub-c')
@@ -1,13 +1,18 @@
 # coding=utf-8
 #
+import os
+import sys
 import time
 import pytest
 import logging
 import unittest
+import subprocess
+import concurrent.futures
 
 from google.api_core.exceptions import ServiceUnavailable
 from google.api_core.exceptions import NotFound
 from soocii_pubsub_lib import pubsub_client
+from tests.conftest import wait_for
 
 # ========== Initial Logger ==========
 logging.basicConfig(
@@ -89,6 +94,61 @@ class NormalPublishTests(unittest.TestCase):
         assert message_id is not None
 
 
+# batch publish
+@pytest.mark.usefixtures("start_emulator")
+class BatchPublishTests(unittest.TestCase):
+    def setUp(self):
+        self.project = 'fake-project'
+        self.cred = None
+        self.topic = 'fake-topic'
+        self.published_message_ids = []
+
+    def tearDown(self):
+        pass
+
+    def __on_published(self, message_id):
+        self.published_message_ids.append(message_id)
+
+    def test_publish_many_and_flush(self):
+        # prepare publisher with small batches
+        publisher = pubsub_client.PublisherClient(self.project, self.cred, max_messages=10, max_latency=0.05)
+        publisher.create_topic(self.topic)
+        # publish a bulk of messages, and wait once at the end
+        payloads = [b'bytes data'] * 100
+        futures = publisher.publish_many(self.topic, payloads, attributes={'addition1': 'test1'},
+                                         callback=lambda message_id: self.__on_published(message_id))
+        assert publisher.flush(timeout=10) is True
+        # verify if all messages have been published
+        assert len(futures) == 100
+        assert all(future.result() is not None for future in futures)
+        assert len(self.published_message_ids) == 100
+
+    def test_publish_many_with_mismatched_attributes(self):
+        publisher = pubsub_client.PublisherClient(self.project, self.cred)
+        with self.assertRaises(ValueError):
+            publisher.publish_many(self.topic, [b'bytes data'] * 2, attributes=[{}])
+
+    def test_publish_many_unsupported_data_type(self):
+        publisher = pubsub_client.PublisherClient(self.project, self.cred)
+        with self.assertRaises(ValueError):
+            publisher.publish_many(self.topic, [b'bytes data', 12345])
+
+    def test_flush_without_pending_message(self):
+        publisher = pubsub_client.PublisherClient(self.project, self.cred)
+        assert publisher.flush(timeout=0) is True
+
+    def test_topic_publisher(self):
+        # prepare publisher
+        publisher = pubsub_client.PublisherClient(self.project, self.cred)
+        publisher.create_topic(self.topic)
+        # publish through the bound topic
+        topic = publisher.topic(self.topic)
+        assert topic.path == 'projects/fake-project/topics/fake-topic'
+        futures = [topic.publish(b'bytes data', addition1='test1') for _ in range(10)]
+        assert publisher.flush(timeout=10) is True
+        assert all(future.result() is not None for future in futures)
+
+
 # normal subscribe
 @pytest.mark.usefixtures("start_emulator")
 class NormalSubscribeTests(unittest.TestCase):
@@ -171,6 +231,67 @@ class NormalSubscribeTests(unittest.TestCase):
         assert self.received_message['attributes']['addition1'] == 'test1'
         assert self.received_message['attributes']['addition2'] == 'test2'
 
+    def test_subscribe_with_flow_control(self):
+        # prepare publisher
+        publisher = pubsub_client.PublisherClient(self.project, self.cred)
+        publisher.create_topic(self.topic)
+        # prepare subscriber
+        self.subscription = pubsub_client.SubscribeClient(self.project, self.cred)
+        self.subscription.create_subscription(self.topic, 'fake-subscription')
+        # publish bytes
+        publisher.publish(self.topic, b'bytes data', callback=lambda message_id: self.__on_published(message_id))
+        # open subscription channel with flow control and a dedicated executor
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        self.future = self.subscription.open(callback=lambda message: self.__on_received(message),
+                                             max_messages=1, max_bytes=1024, max_lease_duration=60, executor=executor)
+        # wait for callback
+        time.sleep(1)
+        # verify if message has been received
+        assert self.received_message is not None
+        assert self.published_message_id == self.received_message['message_id']
+
+    def test_subscribe_in_batch_mode(self):
+        # prepare publisher
+        publisher = pubsub_client.PublisherClient(self.project, self.cred)
+        publisher.create_topic(self.topic)
+        # prepare subscriber
+        self.subscription = pubsub_client.SubscribeClient(self.project, self.cred)
+        self.subscription.create_subscription(self.topic, 'fake-subscription')
+        publisher.publish_many(self.topic, [b'bytes data'] * 10)
+        publisher.flush()
+        # open subscription channel in batch mode, ack every other message
+        batches = []
+
+        def on_batch(messages):
+            batches.append(messages)
+            return [i % 2 == 0 for i in range(len(messages))]
+        self.future = self.subscription.open(callback=on_batch, batch_size=5, batch_latency=0.5)
+        # wait for callback
+        time.sleep(2)
+        # verify if messages have been received in batches
+        assert sum(len(batch) for batch in batches) >= 10
+        assert all(len(batch) <= 5 for batch in batches)
+        assert batches[0][0]['data'] == b'bytes data'
+
+    def test_subscribe_message_with_codec(self):
+        # prepare publisher, which encodes payloads in json and compresses the large ones
+        publisher = pubsub_client.PublisherClient(self.project, self.cred, codec='json', compress_threshold=100)
+        publisher.create_topic(self.topic)
+        # prepare subscriber
+        self.subscription = pubsub_client.SubscribeClient(self.project, self.cred)
+        self.subscription.create_subscription(self.topic, 'fake-subscription')
+        # publish dict
+        payload = {'event': 'created', 'values': list(range(100))}
+        publisher.publish(self.topic, payload, callback=lambda message_id: self.__on_published(message_id), addition1='test1')
+        # open subscription channel, and start receiving message
+        self.future = self.subscription.open(callback=lambda message: self.__on_received(message))
+        # wait for callback
+        time.sleep(1)
+        # verify if message has been decoded
+        assert self.received_message is not None
+        assert self.received_message['data'] == payload
+        assert self.received_message['attributes']['addition1'] == 'test1'
+
     def test_subscribe_message_without_callback(self):
         # prepare publisher
         publisher = pubsub_client.PublisherClient(self.project, self.cred)
@@ -357,3 +478,186 @@ class NoEmulatorTests(unittest.TestCase):
         subscriber = pubsub_client.SubscribeClient(self.project, self.cred)
         with self.assertRaises(ServiceUnavailable):
             subscriber.create_subscription(self.topic, 'fake-subscription', retry=None)
+
+
+@pytest.mark.usefixtures("memory_broker")
+class NackTests(unittest.TestCase):
+    def setUp(self):
+        self.project = 'fake-project'
+        self.cred = None
+        self.topic = 'fake-topic'
+        self.received_messages = []
+        self.publisher = pubsub_client.PublisherClient(self.project, self.cred, transport=self.broker)
+        self.publisher.create_topic(self.topic)
+        self.subscription = pubsub_client.SubscribeClient(self.project, self.cred, transport=self.broker)
+        # redelivery in time proves the message is nack, rather than expired
+        self.subscription.create_subscription(self.topic, 'fake-subscription', ack_deadline_seconds=60)
+
+    def tearDown(self):
+        self.subscription.close()
+
+    def __on_received(self, message, first):
+        self.received_messages.append(message)
+        if len(self.received_messages) == 1:
+            return first()
+        return True
+
+    def __raise(self, error):
+        raise error
+
+    def test_return_nack(self):
+        self.publisher.publish(self.topic, b'bytes data')
+        self.subscription.open(callback=lambda message: self.__on_received(message, lambda: pubsub_client.NACK))
+        assert wait_for(lambda: len(self.received_messages) == 2)
+
+    def test_raise_nack(self):
+        self.publisher.publish(self.topic, b'bytes data')
+        self.subscription.open(callback=lambda message: self.__on_received(message, lambda: self.__raise(pubsub_client.NackError())))
+        assert wait_for(lambda: len(self.received_messages) == 2)
+
+    def test_nack_on_error(self):
+        self.publisher.publish(self.topic, b'bytes data')
+        self.subscription.open(callback=lambda message: self.__on_received(message, lambda: self.__raise(RuntimeError())), nack_on_error=True)
+        assert wait_for(lambda: len(self.received_messages) == 2)
+
+    def test_error_without_nack(self):
+        self.publisher.publish(self.topic, b'bytes data')
+        self.subscription.open(callback=lambda message: self.__on_received(message, lambda: self.__raise(RuntimeError())))
+        time.sleep(0.3)
+        assert len(self.received_messages) == 1
+
+    def test_nack_in_batch(self):
+        self.publisher.publish_many(self.topic, [b'1', b'2'])
+        batches = []
+
+        def on_batch(messages):
+            batches.append([message['data'] for message in messages])
+            return [True, pubsub_client.NACK] if len(batches) == 1 else True
+        self.subscription.open(callback=on_batch, batch_size=2, batch_latency=0.1)
+        assert wait_for(lambda: len(batches) == 2)
+        assert batches == [[b'1', b'2'], [b'2']]
+
+    def test_short_acks_in_batch(self):
+        self.publisher.publish_many(self.topic, [b'1', b'2', b'3'])
+        batches = []
+
+        def on_batch(messages):
+            batches.append([message['data'] for message in messages])
+            return [True] if len(batches) == 1 else True
+        self.subscription.open(callback=on_batch, batch_size=3, batch_latency=0.1)
+        # the messages without an ack are nack and redelivered
+        assert wait_for(lambda: len(batches) == 2)
+        assert batches[0] == [b'1', b'2', b'3'] and sorted(batches[1]) == [b'2', b'3']
+        assert wait_for(lambda: self.subscription.inflight() == 0)
+
+
+@pytest.mark.usefixtures("memory_broker")
+class PullTests(unittest.TestCase):
+    def setUp(self):
+        self.project = 'fake-project'
+        self.cred = None
+        self.topic = 'fake-topic'
+        self.publisher = pubsub_client.PublisherClient(self.project, self.cred, transport=self.broker)
+        self.publisher.create_topic(self.topic)
+        self.subscription = pubsub_client.SubscribeClient(self.project, self.cred, transport=self.broker)
+        self.subscription.create_subscription(self.topic, 'fake-subscription', ack_deadline_seconds=1)
+
+    def tearDown(self):
+        pass
+
+    def test_pull_and_acknowledge(self):
+        self.publisher.publish_many(self.topic, [b'1', b'2', b'3'], attributes={'event': 'created'})
+        messages = self.subscription.pull(max_messages=2, timeout=1)
+        assert [message['data'] for message in messages] == [b'1', b'2']
+        assert messages[0]['attributes'] == {'event': 'created'}
+        self.subscription.acknowledge(message['ack_id'] for message in messages)
+
+        messages = self.subscription.pull(max_messages=2, timeout=1)
+        assert [message['data'] for message in messages] == [b'3']
+        # not ack, redelivered after the ack deadline
+        assert self.subscription.pull(timeout=0.1) == []
+        time.sleep(1)
+        assert [message['data'] for message in self.subscription.pull(timeout=1)] == [b'3']
+
+    def test_drain_backlog(self):
+        payloads = [str(i).encode('utf-8') for i in range(250)]
+        self.publisher.publish_many(self.topic, payloads)
+        received = []
+        for batch in self.subscription.drain_backlog(max_messages=20, concurrency=4, timeout=0.2):
+            assert len(batch) <= 20
+            received.extend(message['data'] for message in batch)
+            self.subscription.acknowledge(message['ack_id'] for message in batch)
+        assert sorted(received) == sorted(payloads)
+        assert self.subscription.pull(timeout=0.1) == []
+
+
+@pytest.mark.usefixtures("memory_broker")
+class ForkTests(unittest.TestCase):
+    def setUp(self):
+        self.project = 'fake-project'
+        self.cred = None
+        self.topic = 'fake-topic'
+
+    def tearDown(self):
+        pass
+
+    def test_shared_publisher(self):
+        publisher = pubsub_client.shared_publisher(self.project, transport=self.broker)
+        assert pubsub_client.shared_publisher(self.project, transport=self.broker) is publisher
+        assert pubsub_client.shared_publisher(self.project, transport=self.broker, max_messages=10) is not publisher
+        assert pubsub_client.shared_publisher('other-project', transport=self.broker) is not publisher
+
+    @pytest.mark.skipif(not hasattr(os, 'fork'), reason='fork is not supported')
+    def test_rebuild_client_after_fork(self):
+        publisher = pubsub_client.shared_publisher(self.project, transport=self.broker, max_outstanding_messages=10)
+        publisher.create_topic(self.topic)
+        client = publisher.client
+        pid = os.fork()
+        if pid == 0:
+            # child process, exit code tells the result
+            ok = False
+            try:
+                shared = pubsub_client.shared_publisher(self.project, transport=self.broker, max_outstanding_messages=10)
+                message_id, _ = shared.publish(self.topic, b'bytes data')
+                ok = shared is publisher and shared.client is not client and message_id is not None and shared.flush(timeout=1)
+            finally:
+                os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+        assert os.WEXITSTATUS(status) == 0
+        assert publisher.client is client
+
+
+@pytest.mark.usefixtures("memory_broker")
+class LazyClientTests(unittest.TestCase):
+    def setUp(self):
+        self.project = 'fake-project'
+        self.cred = None
+        self.topic = 'fake-topic'
+
+    def tearDown(self):
+        pass
+
+    def test_lazy_import(self):
+        code = 'import sys; from soocii_pubsub_lib import pubsub_client; sys.exit("google.cloud.pubsub_v1" in sys.modules)'
+        assert subprocess.call([sys.executable, '-c', code]) == 0
+
+    def test_create_client_on_first_use(self):
+        publisher = pubsub_client.PublisherClient(self.project, self.cred, transport=self.broker)
+        handle = publisher.topic(self.topic)
+        assert publisher._client is None
+        assert handle.path == 'projects/fake-project/topics/fake-topic'
+
+        publisher.create_topic(self.topic)
+        client = publisher._client
+        assert client is not None
+        handle.publish(b'bytes data').result()
+        assert publisher.client is client
+
+    def test_path_with_client(self):
+        # the call form of the previous versions
+        publisher = pubsub_client.PublisherClient(self.project, self.cred, transport=self.broker)
+        subscriber = pubsub_client.SubscribeClient(self.project, self.cred, transport=self.broker)
+        assert publisher.topic_path(publisher.client, self.topic) == publisher.topic_path(self.topic)
+        assert subscriber.subscription_path(subscriber.client, 'sub') == subscriber.subscription_path('sub') == 'projects/fake-project/subscriptions/sub'
+        with self.assertRaises(TypeError):
+            publisher.topic_path()
@@ -0,0 +1,112 @@
+# coding=utf-8
+#
+import pytest
+import logging
+import unittest
+
+from soocii_pubsub_lib import pubsub_client
+from soocii_pubsub_lib.retry import RetryPolicy
+from tests.conftest import wait_for
+
+# ========== Initial Logger ==========
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='[%(asctime)-15s][%(levelname)-5s][%(filename)s][%(funcName)s#%(lineno)d] %(message)s')
+logger = logging.getLogger(__name__)
+# ====================================
+
+
+class FakeMessage(object):
+    def __init__(self, message_id, delivery_attempt=None):
+        self.message_id = message_id
+        self.data = b'bytes data'
+        self.attributes = {'event': 'created'}
+        self.delivery_attempt = delivery_attempt
+        self.calls = []
+
+    def ack(self):
+        self.calls.append('ack')
+
+    def drop(self):
+        self.calls.append('drop')
+
+    def modify_ack_deadline(self, seconds):
+        self.calls.append(seconds)
+
+
+class RetryPolicyTests(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_backoff(self):
+        retry = RetryPolicy(backoff=1, max_backoff=5)
+        message = FakeMessage('1')
+        for expected in (1, 2, 4, 5, 5):
+            retry.failed(message, RuntimeError('failed'))
+            assert message.calls[-2:] == ['drop', expected]
+        assert retry.metrics.get('pubsub_callback_failures_total').get(('RuntimeError',)) == 5
+        assert retry.metrics.get('pubsub_retried_messages_total').get() == 5
+
+    def test_attempts(self):
+        retry = RetryPolicy(max_tracked=2)
+        assert retry.attempt(FakeMessage('1')) == 1
+        assert retry.attempt(FakeMessage('1')) == 2
+        # the delivery count of the subscription is used if it is larger
+        assert retry.attempt(FakeMessage('1', delivery_attempt=5)) == 5
+        retry.succeeded(FakeMessage('1'))
+        assert retry.attempt(FakeMessage('1')) == 1
+
+        retry.attempt(FakeMessage('2'))
+        retry.attempt(FakeMessage('3'))
+        # the least recently failed one is evicted
+        assert retry.attempt(FakeMessage('1')) == 1
+
+    def test_dead_letter_requires_publisher(self):
+        with pytest.raises(ValueError):
+            RetryPolicy(dead_letter_topic='dead-letter')
+
+
+@pytest.mark.usefixtures("memory_broker")
+class DeadLetterTests(unittest.TestCase):
+    def setUp(self):
+        self.project = 'fake-project'
+        self.cred = None
+        self.topic = 'fake-topic'
+        self.publisher = pubsub_client.PublisherClient(self.project, self.cred, transport=self.broker)
+        self.publisher.create_topic(self.topic)
+        self.publisher.create_topic('dead-letter')
+        self.subscription = pubsub_client.SubscribeClient(self.project, self.cred, transport=self.broker)
+        self.subscription.create_subscription(self.topic, 'fake-subscription')
+        self.dead_letters = pubsub_client.SubscribeClient(self.project, self.cred, transport=self.broker)
+        self.dead_letters.create_subscription('dead-letter', 'dead-letter-subscription')
+
+    def tearDown(self):
+        self.subscription.close()
+
+    def test_dead_letter(self):
+        attempts = []
+
+        def callback(message):
+            attempts.append(message['message_id'])
+            raise ValueError('poison message')
+
+        # no backoff, redelivered at once
+        retry = RetryPolicy(max_attempts=3, backoff=0, dead_letter_topic='dead-letter', publisher=self.publisher)
+        self.publisher.publish(self.topic, b'poison', event='created')
+        self.subscription.open(callback=callback, retry=retry)
+        assert wait_for(lambda: retry.metrics.get('pubsub_dead_lettered_messages_total').get(('ValueError',)) == 1)
+        assert len(attempts) == 3
+
+        messages = self.dead_letters.pull(timeout=1)
+        assert [message['data'] for message in messages] == [b'poison']
+        assert messages[0]['attributes'] == {
+            'event': 'created',
+            'dead_letter_reason': 'ValueError',
+            'dead_letter_attempts': '3',
+            'dead_letter_message_id': attempts[0],
+        }
+        # ack after dead-lettered
+        assert self.subscription.pull(timeout=0.1) == []
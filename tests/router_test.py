@@ -0,0 +1,112 @@
+# coding=utf-8
+#
+import time
+import pytest
+import logging
+import unittest
+
+from soocii_pubsub_lib import pubsub_client
+from soocii_pubsub_lib.router import Router
+
+# ========== Initial Logger ==========
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='[%(asctime)-15s][%(levelname)-5s][%(filename)s][%(funcName)s#%(lineno)d] %(message)s')
+logger = logging.getLogger(__name__)
+# ====================================
+
+
+def message_of(**attributes):
+    return {'message_id': '1', 'data': b'bytes data', 'attributes': attributes}
+
+
+class RouterTests(unittest.TestCase):
+    def setUp(self):
+        self.router = Router()
+        self.handled = []
+
+    def tearDown(self):
+        pass
+
+    def __handler(self, name, result=True):
+        def handler(message):
+            self.handled.append(name)
+            return result
+        handler.__name__ = name
+        return handler
+
+    def test_route_by_attribute(self):
+        self.router.route(event='created')(self.__handler('created'))
+        self.router.route(event='deleted')(self.__handler('deleted'))
+        assert self.router(message_of(event='deleted')) is True
+        assert self.router(message_of(event='created', source='web')) is True
+        assert self.handled == ['deleted', 'created']
+
+    def test_more_attributes_first(self):
+        self.router.route(event='created')(self.__handler('created'))
+        self.router.route(event='created', source='web')(self.__handler('created_by_web'))
+        self.router(message_of(event='created', source='web'))
+        self.router(message_of(event='created', source='app'))
+        assert self.handled == ['created_by_web', 'created']
+
+    def test_predicate(self):
+        self.router.route(event='created', predicate=lambda message: message['data'] == b'other')(self.__handler('other'))
+        self.router.route(event='created')(self.__handler('created'))
+        self.router(message_of(event='created'))
+        assert self.handled == ['created']
+
+    def test_unmatched(self):
+        assert self.router(message_of(event='unknown')) is True
+        assert Router(ack_unmatched=False)(message_of()) is False
+        assert self.router.metrics.get('pubsub_unmatched_messages_total').get() == 1
+
+        self.router.default(self.__handler('default', None))
+        assert self.router(message_of(event='unknown')) is None
+        assert self.handled == ['default']
+
+    def test_metrics(self):
+        @self.router.route(event='created', name='on-created')
+        def on_created(message):
+            raise RuntimeError('failed')
+
+        with pytest.raises(RuntimeError):
+            self.router(message_of(event='created'))
+        assert self.router.metrics.get('pubsub_routed_messages_total').get(('on-created',)) == 1
+        assert self.router.metrics.get('pubsub_route_errors_total').get(('on-created',)) == 1
+        assert self.router.metrics.get('pubsub_route_duration_seconds').get(('on-created',)) == 1
+
+    def test_invalid_route(self):
+        with pytest.raises(ValueError):
+            self.router.route()(self.__handler('all'))
+
+
+@pytest.mark.usefixtures("memory_broker")
+class RouterSubscribeTests(unittest.TestCase):
+    def setUp(self):
+        self.project = 'fake-project'
+        self.cred = None
+        self.topic = 'fake-topic'
+        self.publisher = pubsub_client.PublisherClient(self.project, self.cred, transport=self.broker)
+        self.publisher.create_topic(self.topic)
+        self.subscription = pubsub_client.SubscribeClient(self.project, self.cred, transport=self.broker)
+        self.subscription.create_subscription(self.topic, 'fake-subscription')
+
+    def tearDown(self):
+        self.subscription.close()
+
+    def test_open_with_router(self):
+        router = Router()
+        received = []
+
+        @router.route(event='created')
+        def on_created(message):
+            received.append(message['data'])
+            return True
+
+        self.publisher.publish(self.topic, b'1', event='created')
+        self.publisher.publish(self.topic, b'2', event='deleted')
+        self.subscription.open(callback=router)
+        deadline = time.time() + 2
+        while (not received or router.metrics.get('pubsub_unmatched_messages_total').get() < 1) and time.time() < deadline:
+            time.sleep(0.01)
+        assert received == [b'1']
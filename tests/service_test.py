@@ -10,6 +10,7 @@ import concurrent.futures
 
 from multiprocessing import Manager
 from soocii_pubsub_lib import pubsub_client, sub_service
+from tests.conftest import wait_for
 
 # ========== Initial Logger ==========
 logging.basicConfig(
@@ -19,6 +20,11 @@ logger = logging.getLogger(__name__)
 # ====================================
 
 
+def cpu_bound_callback(message):
+    # runs in a worker process, the message is ack as it returns True
+    return message['data'] == b'bytes data'
+
+
 # normal subscribe
 @pytest.mark.usefixtures("start_emulator")
 class NormalSubscribeTests(unittest.TestCase):
@@ -107,3 +113,131 @@ class NormalSubscribeTests(unittest.TestCase):
         assert self.received_message['data'] == b'bytes data'
         assert self.received_message['attributes'] == {}
         assert self.received_message_counts.value == 5
+
+
+# subscribe with worker processes
+@pytest.mark.usefixtures("start_emulator")
+class ProcessPoolSubscribeTests(unittest.TestCase):
+    def setUp(self):
+        self.project = 'fake-project'
+        self.cred = None
+        self.topic = 'fake-topic'
+        self.service = None
+
+    def tearDown(self):
+        pass
+
+    def __waitter(self):
+        # wait for callback
+        time.sleep(5)
+        self.service.shutdown()
+
+    def test_subscribe_message_in_worker_processes(self):
+        # prepare publisher
+        publisher = pubsub_client.PublisherClient(self.project, self.cred)
+        publisher.create_topic(self.topic)
+        # prepare subscriber
+        self.subscription = pubsub_client.SubscribeClient(self.project, self.cred)
+        self.subscription.create_subscription(self.topic, 'fake-subscription')
+        publisher.publish_many(self.topic, [b'bytes data'] * 10)
+        publisher.flush()
+
+        self.service = sub_service.SubscriptionService(self.subscription)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(lambda: self.__waitter())
+            # subscriber service MUST run in main thread
+            self.service.run(callback=cpu_bound_callback, processes=2)
+
+        # verify if all messages have been ack, nothing is delivered to a new channel
+        received = []
+        self.subscription.open(callback=lambda message: received.append(message))
+        time.sleep(1)
+        self.subscription.close()
+        assert received == []
+
+
+@pytest.mark.usefixtures("memory_broker")
+class DrainTests(unittest.TestCase):
+    def setUp(self):
+        self.project = 'fake-project'
+        self.cred = None
+        self.topic = 'fake-topic'
+        self.lock = threading.Lock()
+        self.started = []
+        self.finished = []
+        self.publisher = pubsub_client.PublisherClient(self.project, self.cred, transport=self.broker)
+        self.publisher.create_topic(self.topic)
+        self.subscription = pubsub_client.SubscribeClient(self.project, self.cred, transport=self.broker)
+        self.subscription.create_subscription(self.topic, 'fake-subscription', ack_deadline_seconds=60)
+
+    def tearDown(self):
+        self.subscription.close()
+
+    def __on_received(self, message, duration):
+        with self.lock:
+            self.started.append(message['message_id'])
+        time.sleep(duration)
+        with self.lock:
+            self.finished.append(message['message_id'])
+        return True
+
+    def __run(self, service, duration):
+        thread = threading.Thread(target=lambda: service.run(callback=lambda message: self.__on_received(message, duration), max_messages=3))
+        thread.start()
+        return thread
+
+    def test_drain_in_time(self):
+        self.publisher.publish_many(self.topic, [b'bytes data'] * 3)
+        service = sub_service.SubscriptionService(self.subscription, drain_timeout=5)
+        thread = self.__run(service, 0.3)
+        assert wait_for(lambda: len(self.started) == 3)
+        stats = service.shutdown()
+        thread.join()
+        assert stats['inflight'] == 3
+        assert stats['settled'] == 3
+        assert stats['nacked'] == 0
+        assert len(self.finished) == 3
+
+    def test_nack_on_drain_timeout(self):
+        self.publisher.publish_many(self.topic, [b'bytes data'] * 3)
+        service = sub_service.SubscriptionService(self.subscription)
+        thread = self.__run(service, 1)
+        assert wait_for(lambda: len(self.started) == 3)
+        stats = service.shutdown(timeout=0.1)
+        thread.join()
+        assert stats['inflight'] == 3
+        assert stats['nacked'] == 3
+        # unfinished messages are redelivered immediately, rather than after the ack deadline
+        other = pubsub_client.SubscribeClient(self.project, self.cred, transport=self.broker)
+        other.subscription_name = self.subscription.subscription_name
+        received = []
+        other.open(callback=lambda message: received.append(message) or True)
+        assert wait_for(lambda: len(received) == 3)
+        other.close()
+
+    def test_pause_pull_on_drain(self):
+        self.publisher.publish_many(self.topic, [b'bytes data'] * 40)
+        service = sub_service.SubscriptionService(self.subscription)
+        # the first message outlasts the others, whose slots are free during drain
+        callback = (lambda message: self.__on_received(message, 0.5 if not self.started else 0.05))
+        thread = threading.Thread(target=lambda: service.run(callback=callback, max_messages=3))
+        thread.start()
+        assert wait_for(lambda: len(self.started) >= 3)
+        stats = service.shutdown()
+        thread.join()
+        # the messages received during drain are held, which pauses the pull, rather than nack in a loop
+        assert stats['rejected'] <= 3
+        subscription = self.broker.get_subscription(self.subscription.subscription_name)
+        assert wait_for(lambda: len(subscription.pending) + len(set(self.finished)) == 40)
+
+    def test_nack_buffered_batch_on_close(self):
+        self.publisher.publish_many(self.topic, [b'bytes data'] * 3)
+        batches = []
+        self.subscription.open(callback=lambda messages: batches.append(messages) or True, batch_size=10, batch_latency=60)
+        assert wait_for(lambda: self.subscription.inflight() == 3)
+        self.subscription.close()
+        assert self.subscription.inflight() == 0
+        subscription = self.broker.get_subscription(self.subscription.subscription_name)
+        # redelivered immediately, rather than after the ack deadline
+        assert wait_for(lambda: len(subscription.pending) == 3)
+        assert batches == []
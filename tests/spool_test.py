@@ -0,0 +1,217 @@
+# coding=utf-8
+#
+import os
+import time
+import pytest
+import shutil
+import logging
+import tempfile
+import unittest
+import concurrent.futures
+
+from google.api_core.exceptions import NotFound, ServiceUnavailable
+
+from soocii_pubsub_lib import pubsub_client
+from soocii_pubsub_lib.spool import Spool, SpoolReplayer, SpoolFullError
+from tests.conftest import wait_for
+
+# ========== Initial Logger ==========
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='[%(asctime)-15s][%(levelname)-5s][%(filename)s][%(funcName)s#%(lineno)d] %(message)s')
+logger = logging.getLogger(__name__)
+# ====================================
+
+
+class SpoolTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_append_and_read(self):
+        spool = Spool(self.directory)
+        assert spool.pending() is False
+        spool.append('topic', b'1', {'event': 'created'})
+        spool.append('topic', b'2')
+        assert spool.pending() is True
+
+        records = spool.read()
+        assert [record for _, record in records] == [('topic', b'1', {'event': 'created'}), ('topic', b'2', {})]
+        # read does not move the offset
+        assert len(spool.read()) == 2
+
+        spool.commit(records[0][0])
+        assert [record[1] for _, record in spool.read()] == [b'2']
+        spool.commit(records[1][0])
+        assert spool.pending() is False
+        assert spool.read() == []
+
+    def test_segments(self):
+        spool = Spool(self.directory, segment_bytes=64)
+        for i in range(10):
+            spool.append('topic', str(i).encode('utf-8') * 20)
+        assert len([name for name in os.listdir(self.directory) if name.endswith('.seg')]) == 10
+
+        records = spool.read(max_records=5)
+        assert [record[1][:1] for _, record in records] == [b'0', b'1', b'2', b'3', b'4']
+        spool.commit(records[-1][0])
+        # segments read through are removed
+        assert len([name for name in os.listdir(self.directory) if name.endswith('.seg')]) == 6
+        assert len(spool.read()) == 5
+
+    def test_max_bytes(self):
+        spool = Spool(self.directory, segment_bytes=64, max_bytes=150)
+        spool.append('topic', b'1' * 50)
+        spool.append('topic', b'2' * 50)
+        with pytest.raises(SpoolFullError):
+            spool.append('topic', b'3' * 50)
+
+        # the space is reclaimed as a segment is read through
+        spool.commit(spool.read()[1][0])
+        spool.append('topic', b'3' * 50)
+
+    def test_reopen(self):
+        spool = Spool(self.directory)
+        for i in range(3):
+            spool.append('topic', str(i).encode('utf-8'))
+        spool.commit(spool.read()[0][0])
+        spool.close()
+
+        spool = Spool(self.directory)
+        assert [record[1] for _, record in spool.read()] == [b'1', b'2']
+
+    def test_truncate_torn_record(self):
+        spool = Spool(self.directory)
+        spool.append('topic', b'1')
+        spool.append('topic', b'2')
+        spool.close()
+        path = os.path.join(self.directory, sorted(os.listdir(self.directory))[0])
+        with open(path, 'r+b') as f:
+            f.truncate(os.path.getsize(path) - 1)
+
+        spool = Spool(self.directory)
+        assert [record[1] for _, record in spool.read()] == [b'1']
+        spool.append('topic', b'3')
+        assert [record[1] for _, record in spool.read()] == [b'1', b'3']
+
+    def test_replay(self):
+        spool = Spool(self.directory)
+        for i in range(3):
+            spool.append('topic', str(i).encode('utf-8'))
+        failures = [1]
+        sent = []
+
+        def send(topic, data, attributes):
+            future = concurrent.futures.Future()
+            if failures and data == b'1':
+                failures.pop()
+                future.set_exception(RuntimeError('unavailable'))
+            else:
+                sent.append(data)
+                future.set_result(data)
+            return future
+
+        replayer = SpoolReplayer(spool, send)
+        # commit the messages before the failed one, only the failed one is replayed again
+        assert replayer.replay() is False
+        assert replayer.replayed == 2
+        assert [record[1] for _, record in spool.read()] == [b'1', b'2']
+        assert replayer.replay() is True
+        assert sent == [b'0', b'2', b'1']
+        assert replayer.replayed == 3
+        assert spool.pending() is False
+
+    def test_reject_permanent_failure(self):
+        spool = Spool(self.directory)
+        quarantine = Spool(os.path.join(self.directory, 'quarantine'))
+        for i in range(3):
+            spool.append('topic', str(i).encode('utf-8'))
+        sent = []
+
+        def send(topic, data, attributes):
+            future = concurrent.futures.Future()
+            if data == b'0':
+                future.set_exception(NotFound('topic'))
+            else:
+                sent.append(data)
+                future.set_result(data)
+            return future
+
+        replayer = SpoolReplayer(spool, send, quarantine=quarantine)
+        # the permanent failure does not block the messages after it
+        assert replayer.replay() is True
+        assert sent == [b'1', b'2']
+        assert replayer.replayed == 2
+        assert replayer.rejected == 1
+        assert spool.pending() is False
+        assert [record[1] for _, record in quarantine.read()] == [b'0']
+
+
+@pytest.mark.usefixtures("memory_broker")
+class PublisherSpoolTests(unittest.TestCase):
+    def setUp(self):
+        self.project = 'fake-project'
+        self.cred = None
+        self.topic = 'fake-topic'
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def outage(self):
+        # every publish fails as the broker is unavailable, until the returned function is called
+        publish = self.broker.publish
+
+        def unavailable(topic, data, attributes):
+            raise ServiceUnavailable('broker is unavailable')
+        self.broker.publish = unavailable
+
+        def recover():
+            self.broker.publish = publish
+        return recover
+
+    def test_replay_after_outage(self):
+        spool = Spool(self.directory)
+        publisher = pubsub_client.PublisherClient(self.project, self.cred, transport=self.broker, spool=spool)
+        publisher.replayer.interval = 0.05
+        subscriber = pubsub_client.SubscribeClient(self.project, self.cred, transport=self.broker)
+        publisher.create_topic(self.topic)
+        subscriber.create_subscription(self.topic, 'fake-subscription')
+        recover = self.outage()
+        message_id, _ = publisher.publish(self.topic, b'1', event='created')
+        assert message_id is None
+        publisher.publish_many(self.topic, [b'2', b'3'])
+        assert wait_for(lambda: len(spool.read()) == 3)
+        time.sleep(0.2)
+        assert len(spool.read()) == 3
+
+        recover()
+        assert wait_for(lambda: not spool.pending())
+        assert publisher.replayer.replayed == 3
+        publisher.close()
+
+        subscription = self.broker.get_subscription(subscriber.subscription_path('fake-subscription'))
+        assert [entry[1] for entry in subscription.pending] == [b'1', b'2', b'3']
+        assert subscription.pending[0][2] == {'event': 'created'}
+
+    def test_missing_topic_does_not_block(self):
+        publisher = pubsub_client.PublisherClient(self.project, self.cred, transport=self.broker)
+        subscriber = pubsub_client.SubscribeClient(self.project, self.cred, transport=self.broker)
+        publisher.create_topic(self.topic)
+        subscriber.create_subscription(self.topic, 'fake-subscription')
+        spool = Spool(self.directory)
+        spool.append(publisher.topic_path('missing-topic'), b'1')
+        spool.append(publisher.topic_path(self.topic), b'2')
+
+        publisher = pubsub_client.PublisherClient(self.project, self.cred, transport=self.broker, spool=spool)
+        publisher.replayer.interval = 0.05
+        assert wait_for(lambda: not spool.pending())
+        time.sleep(0.2)
+        publisher.close()
+        assert publisher.replayer.rejected == 1
+
+        # the message after the rejected one is published exactly once
+        subscription = self.broker.get_subscription(subscriber.subscription_path('fake-subscription'))
+        assert [entry[1] for entry in subscription.pending] == [b'2']